@@ -1,10 +1,21 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.config import APP_NAME, API_PREFIX
 from app.routes import router
+from app.repos.clients import aclose_clients
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await aclose_clients()
+
 
 app = FastAPI(
     title=APP_NAME,
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # ---------------------------
@@ -12,6 +23,7 @@ app = FastAPI(
 # ---------------------------
 app.include_router(router)
 
+
 # ---------------------------
 # Health check (Render needs this)
 # ---------------------------
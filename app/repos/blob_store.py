@@ -0,0 +1,151 @@
+# app/repos/blob_store.py
+"""
+Key → bytes stores behind the content-hash caches (embedding_cache,
+ocr_cache):
+
+- redis → one key per blob   {prefix}{namespace}:{key}   (TTL)
+- disk  → one table in a local SQLite file (single host / dev)
+
+Also the SQLite connection helpers shared with chunk_store.
+"""
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.repos import clients
+from app.repos.redis_jobs import REDIS_PREFIX
+
+
+# -------------------------
+# SQLite helpers
+# -------------------------
+@contextmanager
+def sqlite_connect(path: str):
+    """
+    One connection per call, committed on success.
+    """
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def sqlite_init(path: str, *statements: str):
+    """
+    WAL mode (readers never wait for the writer) + schema.
+    """
+    with sqlite_connect(path) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        for statement in statements:
+            db.execute(statement)
+
+
+# -------------------------
+# Stores
+# -------------------------
+class RedisBlobStore:
+    def __init__(self, namespace: str, ttl: int):
+        self._namespace = namespace
+        self._ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{REDIS_PREFIX}{self._namespace}:{key}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return clients.redis_binary_client().mget([self._key(k) for k in keys])
+
+    def put_many(self, items: Dict[str, bytes]):
+        pipe = clients.redis_binary_client().pipeline(transaction=False)
+        for key, blob in items.items():
+            pipe.set(self._key(key), blob, ex=self._ttl)
+        pipe.execute()
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await clients.async_redis_binary_client().mget(
+            [self._key(k) for k in keys]
+        )
+
+    async def aput_many(self, items: Dict[str, bytes]):
+        pipe = clients.async_redis_binary_client().pipeline(transaction=False)
+        for key, blob in items.items():
+            pipe.set(self._key(key), blob, ex=self._ttl)
+        await pipe.execute()
+
+
+class SqliteBlobStore:
+    """
+    Table (key TEXT PRIMARY KEY, <column> BLOB). Writes are serialized
+    per process; reads run concurrently (WAL).
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, path: str, table: str, column: str):
+        self._path = path
+        self._table = table
+        self._column = column
+
+        with self._lock:
+            sqlite_init(
+                path,
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                f" key TEXT PRIMARY KEY,"
+                f" {column} BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        marks = ",".join("?" * len(keys))
+        with sqlite_connect(self._path) as db:
+            rows = dict(db.execute(
+                f"SELECT key, {self._column} FROM {self._table} WHERE key IN ({marks})",
+                keys
+            ).fetchall())
+        return [rows.get(k) for k in keys]
+
+    def put_many(self, items: Dict[str, bytes]):
+        with self._lock, sqlite_connect(self._path) as db:
+            db.executemany(
+                f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?)",
+                list(items.items())
+            )
+
+    async def aget_many(self, keys):
+        return await asyncio.to_thread(self.get_many, keys)
+
+    async def aput_many(self, items):
+        await asyncio.to_thread(self.put_many, items)
+
+
+_stores: Dict[tuple, object] = {}
+_stores_lock = threading.Lock()
+
+
+def shared_blob_store(
+    backend: str,
+    *,
+    namespace: str,
+    ttl: int,
+    path: str,
+    table: str,
+    column: str
+):
+    """
+    Process-wide store for a cache (created on first use), or None when
+    the backend is neither "redis" nor "disk".
+    """
+    if backend not in ("redis", "disk"):
+        return None
+
+    key = (backend, namespace) if backend == "redis" else (backend, path, table)
+
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = (
+                RedisBlobStore(namespace, ttl)
+                if backend == "redis"
+                else SqliteBlobStore(path, table, column)
+            )
+        return _stores[key]
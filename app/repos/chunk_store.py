@@ -0,0 +1,689 @@
+# app/repos/chunk_store.py
+"""
+Chunk text storage (RAG context). Vectors stay in Pinecone.
+
+Backends (CHUNK_STORE):
+- firestore → one document per chunk
+              conversations/{convId}/chunks/{chunkId}          (default)
+- packed    → chunks hashed into CHUNK_STORE_SHARDS shard documents,
+              each chunk zlib-compressed
+              conversations/{convId}/chunkShards/{shard}
+- redis     → one hash per conversation   {prefix}chunks:{convId}
+              (expires CHUNK_STORE_REDIS_TTL_SECONDS after the last
+              write or read)
+- sqlite    → local file (single host / dev)
+
+Reads are always batched (one multi-get per request).
+CHUNK_STORE_READ_FALLBACK names a second backend that serves chunks not
+found in the primary one (e.g. conversations not migrated yet).
+"""
+import asyncio
+import json
+import os
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from app.repos import clients
+from app.repos.blob_store import sqlite_connect, sqlite_init
+from app.repos.firestore_repo import FirestoreRepo, AsyncFirestoreRepo
+from app.repos.redis_jobs import REDIS_PREFIX
+
+CHUNK_STORE = os.getenv("CHUNK_STORE", "firestore")
+CHUNK_STORE_READ_FALLBACK = os.getenv("CHUNK_STORE_READ_FALLBACK")
+
+# ⚠️ Changing the shard count requires migrating packed conversations
+CHUNK_STORE_SHARDS = int(os.getenv("CHUNK_STORE_SHARDS", 64))
+CHUNK_STORE_SQLITE_PATH = os.getenv("CHUNK_STORE_SQLITE_PATH", "chunks.sqlite3")
+CHUNK_STORE_REDIS_TTL_SECONDS = int(os.getenv("CHUNK_STORE_REDIS_TTL_SECONDS", 90 * 24 * 3600))
+
+# Firestore limit per WriteBatch commit
+FIRESTORE_BATCH_LIMIT = 500
+
+# Firestore maximum document size (bytes); some headroom is kept for the
+# document name and field overhead
+FIRESTORE_DOC_LIMIT = 1024 * 1024
+FIRESTORE_DOC_HEADROOM = 4 * 1024
+
+# Background chunk commits in flight per ingest (ChunkWriter); at most
+# CHUNK_WRITE_QUEUE_PER_LANE more are queued before add() blocks
+CHUNK_WRITE_CONCURRENCY = int(os.getenv("CHUNK_WRITE_CONCURRENCY", 4))
+CHUNK_WRITE_QUEUE_PER_LANE = 1
+
+
+def chunk_record(chunk_id: str, text: str, metadata: Optional[Dict] = None) -> Dict:
+    return {"chunkId": chunk_id, "text": text, "metadata": metadata or {}}
+
+
+def _pack(record: Dict) -> bytes:
+    return zlib.compress(
+        json.dumps({"text": record["text"], "metadata": record["metadata"]}).encode()
+    )
+
+
+def _unpack(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob))
+
+
+def _unique(chunk_ids: List[Optional[str]]) -> List[str]:
+    return list(dict.fromkeys(cid for cid in chunk_ids if cid))
+
+
+# -------------------------------------------------
+# Interface
+# -------------------------------------------------
+class ChunkStore(ABC):
+    name = ""
+
+    def enabled(self) -> bool:
+        return True
+
+    def write_key(self, chunk_id: str) -> str:
+        """
+        Records sharing a write key land in the same document; ChunkWriter
+        never commits two of them concurrently.
+        """
+        return chunk_id
+
+    @abstractmethod
+    def put_many(self, conv_id: str, records: List[Dict]):
+        """
+        records: [{"chunkId", "text", "metadata"}]
+        """
+
+    @abstractmethod
+    def get_many(self, conv_id: str, chunk_ids: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        Texts aligned with chunk_ids (None when missing).
+        """
+
+    async def aget_many(
+        self,
+        conv_id: str,
+        chunk_ids: List[Optional[str]]
+    ) -> List[Optional[str]]:
+        return await asyncio.to_thread(self.get_many, conv_id, chunk_ids)
+
+    @abstractmethod
+    def iter_chunks(self, conv_id: str) -> Iterator[Dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, conv_id: str):
+        ...
+
+
+# -------------------------------------------------
+# Firestore: one document per chunk
+# -------------------------------------------------
+class FirestoreChunkStore(ChunkStore):
+    name = "firestore"
+
+    def __init__(self):
+        self._repo = FirestoreRepo()
+        self._db = clients.firestore_client()
+
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def _chunks(self, conv_id: str):
+        return (
+            self._db
+            .collection("conversations")
+            .document(conv_id)
+            .collection("chunks")
+        )
+
+    def put_many(self, conv_id: str, records: List[Dict]):
+        if not self._db:
+            return
+
+        chunks = self._chunks(conv_id)
+
+        for i in range(0, len(records), FIRESTORE_BATCH_LIMIT):
+            batch = self._db.batch()
+            for r in records[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(chunks.document(r["chunkId"]), {
+                    "text": r["text"],
+                    "metadata": r["metadata"],
+                })
+            batch.commit()
+
+    def get_many(self, conv_id, chunk_ids):
+        return self._repo.get_chunks(conv_id, chunk_ids)
+
+    async def aget_many(self, conv_id, chunk_ids):
+        return await AsyncFirestoreRepo().get_chunks(conv_id, chunk_ids)
+
+    def iter_chunks(self, conv_id: str) -> Iterator[Dict]:
+        if not self._db:
+            return
+
+        for doc in self._chunks(conv_id).stream():
+            data = doc.to_dict()
+            yield chunk_record(doc.id, data.get("text"), data.get("metadata"))
+
+    def delete(self, conv_id: str):
+        if not self._db:
+            return
+
+        refs = [doc.reference for doc in self._chunks(conv_id).stream()]
+
+        for i in range(0, len(refs), FIRESTORE_BATCH_LIMIT):
+            batch = self._db.batch()
+            for ref in refs[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.delete(ref)
+            batch.commit()
+
+
+# -------------------------------------------------
+# Firestore: packed shards (N compressed chunks / document)
+# -------------------------------------------------
+def shard_of(chunk_id: str) -> str:
+    return f"{zlib.crc32(chunk_id.encode()) % CHUNK_STORE_SHARDS:04d}"
+
+
+class PackedFirestoreChunkStore(ChunkStore):
+    """
+    Shard doc: {"chunks": {chunkId: zlib(json{text, metadata})}}
+    Writes merge into the shard map, so micro-batched ingest never
+    needs to read a shard first. The store keeps the size of every chunk
+    it wrote per shard and refuses a write that would push a shard past
+    the Firestore document limit (→ raise CHUNK_STORE_SHARDS).
+    """
+    name = "packed"
+
+    def __init__(self):
+        self._db = clients.firestore_client()
+        self._sizes: Dict[tuple, Dict[str, int]] = {}
+        self._sizes_lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def write_key(self, chunk_id: str) -> str:
+        return shard_of(chunk_id)
+
+    def _shards(self, db, conv_id: str):
+        return (
+            db
+            .collection("conversations")
+            .document(conv_id)
+            .collection("chunkShards")
+        )
+
+    def put_many(self, conv_id: str, records: List[Dict]):
+        if not self._db:
+            return
+
+        grouped: Dict[str, Dict[str, bytes]] = {}
+        for r in records:
+            grouped.setdefault(shard_of(r["chunkId"]), {})[r["chunkId"]] = _pack(r)
+
+        self._check_sizes(conv_id, grouped)
+
+        shards = self._shards(self._db, conv_id)
+        items = list(grouped.items())
+
+        for i in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            batch = self._db.batch()
+            for shard, packed in items[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(shards.document(shard), {"chunks": packed}, merge=True)
+            batch.commit()
+
+    def _check_sizes(self, conv_id: str, grouped: Dict[str, Dict[str, bytes]]):
+        """
+        Raises before committing anything if a shard would outgrow
+        FIRESTORE_DOC_LIMIT.
+        """
+        limit = FIRESTORE_DOC_LIMIT - FIRESTORE_DOC_HEADROOM
+
+        with self._sizes_lock:
+            updated = {}
+            for shard, packed in grouped.items():
+                sizes = dict(self._sizes.get((conv_id, shard), {}))
+                # Map entry: field name + NUL + bytes value
+                sizes.update({cid: len(cid) + 1 + len(blob) for cid, blob in packed.items()})
+
+                total = sum(sizes.values())
+                if total > limit:
+                    raise ValueError(
+                        f"chunk shard {shard} of {conv_id} would hold {total} bytes "
+                        f"(Firestore limit {FIRESTORE_DOC_LIMIT}); "
+                        f"raise CHUNK_STORE_SHARDS (currently {CHUNK_STORE_SHARDS})"
+                    )
+                updated[(conv_id, shard)] = sizes
+
+            self._sizes.update(updated)
+
+    @staticmethod
+    def _texts(docs, chunk_ids) -> List[Optional[str]]:
+        found = {}
+        wanted = set(chunk_ids)
+
+        for doc in docs:
+            if not doc.exists:
+                continue
+            for cid, blob in (doc.to_dict().get("chunks") or {}).items():
+                if cid in wanted:
+                    found[cid] = _unpack(blob)["text"]
+
+        return [found.get(cid) if cid else None for cid in chunk_ids]
+
+    def get_many(self, conv_id, chunk_ids):
+        if not self._db:
+            return [None] * len(chunk_ids)
+
+        shards = self._shards(self._db, conv_id)
+        refs = [
+            shards.document(s)
+            for s in dict.fromkeys(shard_of(cid) for cid in _unique(chunk_ids))
+        ]
+
+        docs = list(self._db.get_all(refs)) if refs else []
+        return self._texts(docs, chunk_ids)
+
+    async def aget_many(self, conv_id, chunk_ids):
+        db = clients.async_firestore_client()
+        if not db:
+            return [None] * len(chunk_ids)
+
+        shards = self._shards(db, conv_id)
+        refs = [
+            shards.document(s)
+            for s in dict.fromkeys(shard_of(cid) for cid in _unique(chunk_ids))
+        ]
+
+        docs = [doc async for doc in db.get_all(refs)] if refs else []
+        return self._texts(docs, chunk_ids)
+
+    def iter_chunks(self, conv_id: str) -> Iterator[Dict]:
+        if not self._db:
+            return
+
+        for doc in self._shards(self._db, conv_id).stream():
+            for cid, blob in (doc.to_dict().get("chunks") or {}).items():
+                data = _unpack(blob)
+                yield chunk_record(cid, data["text"], data["metadata"])
+
+    def delete(self, conv_id: str):
+        if not self._db:
+            return
+
+        batch = self._db.batch()
+        for doc in self._shards(self._db, conv_id).stream():
+            batch.delete(doc.reference)
+        batch.commit()
+
+        with self._sizes_lock:
+            for key in [k for k in self._sizes if k[0] == conv_id]:
+                del self._sizes[key]
+
+
+# -------------------------------------------------
+# Redis: one hash per conversation
+# -------------------------------------------------
+class RedisChunkStore(ChunkStore):
+    """
+    Every write and read refreshes the hash TTL, so only conversations
+    nobody asked about for CHUNK_STORE_REDIS_TTL_SECONDS expire.
+    """
+    name = "redis"
+
+    def _key(self, conv_id: str) -> str:
+        return f"{REDIS_PREFIX}chunks:{conv_id}"
+
+    def put_many(self, conv_id: str, records: List[Dict]):
+        if not records:
+            return
+
+        key = self._key(conv_id)
+        with clients.redis_client().pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={
+                r["chunkId"]: json.dumps({"text": r["text"], "metadata": r["metadata"]})
+                for r in records
+            })
+            pipe.expire(key, CHUNK_STORE_REDIS_TTL_SECONDS)
+            pipe.execute()
+
+    @staticmethod
+    def _texts(values, wanted, chunk_ids) -> List[Optional[str]]:
+        found = {
+            cid: json.loads(raw)["text"]
+            for cid, raw in zip(wanted, values) if raw
+        }
+        return [found.get(cid) if cid else None for cid in chunk_ids]
+
+    def get_many(self, conv_id, chunk_ids):
+        wanted = _unique(chunk_ids)
+        if not wanted:
+            return [None] * len(chunk_ids)
+
+        key = self._key(conv_id)
+        with clients.redis_client().pipeline(transaction=False) as pipe:
+            pipe.hmget(key, wanted)
+            pipe.expire(key, CHUNK_STORE_REDIS_TTL_SECONDS)
+            values, _ = pipe.execute()
+        return self._texts(values, wanted, chunk_ids)
+
+    async def aget_many(self, conv_id, chunk_ids):
+        wanted = _unique(chunk_ids)
+        if not wanted:
+            return [None] * len(chunk_ids)
+
+        key = self._key(conv_id)
+        async with clients.async_redis_client().pipeline(transaction=False) as pipe:
+            pipe.hmget(key, wanted)
+            pipe.expire(key, CHUNK_STORE_REDIS_TTL_SECONDS)
+            values, _ = await pipe.execute()
+        return self._texts(values, wanted, chunk_ids)
+
+    def iter_chunks(self, conv_id: str) -> Iterator[Dict]:
+        for cid, raw in clients.redis_client().hscan_iter(self._key(conv_id)):
+            data = json.loads(raw)
+            yield chunk_record(cid, data["text"], data["metadata"])
+
+    def delete(self, conv_id: str):
+        clients.redis_client().delete(self._key(conv_id))
+
+
+# -------------------------------------------------
+# SQLite: local file (single host / dev)
+# -------------------------------------------------
+class SqliteChunkStore(ChunkStore):
+    name = "sqlite"
+
+    _lock = threading.Lock()
+    _ready = set()
+
+    def __init__(self, path: str = CHUNK_STORE_SQLITE_PATH):
+        self._path = path
+
+        if path in self._ready:
+            return
+
+        with self._lock:
+            sqlite_init(
+                path,
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " conv_id TEXT NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " data BLOB NOT NULL,"
+                " PRIMARY KEY (conv_id, chunk_id))"
+            )
+        self._ready.add(path)
+
+    def _connect(self):
+        return sqlite_connect(self._path)
+
+    def put_many(self, conv_id: str, records: List[Dict]):
+        with self._lock, self._connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                [(conv_id, r["chunkId"], _pack(r)) for r in records]
+            )
+
+    def get_many(self, conv_id, chunk_ids):
+        wanted = _unique(chunk_ids)
+        if not wanted:
+            return [None] * len(chunk_ids)
+
+        marks = ",".join("?" * len(wanted))
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT chunk_id, data FROM chunks "
+                f"WHERE conv_id = ? AND chunk_id IN ({marks})",
+                [conv_id, *wanted]
+            ).fetchall()
+
+        found = {cid: _unpack(blob)["text"] for cid, blob in rows}
+        return [found.get(cid) if cid else None for cid in chunk_ids]
+
+    def iter_chunks(self, conv_id: str) -> Iterator[Dict]:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT chunk_id, data FROM chunks WHERE conv_id = ?",
+                [conv_id]
+            ).fetchall()
+
+        for cid, blob in rows:
+            data = _unpack(blob)
+            yield chunk_record(cid, data["text"], data["metadata"])
+
+    def delete(self, conv_id: str):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM chunks WHERE conv_id = ?", [conv_id])
+
+
+# -------------------------------------------------
+# Read fallback (during layout migrations)
+# -------------------------------------------------
+class FallbackChunkStore(ChunkStore):
+    """
+    Writes go to the primary store; chunks missing there are read
+    from the fallback store.
+    """
+
+    def __init__(self, primary: ChunkStore, fallback: ChunkStore):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def enabled(self) -> bool:
+        return self.primary.enabled()
+
+    def write_key(self, chunk_id):
+        return self.primary.write_key(chunk_id)
+
+    def put_many(self, conv_id, records):
+        self.primary.put_many(conv_id, records)
+
+    @staticmethod
+    def _missing(chunk_ids, texts) -> List[Optional[str]]:
+        return [cid if cid and text is None else None for cid, text in zip(chunk_ids, texts)]
+
+    def get_many(self, conv_id, chunk_ids):
+        texts = self.primary.get_many(conv_id, chunk_ids)
+        missing = self._missing(chunk_ids, texts)
+
+        if any(missing):
+            extra = self.fallback.get_many(conv_id, missing)
+            texts = [t if t is not None else e for t, e in zip(texts, extra)]
+        return texts
+
+    async def aget_many(self, conv_id, chunk_ids):
+        texts = await self.primary.aget_many(conv_id, chunk_ids)
+        missing = self._missing(chunk_ids, texts)
+
+        if any(missing):
+            extra = await self.fallback.aget_many(conv_id, missing)
+            texts = [t if t is not None else e for t, e in zip(texts, extra)]
+        return texts
+
+    def iter_chunks(self, conv_id):
+        return self.primary.iter_chunks(conv_id)
+
+    def delete(self, conv_id):
+        self.primary.delete(conv_id)
+
+
+# -------------------------------------------------
+# Write-behind (ingest)
+# -------------------------------------------------
+class ChunkWriter:
+    """
+    Commits chunk records in the background while the caller keeps
+    embedding. Records are spread over `concurrency` lanes by the
+    store's write key; every `batch_size` records of a lane become one
+    put_many (one WriteBatch commit on Firestore). A lane commits in
+    order, so a document (e.g. a packed shard) is never the target of
+    two commits at once. Once CHUNK_WRITE_QUEUE_PER_LANE commits per
+    lane are queued behind the running ones, the caller waits for the
+    oldest, so buffered records stay bounded.
+
+    flush() waits for every pending commit and re-raises the first
+    error, so callers flush before vectors become queryable.
+    """
+
+    def __init__(
+        self,
+        store: ChunkStore,
+        conv_id: str,
+        *,
+        batch_size: int = FIRESTORE_BATCH_LIMIT,
+        concurrency: int = CHUNK_WRITE_CONCURRENCY
+    ):
+        self._store = store
+        self._conv_id = conv_id
+        self._batch_size = batch_size
+        self._enabled = store.enabled()
+        self._lanes = max(1, concurrency)
+        self._pending: List[List[Dict]] = [[] for _ in range(self._lanes)]
+        self._futures = []
+        self._pools = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"chunk-writer-{lane}")
+            for lane in range(self._lanes)
+        ]
+
+    def _lane(self, chunk_id: str) -> int:
+        return zlib.crc32(self._store.write_key(chunk_id).encode()) % self._lanes
+
+    def add(self, records: List[Dict]):
+        if not self._enabled:
+            return
+
+        for r in records:
+            lane = self._lane(r["chunkId"])
+            self._pending[lane].append(r)
+
+            if len(self._pending[lane]) >= self._batch_size:
+                self._submit(lane)
+
+    def _submit(self, lane: int):
+        # Backpressure: wait on the oldest commit (re-raises its error)
+        while len(self._futures) >= self._lanes * (1 + CHUNK_WRITE_QUEUE_PER_LANE):
+            self._futures.pop(0).result()
+
+        batch, self._pending[lane] = self._pending[lane], []
+        self._futures.append(
+            self._pools[lane].submit(self._store.put_many, self._conv_id, batch)
+        )
+
+    def flush(self, wait: bool = True):
+        """
+        Commits buffered records. wait=False only starts the commits.
+        """
+        for lane in range(self._lanes):
+            if self._pending[lane]:
+                self._submit(lane)
+
+        if not wait:
+            return
+
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def _shutdown(self, cancel: bool = False):
+        for pool in self._pools:
+            pool.shutdown(wait=True, cancel_futures=cancel)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Job is failing anyway → drop queued commits
+            self._shutdown(cancel=True)
+        return False
+
+
+# -------------------------------------------------
+# Factory + migration
+# -------------------------------------------------
+_BACKENDS = {
+    "firestore": FirestoreChunkStore,
+    "packed": PackedFirestoreChunkStore,
+    "redis": RedisChunkStore,
+    "sqlite": SqliteChunkStore,
+}
+
+
+def get_chunk_store(name: Optional[str] = None) -> ChunkStore:
+    """
+    Returns the configured chunk store (CHUNK_STORE), or a named one.
+    """
+    if name is not None:
+        return _BACKENDS[name]()
+
+    store = _BACKENDS[CHUNK_STORE]()
+
+    if CHUNK_STORE_READ_FALLBACK and CHUNK_STORE_READ_FALLBACK != CHUNK_STORE:
+        return FallbackChunkStore(store, _BACKENDS[CHUNK_STORE_READ_FALLBACK]())
+    return store
+
+
+def migrate_conversation(
+    conv_id: str,
+    source: str,
+    target: str,
+    *,
+    delete_source: bool = False,
+    batch_size: int = FIRESTORE_BATCH_LIMIT
+) -> int:
+    """
+    Copies every chunk of a conversation from one layout to another.
+    Returns the number of chunks copied.
+    """
+    src = get_chunk_store(source)
+    dst = get_chunk_store(target)
+
+    copied = 0
+    batch: List[Dict] = []
+
+    for record in src.iter_chunks(conv_id):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            dst.put_many(conv_id, batch)
+            copied += len(batch)
+            batch = []
+
+    if batch:
+        dst.put_many(conv_id, batch)
+        copied += len(batch)
+
+    if delete_source:
+        src.delete(conv_id)
+
+    return copied
+
+
+if __name__ == "__main__":
+    # python -m app.repos.chunk_store firestore packed convA convB ...
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate chunk storage layout")
+    parser.add_argument("source", choices=sorted(_BACKENDS))
+    parser.add_argument("target", choices=sorted(_BACKENDS))
+    parser.add_argument("conv_ids", nargs="+")
+    parser.add_argument("--delete-source", action="store_true")
+    args = parser.parse_args()
+
+    for conv_id in args.conv_ids:
+        count = migrate_conversation(
+            conv_id,
+            args.source,
+            args.target,
+            delete_source=args.delete_source
+        )
+        print(f"{conv_id}: {count} chunks {args.source} → {args.target}")
@@ -0,0 +1,263 @@
+# app/repos/clients.py
+"""
+Process-wide client registry.
+
+Clients (Firestore, Pinecone, Redis, OpenAI) are created lazily on first
+use and then shared by every repo / service in the process, so their
+connection pools and TLS / gRPC channels are reused across requests.
+
+Fork-safe: a forked child (Celery prefork, gunicorn) never reuses the
+parent's sockets — the registry is emptied right after fork and every
+client is rebuilt on first use in the child.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+# Pub/sub listeners (SSE, long-poll) hold a connection each for minutes:
+# separate pool, callers wait for a free connection instead of failing
+REDIS_PUBSUB_MAX_CONNECTIONS = int(os.getenv("REDIS_PUBSUB_MAX_CONNECTIONS", 200))
+REDIS_PUBSUB_WAIT_SECONDS = float(os.getenv("REDIS_PUBSUB_WAIT_SECONDS", 5))
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", 4))
+
+CHAT_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+_clients: Dict[Any, Any] = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def reset_clients():
+    """
+    Drops every cached client.
+    Called automatically after fork; safe to call manually.
+    """
+    global _lock, _pid
+
+    # The parent's lock may have been held by another thread at fork time
+    _lock = threading.Lock()
+    _clients.clear()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
+
+
+def _get(key: Any, factory: Callable[[], Any]) -> Any:
+    if _pid != os.getpid():
+        reset_clients()
+
+    if key in _clients:
+        return _clients[key]
+
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+# -------------------------------------------------
+# Firestore
+# -------------------------------------------------
+def _build_firestore():
+    from google.cloud import firestore
+
+    project = os.getenv("FIRESTORE_PROJECT")
+    if not project:
+        return None
+
+    try:
+        return firestore.Client(project=project)
+    except Exception:
+        # Missing credentials (local/dev) → Firestore disabled
+        return None
+
+
+def firestore_client():
+    """
+    Shared firestore.Client, or None when Firestore is disabled.
+    """
+    return _get("firestore", _build_firestore)
+
+
+def _build_async_firestore():
+    from google.cloud import firestore
+
+    project = os.getenv("FIRESTORE_PROJECT")
+    if not project:
+        return None
+
+    try:
+        return firestore.AsyncClient(project=project)
+    except Exception:
+        return None
+
+
+def async_firestore_client():
+    """
+    Shared firestore.AsyncClient (API event loop only), or None.
+    """
+    return _get("firestore-async", _build_async_firestore)
+
+
+# -------------------------------------------------
+# Pinecone
+# -------------------------------------------------
+def _build_pinecone_index():
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return pc.Index(
+        host=os.environ["PINECONE_HOST"],
+        pool_threads=PINECONE_POOL_THREADS
+    )
+
+
+def pinecone_index():
+    return _get("pinecone", _build_pinecone_index)
+
+
+def _build_pinecone_async_index():
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return pc.IndexAsyncio(host=os.environ["PINECONE_HOST"])
+
+
+def pinecone_async_index():
+    """
+    asyncio Pinecone index (API event loop only).
+    """
+    return _get("pinecone-async", _build_pinecone_async_index)
+
+
+# -------------------------------------------------
+# Redis
+# -------------------------------------------------
+def _redis_url() -> str:
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        raise RuntimeError("REDIS_URL is required in production")
+    return redis_url
+
+
+def _build_redis(decode_responses: bool = True):
+    import redis  # lazy import (IMPORTANT)
+
+    pool = redis.ConnectionPool.from_url(
+        _redis_url(),
+        decode_responses=decode_responses,
+        max_connections=REDIS_MAX_CONNECTIONS
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def _build_async_redis(decode_responses: bool = True):
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(
+        _redis_url(),
+        decode_responses=decode_responses,
+        max_connections=REDIS_MAX_CONNECTIONS
+    )
+
+
+def _build_async_redis_pubsub():
+    import redis.asyncio as aioredis
+
+    pool = aioredis.BlockingConnectionPool.from_url(
+        _redis_url(),
+        decode_responses=True,
+        max_connections=REDIS_PUBSUB_MAX_CONNECTIONS,
+        timeout=REDIS_PUBSUB_WAIT_SECONDS
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def redis_client():
+    return _get("redis", _build_redis)
+
+
+def async_redis_client():
+    """
+    asyncio Redis client (API event loop only).
+    """
+    return _get("redis-async", _build_async_redis)
+
+
+def async_redis_pubsub_client():
+    """
+    asyncio Redis client for pub/sub subscriptions only: listeners never
+    exhaust the pool used by regular commands (answer cache, jobs).
+    """
+    return _get("redis-pubsub-async", _build_async_redis_pubsub)
+
+
+def redis_binary_client():
+    """
+    Redis client returning raw bytes (binary blobs, e.g. vectors).
+    """
+    return _get("redis-binary", lambda: _build_redis(decode_responses=False))
+
+
+def async_redis_binary_client():
+    return _get(
+        "redis-binary-async",
+        lambda: _build_async_redis(decode_responses=False)
+    )
+
+
+# -------------------------------------------------
+# OpenAI (LangChain)
+# -------------------------------------------------
+def chat_llm(model: str = CHAT_MODEL, temperature: float = 0.2):
+    from langchain_openai import ChatOpenAI
+
+    return _get(
+        ("llm", model, temperature),
+        lambda: ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=os.environ["OPENAI_API_KEY"]
+        )
+    )
+
+
+def embeddings(model: str = EMBEDDING_MODEL):
+    from langchain_openai import OpenAIEmbeddings
+
+    return _get(
+        ("embeddings", model),
+        lambda: OpenAIEmbeddings(
+            model=model,
+            api_key=os.environ["OPENAI_API_KEY"]
+        )
+    )
+
+
+# -------------------------------------------------
+# Shutdown (API)
+# -------------------------------------------------
+async def aclose_clients():
+    """
+    Closes the asyncio clients bound to the API event loop.
+    """
+    pinecone = _clients.pop("pinecone-async", None)
+    if pinecone is not None:
+        await pinecone.close()
+
+    for key in ("redis-async", "redis-binary-async", "redis-pubsub-async"):
+        redis = _clients.pop(key, None)
+        if redis is not None:
+            await redis.aclose()
+
+    firestore = _clients.pop("firestore-async", None)
+    if firestore is not None:
+        firestore.close()
@@ -1,25 +1,13 @@
-import os
-from google.cloud import firestore
 from google.cloud.firestore import Increment
-from google.auth.exceptions import DefaultCredentialsError
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+
+from app.repos import clients
 
 
 class FirestoreRepo:
     def __init__(self):
-        self._db = None
-
-        project = os.getenv("FIRESTORE_PROJECT")
-
-        if not project:
-            return
-
-        try:
-            self._db = firestore.Client(project=project)
-        except DefaultCredentialsError:
-            self._db = None
-        except Exception:
-            self._db = None
+        # Shared client (None when Firestore is disabled in local/dev)
+        self._db = clients.firestore_client()
 
     def enabled(self) -> bool:
         return self._db is not None
@@ -68,6 +56,64 @@ class FirestoreRepo:
             "error": error
         })
 
+    # ---------------------------------------------------
+    # Document fingerprints (whole-source dedupe)
+    # ---------------------------------------------------
+    def get_fingerprint(self, fingerprint: str) -> Optional[Dict]:
+        if not self._db:
+            return None
+
+        doc = self._db.collection("fingerprints") \
+            .document(fingerprint) \
+            .get()
+
+        return doc.to_dict() if doc.exists else None
+
+    def save_fingerprint(self, fingerprint: str, data: dict):
+        if not self._db:
+            return
+
+        self._db.collection("fingerprints") \
+            .document(fingerprint) \
+            .set(data)
+
+    def delete_fingerprint(self, fingerprint: str):
+        if not self._db:
+            return
+
+        self._db.collection("fingerprints") \
+            .document(fingerprint) \
+            .delete()
+
+    # ---------------------------------------------------
+    # Section-summary index (map-step bullets, see section_index)
+    # ---------------------------------------------------
+    def get_sections(self, doc_id: str) -> Optional[Dict]:
+        if not self._db:
+            return None
+
+        doc = self._db.collection("sections") \
+            .document(doc_id) \
+            .get()
+
+        return doc.to_dict() if doc.exists else None
+
+    def save_sections(self, doc_id: str, data: dict):
+        if not self._db:
+            return
+
+        self._db.collection("sections") \
+            .document(doc_id) \
+            .set(data)
+
+    def delete_sections(self, doc_id: str):
+        if not self._db:
+            return
+
+        self._db.collection("sections") \
+            .document(doc_id) \
+            .delete()
+
     # ---------------------------------------------------
     # TOKEN MANAGEMENT (NEW - ATOMIC SAFE)
     # ---------------------------------------------------
@@ -94,6 +140,27 @@ class FirestoreRepo:
                 "totalTokens": Increment(total_tokens)
             }, merge=True)
 
+    def increment_system_tokens(
+        self,
+        doc_id: str,
+        input_tokens: int,
+        output_tokens: int
+    ):
+        """
+        Token counters for work the service does on its own (precomputed
+        answers): tracked per conversation, never part of the user's usage.
+        """
+        if not self._db:
+            return
+
+        self._db.collection("conversations") \
+            .document(doc_id) \
+            .set({
+                "systemInputTokens": Increment(input_tokens),
+                "systemOutputTokens": Increment(output_tokens),
+                "systemTotalTokens": Increment(input_tokens + output_tokens)
+            }, merge=True)
+
     # ---------------------------------------------------
     # Chunk-level storage
     # ---------------------------------------------------
@@ -118,20 +185,108 @@ class FirestoreRepo:
             .document(chunk_id) \
             .set(payload)
 
-    def get_chunk(self, conversation_id: str, chunk_id: str) -> Optional[str]:
+    def get_chunks(
+        self,
+        conversation_id: str,
+        chunk_ids: List[Optional[str]]
+    ) -> List[Optional[str]]:
+        """
+        Multi-get of chunk texts in ONE round trip (get_all).
+        Result is aligned with chunk_ids; missing / empty ids → None.
+        """
         if not self._db:
-            return None
+            return [None] * len(chunk_ids)
 
-        doc = (
+        chunks = (
             self._db
             .collection("conversations")
             .document(conversation_id)
             .collection("chunks")
-            .document(chunk_id)
-            .get()
         )
 
-        if not doc.exists:
+        wanted = list(dict.fromkeys(cid for cid in chunk_ids if cid))
+        texts = {}
+
+        if wanted:
+            for doc in self._db.get_all([chunks.document(cid) for cid in wanted]):
+                if doc.exists:
+                    texts[doc.id] = doc.to_dict().get("text")
+
+        # get_all does not preserve order → re-align
+        return [texts.get(cid) if cid else None for cid in chunk_ids]
+
+
+class AsyncFirestoreRepo:
+    """
+    asyncio counterpart of FirestoreRepo for the request path.
+    Same collections, same no-op behavior when Firestore is disabled.
+    """
+
+    def __init__(self):
+        self._db = clients.async_firestore_client()
+
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def _conversation(self, doc_id: str):
+        return self._db.collection("conversations").document(doc_id)
+
+    async def update(self, doc_id: str, data: dict):
+        if not self._db:
+            return
+
+        await self._conversation(doc_id).set(data, merge=True)
+
+    async def get(self, doc_id: str) -> Optional[Dict]:
+        if not self._db:
             return None
 
-        return doc.to_dict().get("text")
+        doc = await self._conversation(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def get_sections(self, doc_id: str) -> Optional[Dict]:
+        if not self._db:
+            return None
+
+        doc = await self._db.collection("sections").document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def increment_tokens(
+        self,
+        doc_id: str,
+        input_tokens: int,
+        output_tokens: int
+    ):
+        if not self._db:
+            return
+
+        await self._conversation(doc_id).set({
+            "inputTokens": Increment(input_tokens),
+            "outputTokens": Increment(output_tokens),
+            "totalTokens": Increment(input_tokens + output_tokens)
+        }, merge=True)
+
+    async def get_chunks(
+        self,
+        conversation_id: str,
+        chunk_ids: List[Optional[str]]
+    ) -> List[Optional[str]]:
+        """
+        Async multi-get, same contract as FirestoreRepo.get_chunks.
+        """
+        if not self._db:
+            return [None] * len(chunk_ids)
+
+        chunks = self._conversation(conversation_id).collection("chunks")
+
+        wanted = list(dict.fromkeys(cid for cid in chunk_ids if cid))
+        texts = {}
+
+        if wanted:
+            async for doc in self._db.get_all(
+                [chunks.document(cid) for cid in wanted]
+            ):
+                if doc.exists:
+                    texts[doc.id] = doc.to_dict().get("text")
+
+        return [texts.get(cid) if cid else None for cid in chunk_ids]
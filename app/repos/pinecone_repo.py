@@ -1,16 +1,133 @@
 # app/repos/pinecone_repo.py
-from pinecone import Pinecone
+import json
 import os
-from dotenv import load_dotenv
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, List, Dict, Optional
 
-load_dotenv()
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter
 
-pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-index = pc.Index(host=os.environ["PINECONE_HOST"])
+from app.repos import clients
+
+# Pinecone rejects upsert requests over 2 MB / 1000 vectors
+PINECONE_UPSERT_MAX_VECTORS = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", 100))
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", 1_500_000))
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", 4))
+PINECONE_UPSERT_RETRIES = int(os.getenv("PINECONE_UPSERT_RETRIES", 5))
+
+
+def _vector_bytes(vector: Dict) -> int:
+    # JSON size is what the request limit is measured against
+    return len(json.dumps(vector, separators=(",", ":")))
+
+
+def upsert_batches(
+    vectors: Iterable[Dict],
+    max_vectors: int = PINECONE_UPSERT_MAX_VECTORS,
+    max_bytes: int = PINECONE_UPSERT_MAX_BYTES
+) -> Iterator[List[Dict]]:
+    """
+    Splits vectors into batches bounded by count AND request size.
+    """
+    batch, size = [], 0
+
+    for vector in vectors:
+        vsize = _vector_bytes(vector)
+
+        if batch and (len(batch) >= max_vectors or size + vsize > max_bytes):
+            yield batch
+            batch, size = [], 0
+
+        batch.append(vector)
+        size += vsize
+
+    if batch:
+        yield batch
+
+
+class PineconeWriter:
+    """
+    Write-behind upserts for one namespace.
+
+    add() buffers vectors and sends full batches in the background
+    (PINECONE_UPSERT_CONCURRENCY requests in flight, each retried with
+    exponential backoff). When every slot is busy add() blocks, so a
+    fast producer never queues unbounded vectors in memory.
+    flush() sends the remainder, waits, and re-raises the first error.
+    """
+
+    def __init__(
+        self,
+        repo: "PineconeRepo",
+        namespace: str,
+        *,
+        concurrency: int = PINECONE_UPSERT_CONCURRENCY
+    ):
+        self._repo = repo
+        self._namespace = namespace
+        self._concurrency = max(1, concurrency)
+        self._pending: List[Dict] = []
+        self._futures = set()
+        self.sent = 0
+        self._pool = ThreadPoolExecutor(
+            max_workers=self._concurrency,
+            thread_name_prefix="pinecone-upsert"
+        )
+
+    def add(self, vectors: Iterable[Dict]):
+        self._pending.extend(vectors)
+
+        if len(self._pending) < PINECONE_UPSERT_MAX_VECTORS:
+            return
+
+        batches = list(upsert_batches(self._pending))
+
+        # Keep the (possibly partial) last batch buffered
+        self._pending = batches.pop()
+        for batch in batches:
+            self._submit(batch)
+
+    def _submit(self, batch: List[Dict]):
+        while len(self._futures) >= self._concurrency:
+            done, _ = wait(self._futures, return_when=FIRST_COMPLETED)
+            self._reap(done)
+
+        self._futures.add(
+            self._pool.submit(self._repo.upsert_batch, batch, self._namespace)
+        )
+
+    def _reap(self, done):
+        for future in done:
+            self._futures.discard(future)
+            self.sent += future.result()
+
+    def flush(self) -> int:
+        for batch in upsert_batches(self._pending):
+            self._submit(batch)
+        self._pending = []
+
+        self._reap(list(self._futures))
+        return self.sent
+
+    def close(self) -> int:
+        try:
+            return self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        return False
 
 
 class PineconeRepo:
+    def __init__(self):
+        self.index = clients.pinecone_index()
 
     def upsert(
         self,
@@ -20,11 +137,56 @@ class PineconeRepo:
         """
         Upserts vectors into a user-scoped namespace.
         """
-        index.upsert(
+        self.index.upsert(
             vectors=vectors,
             namespace=namespace
         )
 
+    @retry(
+        stop=stop_after_attempt(PINECONE_UPSERT_RETRIES),
+        wait=wait_exponential_jitter(initial=0.5, max=10),
+        reraise=True
+    )
+    def upsert_batch(self, vectors: List[Dict], namespace: str) -> int:
+        """
+        One size-bounded upsert request, retried with backoff.
+        """
+        self.index.upsert(vectors=vectors, namespace=namespace)
+        return len(vectors)
+
+    @retry(
+        stop=stop_after_attempt(PINECONE_UPSERT_RETRIES),
+        wait=wait_exponential_jitter(initial=0.5, max=10),
+        reraise=True
+    )
+    def fetch(self, ids: List[str], namespace: str) -> Dict[str, Dict]:
+        """
+        {id: {"id", "values", "metadata"}} for the ids that exist.
+        """
+        res = self.index.fetch(ids=ids, namespace=namespace)
+
+        return {
+            vid: {
+                "id": vid,
+                "values": list(vector.values),
+                "metadata": vector.metadata or {},
+            }
+            for vid, vector in res.vectors.items()
+        }
+
+    def writer(self, namespace: str) -> PineconeWriter:
+        return PineconeWriter(self, namespace)
+
+    def upsert_stream(self, vectors: Iterable[Dict], namespace: str) -> int:
+        """
+        Upserts any number of vectors (list or generator) in size-bounded
+        batches sent in parallel. Returns the number of vectors written.
+        """
+        with self.writer(namespace) as writer:
+            for vector in vectors:
+                writer.add((vector,))
+        return writer.sent
+
     def query(
         self,
         vector: List[float],
@@ -35,7 +197,25 @@ class PineconeRepo:
         """
         Queries vectors within a namespace.
         """
-        return index.query(
+        return self.index.query(
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            filter=metadata_filter,
+            include_metadata=True
+        )
+
+    async def aquery(
+        self,
+        vector: List[float],
+        namespace: str,
+        top_k: int = 6,
+        metadata_filter: Optional[Dict] = None
+    ):
+        """
+        Same as query(), on the asyncio index (no thread used).
+        """
+        return await clients.pinecone_async_index().query(
             vector=vector,
             top_k=top_k,
             namespace=namespace,
@@ -47,7 +227,7 @@ class PineconeRepo:
         """
         Deletes all vectors for a conversation/user.
         """
-        index.delete(
+        self.index.delete(
             delete_all=True,
             namespace=namespace
         )
@@ -2,9 +2,14 @@
 import json
 import uuid
 import os
+import time
+import asyncio
 from datetime import datetime
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
+from app.repos import clients
+
 load_dotenv()
 
 USE_CELERY = os.getenv("USE_CELERY", "true").lower() == "true"
@@ -14,6 +19,33 @@ USE_CELERY = os.getenv("USE_CELERY", "true").lower() == "true"
 # pdf-web-api     -> "pdf:"
 REDIS_PREFIX = os.getenv("REDIS_PREFIX")
 
+# Job states after which no further progress events are published
+TERMINAL_STATUSES = ("done", "failed", "not_found")
+
+# ⏳ Key expiry (seconds)
+# - active jobs are refreshed on every update
+# - finished jobs only need to live long enough to be read back
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 7 * 24 * 3600))
+JOB_FINISHED_TTL_SECONDS = int(os.getenv("JOB_FINISHED_TTL_SECONDS", 24 * 3600))
+
+# Max job ids kept per conversation / user index
+JOB_INDEX_MAX = int(os.getenv("JOB_INDEX_MAX", 50))
+
+
+def _new_job(sourceId: str, userId: Optional[str]) -> Dict:
+    data = {
+        "jobId": f"job_{uuid.uuid4().hex[:8]}",
+        "sourceId": sourceId,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0,
+        "createdAt": datetime.utcnow().isoformat(),
+    }
+    if userId:
+        data["userId"] = userId
+    return data
+
+
 # -------------------------------------------------
 # In-memory fallback (LOCAL DEV)
 # -------------------------------------------------
@@ -24,18 +56,10 @@ class InMemoryJobRepo:
     def _key(self, jobId: str) -> str:
         return f"{REDIS_PREFIX}{jobId}"
 
-    def create(self, sourceId: str):
-        jobId = f"job_{uuid.uuid4().hex[:8]}"
-        data = {
-            "jobId": jobId,
-            "sourceId": sourceId,
-            "status": "queued",
-            "stage": "queued",
-            "progress": 0,
-            "createdAt": datetime.utcnow().isoformat(),
-        }
-        _IN_MEMORY_JOBS[self._key(jobId)] = data
-        return data
+    def create(self, sourceId: str, userId: Optional[str] = None):
+        data = _new_job(sourceId, userId)
+        _IN_MEMORY_JOBS[self._key(data["jobId"])] = data
+        return dict(data)
 
     def update(self, jobId, **kwargs):
         key = self._key(jobId)
@@ -54,43 +78,173 @@ class InMemoryJobRepo:
             "status": "not_found"
         })
 
+    def _list(self, field: str, value: str, limit: int) -> List[Dict]:
+        found = [
+            dict(job) for job in _IN_MEMORY_JOBS.values()
+            if job.get(field) == value
+        ]
+        found.sort(key=lambda job: job["createdAt"], reverse=True)
+        return found[:limit]
+
+    def list_for_conversation(self, convId: str, limit: int = 20) -> List[Dict]:
+        return self._list("sourceId", convId, limit)
+
+    def list_for_user(self, userId: str, limit: int = 20) -> List[Dict]:
+        return self._list("userId", userId, limit)
+
+    async def aget(self, jobId):
+        return dict(self.get(jobId))
+
+    async def listen(self, jobId, heartbeat: float = 15.0):
+        """
+        Yields the current job state, then the state after every change
+        until the job finishes. Yields None when nothing changed for
+        `heartbeat` seconds.
+        """
+        state = await self.aget(jobId)
+        yield state
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + heartbeat
+
+        while state["status"] not in TERMINAL_STATUSES:
+            await asyncio.sleep(0.25)
+            current = await self.aget(jobId)
+
+            if current != state:
+                state = current
+                deadline = loop.time() + heartbeat
+                yield state
+            elif loop.time() >= deadline:
+                deadline = loop.time() + heartbeat
+                yield None
+
 
 # -------------------------------------------------
 # Redis-backed repo (PRODUCTION)
 # -------------------------------------------------
+# Jobs are stored as hashes (one JSON-encoded value per field).
+# Updates run server-side in ONE round trip:
+#   - skip unknown / expired jobs (no partial hashes)
+#   - HSET only the changed fields (no lost updates between writers)
+#   - refresh the TTL
+#   - publish the change to SSE / long-poll listeners
+#
+# Jobs created before the hash layout are JSON strings at
+# {prefix}{jobId}: reads fall back to them, and their first update
+# moves them into the hash (KEYS[3] = legacy key).
+_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local legacy = redis.call('GET', KEYS[3])
+    if not legacy then
+        return 0
+    end
+    for field, value in pairs(cjson.decode(legacy)) do
+        redis.call('HSET', KEYS[1], field, cjson.encode(value))
+    end
+    redis.call('DEL', KEYS[3])
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+redis.call('PUBLISH', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def _encode(data: Dict) -> Dict[str, str]:
+    return {k: json.dumps(v) for k, v in data.items()}
+
+
+def _decode(raw: Dict[str, str]) -> Dict:
+    return {k: json.loads(v) for k, v in raw.items()}
+
+
 class RedisJobRepo:
+    # Registered once per process (the SHA is computed locally); called
+    # with the current client, so it survives the fork-time client reset
+    _update_script = None
+
     def __init__(self):
-        import redis  # lazy import (IMPORTANT)
-        redis_url = os.environ.get("REDIS_URL")
-        if not redis_url:
-            raise RuntimeError("REDIS_URL is required in production")
+        # Fail fast on misconfiguration (REDIS_URL); the pool is shared
+        client = clients.redis_client()
+
+        if RedisJobRepo._update_script is None:
+            RedisJobRepo._update_script = client.register_script(_UPDATE_SCRIPT)
+
+    @property
+    def client(self):
+        return clients.redis_client()
 
-        self.client = redis.from_url(redis_url, decode_responses=True)
+    @property
+    def aclient(self):
+        # asyncio client is only needed by the API (SSE / long-poll)
+        return clients.async_redis_client()
 
     def _key(self, jobId: str) -> str:
+        return f"{REDIS_PREFIX}job:{jobId}"
+
+    def _channel(self, jobId: str) -> str:
+        return f"{REDIS_PREFIX}job:{jobId}:events"
+
+    # Pre-hash layout (JSON string); still written by not-yet-upgraded workers
+    def _legacy_key(self, jobId: str) -> str:
         return f"{REDIS_PREFIX}{jobId}"
 
-    def create(self, sourceId: str):
-        jobId = f"job_{uuid.uuid4().hex[:8]}"
-        data = {
-            "jobId": jobId,
-            "sourceId": sourceId,
-            "status": "queued",
-            "stage": "queued",
-            "progress": 0,
-            "createdAt": datetime.utcnow().isoformat(),
-        }
-        self.client.set(self._key(jobId), json.dumps(data))
+    def _legacy_channel(self, jobId: str) -> str:
+        return f"{REDIS_PREFIX}{jobId}:events"
+
+    def _conv_index(self, convId: str) -> str:
+        return f"{REDIS_PREFIX}conv:{convId}:jobs"
+
+    def _user_index(self, userId: str) -> str:
+        return f"{REDIS_PREFIX}user:{userId}:jobs"
+
+    def create(self, sourceId: str, userId: Optional[str] = None):
+        data = _new_job(sourceId, userId)
+        jobId = data["jobId"]
+        key = self._key(jobId)
+
+        indexes = [self._conv_index(sourceId)]
+        if userId:
+            indexes.append(self._user_index(userId))
+
+        # Job hash + indexes in a single MULTI/EXEC round trip
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, mapping=_encode(data))
+        pipe.expire(key, JOB_TTL_SECONDS)
+
+        for index in indexes:
+            pipe.zadd(index, {jobId: time.time()})
+            pipe.zremrangebyrank(index, 0, -(JOB_INDEX_MAX + 1))
+            pipe.expire(index, JOB_TTL_SECONDS)
+
+        pipe.execute()
         return data
 
     def update(self, jobId, **kwargs):
-        key = self._key(jobId)
-        raw = self.client.get(key)
-        if not raw:
+        if not kwargs:
             return
-        data = json.loads(raw)
-        data.update(kwargs)
-        self.client.set(key, json.dumps(data))
+
+        ttl = (
+            JOB_FINISHED_TTL_SECONDS
+            if kwargs.get("status") in TERMINAL_STATUSES
+            else JOB_TTL_SECONDS
+        )
+
+        # Listeners receive ONLY the changed fields (+ jobId)
+        event = json.dumps({"jobId": jobId, **kwargs})
+
+        args = [ttl, event]
+        for field, value in _encode(kwargs).items():
+            args.extend([field, value])
+
+        self._update_script(
+            keys=[self._key(jobId), self._channel(jobId), self._legacy_key(jobId)],
+            args=args,
+            client=self.client
+        )
 
     def complete(self, jobId):
         self.update(jobId, status="done", progress=100, stage="done")
@@ -98,12 +252,79 @@ class RedisJobRepo:
     def fail(self, jobId, error):
         self.update(jobId, status="failed", error=error)
 
+    @staticmethod
+    def _found(jobId: str, raw: Dict[str, str], legacy: Optional[str]) -> Dict:
+        if raw:
+            return _decode(raw)
+        if legacy:
+            return json.loads(legacy)
+        return {"jobId": jobId, "status": "not_found"}
+
     def get(self, jobId):
-        raw = self.client.get(self._key(jobId))
-        return json.loads(raw) if raw else {
-            "jobId": jobId,
-            "status": "not_found"
-        }
+        raw = self.client.hgetall(self._key(jobId))
+        legacy = None if raw else self.client.get(self._legacy_key(jobId))
+        return self._found(jobId, raw, legacy)
+
+    def _list(self, index: str, limit: int) -> List[Dict]:
+        jobIds = self.client.zrevrange(index, 0, limit - 1)
+        if not jobIds:
+            return []
+
+        pipe = self.client.pipeline(transaction=False)
+        for jobId in jobIds:
+            pipe.hgetall(self._key(jobId))
+
+        # Expired jobs leave empty hashes behind in the index → skip
+        return [_decode(raw) for raw in pipe.execute() if raw]
+
+    def list_for_conversation(self, convId: str, limit: int = 20) -> List[Dict]:
+        return self._list(self._conv_index(convId), limit)
+
+    def list_for_user(self, userId: str, limit: int = 20) -> List[Dict]:
+        return self._list(self._user_index(userId), limit)
+
+    async def aget(self, jobId):
+        raw = await self.aclient.hgetall(self._key(jobId))
+        legacy = None if raw else await self.aclient.get(self._legacy_key(jobId))
+        return self._found(jobId, raw, legacy)
+
+    async def listen(self, jobId, heartbeat: float = 15.0):
+        """
+        Yields the current job state, then the state after every change
+        (Redis pub/sub) until the job finishes. Yields None when nothing
+        changed for `heartbeat` seconds.
+        """
+        # Own pool: long-lived subscriptions never starve other commands
+        pubsub = clients.async_redis_pubsub_client().pubsub()
+
+        # Subscribe BEFORE reading the snapshot so no update is missed
+        # (legacy channel: full-state events from not-yet-upgraded workers)
+        await pubsub.subscribe(self._channel(jobId), self._legacy_channel(jobId))
+
+        try:
+            state = await self.aget(jobId)
+            yield state
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + heartbeat
+
+            while state["status"] not in TERMINAL_STATUSES:
+                msg = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=max(deadline - loop.time(), 0.0)
+                )
+
+                if msg is not None:
+                    # Events carry only the changed fields → merge
+                    state = {**state, **json.loads(msg["data"])}
+                    deadline = loop.time() + heartbeat
+                    yield state
+                elif loop.time() >= deadline:
+                    deadline = loop.time() + heartbeat
+                    yield None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
 
 
 # -------------------------------------------------
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from app.repos.redis_jobs import get_job_repo
-from app.repos.firestore_repo import FirestoreRepo
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.repos.redis_jobs import get_job_repo, TERMINAL_STATUSES
+from app.repos.firestore_repo import FirestoreRepo, AsyncFirestoreRepo
 from app.workers.ingest_task import ingest_document
 from app.schemas.ingest import IngestRequest
 from app.schemas.qa import AskRequest
-from app.services.qa_engine import answer_question
+from app.services.qa_engine import answer_question_async, stream_answer
+from app.services import answer_cache
+import asyncio
+import json
 import os
 
 USE_CELERY = os.getenv("USE_CELERY", "true").lower() == "true"
 
+# Long-poll / SSE limits (seconds)
+JOB_WAIT_MAX_SECONDS = float(os.getenv("JOB_WAIT_MAX_SECONDS", 30))
+JOB_SSE_HEARTBEAT_SECONDS = float(os.getenv("JOB_SSE_HEARTBEAT_SECONDS", 15))
+
+# Conversation fields kept out of job results
+INTERNAL_CONVERSATION_FIELDS = ("router",)
+
 router = APIRouter(prefix="/v1")
 jobs = get_job_repo()
 
@@ -26,7 +38,7 @@ def ingest(req: IngestRequest):
     """
 
     # Create async job
-    job = jobs.create(req.convId)
+    job = jobs.create(req.convId, userId=req.userId)
 
     # Decide ingestion type (SAFE: schema already validated)
     ingest_type = req.ingest_type()
@@ -64,28 +76,104 @@ def ingest(req: IngestRequest):
 # --------------------------------------------------
 # Job Status
 # --------------------------------------------------
+async def _with_result(data: dict) -> dict:
+    """
+    Attaches the conversation document once the job is done.
+    (Firestore is only touched for finished jobs.)
+    """
+    if data["status"] == "done":
+        store = FirestoreRepo()
+        result = await run_in_threadpool(store.get, data.get("convId"))
+
+        # Internal QA indexes (binary) are not part of the API
+        for field in INTERNAL_CONVERSATION_FIELDS:
+            (result or {}).pop(field, None)
+
+        data["result"] = result
+    return data
+
+
 @router.get("/jobs/{jobId}")
-def job_status(jobId: str):
-    data = jobs.get(jobId)
-    store = FirestoreRepo()
+async def job_status(
+    jobId: str,
+    wait: float = Query(0, ge=0, le=JOB_WAIT_MAX_SECONDS),
+):
+    """
+    Returns the job state.
+
+    - wait=0 -> immediate snapshot
+    - wait=N -> long-poll: returns on the next change or after N seconds
+    """
+    if not wait:
+        # Plain poll: one HGETALL, no pub/sub subscription
+        data = await jobs.aget(jobId)
+    else:
+        events = jobs.listen(jobId, heartbeat=wait)
+
+        try:
+            data = await events.__anext__()
+
+            if data["status"] not in TERMINAL_STATUSES:
+                changed = await events.__anext__()
+                if changed is not None:
+                    data = changed
+        finally:
+            await events.aclose()
 
     if data["status"] == "not_found":
         raise HTTPException(status_code=404, detail="Job not found")
 
-    if data["status"] == "done":
-        result = store.get(data.get("convId"))
-        data["result"] = result
+    return await _with_result(data)
 
-    return data
+
+@router.get("/jobs/{jobId}/events")
+async def job_events(jobId: str):
+    """
+    Server-Sent Events stream of job progress.
+    One `progress` event per change, closed after done / failed.
+    """
+    data = await jobs.aget(jobId)
+    if data["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        events = jobs.listen(jobId, heartbeat=JOB_SSE_HEARTBEAT_SECONDS)
+        try:
+            async for state in events:
+                if state is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                state = await _with_result(state)
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+@router.get("/conversations/{convId}/jobs")
+def conversation_jobs(convId: str, limit: int = Query(20, ge=1, le=50)):
+    return {"convId": convId, "jobs": jobs.list_for_conversation(convId, limit)}
+
+
+@router.get("/users/{userId}/jobs")
+def user_jobs(userId: str, limit: int = Query(20, ge=1, le=50)):
+    return {"userId": userId, "jobs": jobs.list_for_user(userId, limit)}
 
 
 # --------------------------------------------------
 # Ask Question (Summary → RAG)
 # --------------------------------------------------
-@router.post("/conversations/{convId}/ask")
-def ask(convId: str, req: AskRequest):
-    store = FirestoreRepo()
-    data = store.get(convId)
+async def _ready_conversation(store: AsyncFirestoreRepo, convId: str) -> dict:
+    data = await store.get(convId)
 
     if not data:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -102,15 +190,61 @@ def ask(convId: str, req: AskRequest):
             detail="Conversation summary missing"
         )
 
-    answer, mode, sources = answer_question(
-        summary=data["summary"],
-        question=req.question,
-        userId=data["userId"],
-        convId=convId
-    )
+    return data
+
+
+def _suggested_answer(data: dict, question: str):
+    """
+    Answer precomputed at ingest for one of the suggested questions.
+    """
+    wanted = answer_cache.normalize_question(question)
+
+    for item in data.get("suggestedAnswers") or []:
+        if answer_cache.normalize_question(item["question"]) == wanted:
+            return item["answer"], item["answerMode"], item["sources"]
+
+    return None
 
-    # 🔥 Get updated token values
-    updated = store.get(convId)
+
+def _cache_version(data: dict) -> str:
+    # jobId of the ingest that produced the conversation
+    return data.get("jobId") or "v0"
+
+
+def _token_usage(data: dict) -> dict:
+    return {
+        "inputTokens": data.get("inputTokens", 0),
+        "outputTokens": data.get("outputTokens", 0),
+        "totalTokens": data.get("totalTokens", 0)
+    }
+
+
+@router.post("/conversations/{convId}/ask")
+async def ask(convId: str, req: AskRequest):
+    store = AsyncFirestoreRepo()
+    data = await _ready_conversation(store, convId)
+
+    suggested = _suggested_answer(data, req.question)
+
+    if suggested:
+        (answer, mode, sources), cached = suggested, True
+    else:
+        (answer, mode, sources), cached = await answer_cache.get_or_compute(
+            convId,
+            _cache_version(data),
+            req.question,
+            lambda q_vec: answer_question_async(
+                summary=data["summary"],
+                question=req.question,
+                userId=data["userId"],
+                convId=convId,
+                router_index=data.get("router"),
+                q_vec=q_vec
+            )
+        )
+
+    # 🔥 Get updated token values (cache hits spend no tokens)
+    updated = data if cached else await store.get(convId) or {}
 
     return {
         "convId": convId,
@@ -118,9 +252,83 @@ def ask(convId: str, req: AskRequest):
         "answer": answer,
         "answerMode": mode,
         "sources": sources,
-        "tokenUsage": {
-            "inputTokens": updated.get("inputTokens", 0),
-            "outputTokens": updated.get("outputTokens", 0),
-            "totalTokens": updated.get("totalTokens", 0)
-        }
+        "cached": cached,
+        "tokenUsage": _token_usage(updated)
     }
+
+
+# --------------------------------------------------
+# Ask Question (streaming, SSE)
+# --------------------------------------------------
+@router.post("/conversations/{convId}/ask/stream")
+async def ask_stream(convId: str, req: AskRequest):
+    """
+    Same pipeline as /ask, streamed as Server-Sent Events:
+    meta (answerMode + sources) → token* → done (answer + tokenUsage)
+    """
+    store = AsyncFirestoreRepo()
+    data = await _ready_conversation(store, convId)
+    version = _cache_version(data)
+
+    cached = _suggested_answer(data, req.question)
+    q_vec = None
+
+    if not cached:
+        cached, q_vec = await answer_cache.lookup(convId, version, req.question)
+
+    async def replay():
+        answer, mode, sources = cached
+        yield {"event": "meta", "data": {"answerMode": mode, "sources": sources}}
+        yield {"event": "token", "data": {"text": answer}}
+        yield {"event": "done", "data": {"answer": answer}}
+
+    async def stream():
+        events = replay() if cached else stream_answer(
+            summary=data["summary"],
+            question=req.question,
+            userId=data["userId"],
+            convId=convId,
+            router_index=data.get("router"),
+            q_vec=q_vec
+        )
+        meta = {}
+
+        try:
+            async for event in events:
+                payload = event["data"]
+
+                if event["event"] == "meta":
+                    meta = payload
+
+                if event["event"] == "done":
+                    if not cached:
+                        # Completes even if the client leaves meanwhile
+                        await asyncio.shield(answer_cache.store(
+                            convId, version, req.question,
+                            (payload["answer"], meta["answerMode"], meta["sources"]),
+                            q_vec
+                        ))
+
+                    updated = data if cached else await store.get(convId) or {}
+                    payload = {
+                        "convId": convId,
+                        "question": req.question,
+                        **payload,
+                        "cached": bool(cached),
+                        "tokenUsage": _token_usage(updated)
+                    }
+
+                yield f"event: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            # Client gone mid-stream → stream_answer still records the
+            # tokens already spent
+            await events.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
@@ -17,5 +17,5 @@ class AskResponse(BaseModel):
     convId: str
     question: str
     answer: str
-    answerMode: str  # "summary" | "rag"
+    answerMode: str  # "summary" | "section" | "rag"
     sources: List[Any]
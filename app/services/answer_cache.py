@@ -0,0 +1,343 @@
+"""
+Per-conversation answer cache for /ask.
+
+Two tiers:
+- exact    → normalized question text
+- semantic → cosine(question embedding) >= ANSWER_CACHE_SEMANTIC_THRESHOLD
+
+Entries live in a process-local LRU backed by one Redis hash per
+conversation. Keys are scoped by the conversation "version" (the jobId
+of the ingest that produced it), so a re-ingest never serves stale
+answers; invalidate() also drops the Redis hash eagerly. Redis errors
+degrade to misses (lookup) or no-ops (store).
+
+Concurrent identical questions share ONE in-flight computation.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.repos import clients
+from app.repos.redis_jobs import REDIS_PREFIX
+from app.services.embedding_cache import cached_embeddings
+
+ANSWER_CACHE_ENABLE = os.getenv("ANSWER_CACHE_ENABLE", "true").lower() == "true"
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95))
+ANSWER_CACHE_LOCAL_SIZE = int(os.getenv("ANSWER_CACHE_LOCAL_SIZE", 2048))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+# Semantic index per conversation is reloaded from Redis at most this often
+SEMANTIC_REFRESH_SECONDS = 60
+
+# Conversations with an in-memory semantic index (LRU), and the most
+# recent questions kept per index
+ANSWER_CACHE_SEMANTIC_SIZE = int(os.getenv("ANSWER_CACHE_SEMANTIC_SIZE", 256))
+ANSWER_CACHE_SEMANTIC_ROWS = int(os.getenv("ANSWER_CACHE_SEMANTIC_ROWS", 512))
+
+# Redis tier only when Redis is configured (local dev → LRU only)
+_USE_REDIS = bool(os.getenv("REDIS_URL"))
+
+Answer = Tuple[str, str, List[Dict]]
+
+_local: "OrderedDict[str, Dict]" = OrderedDict()
+_semantic: "OrderedDict[str, Dict]" = OrderedDict()
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+# -------------------------
+# Keys
+# -------------------------
+def normalize_question(question: str) -> str:
+    q = re.sub(r"\s+", " ", (question or "").strip().lower())
+    return q.rstrip("?!. ")
+
+
+def _redis_key(convId: str) -> str:
+    return f"{REDIS_PREFIX}answers:{convId}"
+
+
+def _field(version: str, question: str) -> str:
+    digest = hashlib.sha256(normalize_question(question).encode()).hexdigest()
+    return f"{version}:{digest[:32]}"
+
+
+def _scope(convId: str, version: str) -> str:
+    return f"{convId}:{version}"
+
+
+# -------------------------
+# Local LRU
+# -------------------------
+def _local_get(key: str) -> Optional[Dict]:
+    entry = _local.get(key)
+    if entry is not None:
+        _local.move_to_end(key)
+    return entry
+
+
+def _local_put(key: str, entry: Dict):
+    _local[key] = entry
+    _local.move_to_end(key)
+    while len(_local) > ANSWER_CACHE_LOCAL_SIZE:
+        _local.popitem(last=False)
+
+
+async def _shared_get(convId: str, field: str) -> Optional[Dict]:
+    """
+    Local LRU, then the conversation's Redis hash.
+    """
+    key = f"{convId}:{field}"
+    entry = _local_get(key)
+
+    if entry is None and _USE_REDIS:
+        try:
+            raw = await clients.async_redis_client().hget(_redis_key(convId), field)
+        except Exception:
+            return None
+        if raw:
+            entry = json.loads(raw)
+            _local_put(key, entry)
+
+    return entry
+
+
+# -------------------------
+# Vectors
+# -------------------------
+def _pack(q_vec: List[float]) -> str:
+    return base64.b64encode(
+        np.asarray(q_vec, dtype=np.float16).tobytes()
+    ).decode()
+
+
+def _unpack(blob: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(blob), dtype=np.float16).astype(np.float32)
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    return v / (np.linalg.norm(v) + 1e-12)
+
+
+def _as_answer(entry: Dict) -> Answer:
+    return entry["answer"], entry["mode"], entry["sources"]
+
+
+# -------------------------
+# Semantic tier
+# -------------------------
+def _semantic_put(scope: str, index: Dict):
+    _semantic[scope] = index
+    _semantic.move_to_end(scope)
+    while len(_semantic) > ANSWER_CACHE_SEMANTIC_SIZE:
+        _semantic.popitem(last=False)
+
+
+async def _semantic_index(convId: str, version: str) -> Dict:
+    scope = _scope(convId, version)
+    index = _semantic.get(scope)
+
+    if index is not None:
+        _semantic.move_to_end(scope)
+        age = time.monotonic() - index["loadedAt"]
+        if not _USE_REDIS or age < SEMANTIC_REFRESH_SECONDS:
+            return index
+
+    fields, vectors = [], []
+
+    if _USE_REDIS:
+        # Pick up entries written by other API processes
+        try:
+            raw = await clients.async_redis_client().hgetall(_redis_key(convId))
+        except Exception:
+            raw = None
+
+        if raw is None and index is not None:
+            # Keep serving the stale index; retry after the next interval
+            index["loadedAt"] = time.monotonic()
+            return index
+
+        for field, value in (raw or {}).items():
+            if not field.startswith(f"{version}:"):
+                continue
+            entry = json.loads(value)
+            if entry.get("vector"):
+                fields.append(field)
+                vectors.append(_unit(_unpack(entry["vector"])))
+
+    # Newest rows win (Redis hash order is insertion order)
+    fields = fields[-ANSWER_CACHE_SEMANTIC_ROWS:]
+    vectors = vectors[-ANSWER_CACHE_SEMANTIC_ROWS:]
+
+    index = {
+        "fields": fields,
+        "matrix": np.vstack(vectors) if vectors else None,
+        "loadedAt": time.monotonic(),
+    }
+    _semantic_put(scope, index)
+    return index
+
+
+def _semantic_add(convId: str, version: str, field: str, q_vec: List[float]):
+    index = _semantic.get(_scope(convId, version))
+    if index is None:
+        return
+
+    row = _unit(q_vec)[None, :]
+    fields = index["fields"] + [field]
+    matrix = row if index["matrix"] is None else np.vstack([index["matrix"], row])
+
+    index["fields"] = fields[-ANSWER_CACHE_SEMANTIC_ROWS:]
+    index["matrix"] = matrix[-ANSWER_CACHE_SEMANTIC_ROWS:]
+
+
+async def _semantic_lookup(
+    convId: str,
+    version: str,
+    q_vec: List[float]
+) -> Optional[Dict]:
+    index = await _semantic_index(convId, version)
+    if index["matrix"] is None:
+        return None
+
+    scores = index["matrix"] @ _unit(q_vec)
+    best = int(scores.argmax())
+
+    if scores[best] < ANSWER_CACHE_SEMANTIC_THRESHOLD:
+        return None
+
+    # The local entry may have been evicted since the index was loaded
+    return await _shared_get(convId, index["fields"][best])
+
+
+# -------------------------
+# Public API
+# -------------------------
+async def lookup(
+    convId: str,
+    version: str,
+    question: str
+) -> Tuple[Optional[Answer], Optional[List[float]]]:
+    """
+    Exact tier (local → Redis), then semantic tier.
+
+    Returns (answer | None, question embedding | None); the embedding
+    is handed to the QA pipeline on a miss so it is computed only once.
+    """
+    if not ANSWER_CACHE_ENABLE:
+        return None, None
+
+    entry = await _shared_get(convId, _field(version, question))
+    if entry is not None:
+        return _as_answer(entry), None
+
+    if not ANSWER_CACHE_SEMANTIC:
+        return None, None
+
+    q_vec = await cached_embeddings().aembed_query(question)
+    entry = await _semantic_lookup(convId, version, q_vec)
+
+    return (_as_answer(entry) if entry else None), q_vec
+
+
+async def store(
+    convId: str,
+    version: str,
+    question: str,
+    answer: Answer,
+    q_vec: Optional[List[float]] = None
+):
+    if not ANSWER_CACHE_ENABLE:
+        return
+
+    field = _field(version, question)
+    text, mode, sources = answer
+
+    entry = {
+        "question": question,
+        "answer": text,
+        "mode": mode,
+        "sources": sources,
+        "vector": _pack(q_vec) if q_vec is not None else None,
+    }
+
+    _local_put(f"{convId}:{field}", entry)
+    if q_vec is not None:
+        _semantic_add(convId, version, field, q_vec)
+
+    if _USE_REDIS:
+        try:
+            pipe = clients.async_redis_client().pipeline(transaction=False)
+            pipe.hset(_redis_key(convId), field, json.dumps(entry))
+            pipe.expire(_redis_key(convId), ANSWER_CACHE_TTL_SECONDS)
+            await pipe.execute()
+        except Exception:
+            pass
+
+
+async def get_or_compute(
+    convId: str,
+    version: str,
+    question: str,
+    compute: Callable[[Optional[List[float]]], Awaitable[Answer]]
+) -> Tuple[Answer, bool]:
+    """
+    Returns (answer, cached). `compute(q_vec)` runs at most once per
+    process for concurrent identical questions (singleflight).
+    """
+    cached, q_vec = await lookup(convId, version, question)
+    if cached is not None:
+        return cached, True
+
+    key = f"{convId}:{_field(version, question)}"
+    pending = _inflight.get(key)
+
+    if pending is not None:
+        return await asyncio.shield(pending), True
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+
+    try:
+        answer = await compute(q_vec)
+        future.set_result(answer)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Waiters get the error; nobody else needs to observe it
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    await store(convId, version, question, answer, q_vec)
+    return answer, False
+
+
+def invalidate(convId: str):
+    """
+    Drops every cached answer of a conversation (called on re-ingest).
+    """
+    prefix = f"{convId}:"
+
+    for key in [k for k in _local if k.startswith(prefix)]:
+        _local.pop(key, None)
+    for scope in [s for s in _semantic if s.startswith(prefix)]:
+        _semantic.pop(scope, None)
+
+    if _USE_REDIS:
+        try:
+            clients.redis_client().delete(_redis_key(convId))
+        except Exception:
+            pass
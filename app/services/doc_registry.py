@@ -0,0 +1,188 @@
+"""
+Whole-document dedupe.
+
+fingerprints/{sha256(prompt + fetched PDF bytes | crawl result)} points
+to the conversation that already ingested that exact source. A repeat
+ingest copies its chunk text, vectors and summary into the new
+conversation instead of running extract / OCR / embed / summarize.
+
+The conversation document stores the fingerprint it was built from;
+an entry whose conversation no longer carries it (deleted, or
+re-ingested with another source) is dropped on lookup.
+"""
+import hashlib
+import mmap
+import os
+import time
+from typing import Dict, List, Optional, Union
+
+from app.repos import clients
+from app.repos.chunk_store import get_chunk_store, ChunkWriter
+from app.repos.firestore_repo import FirestoreRepo
+from app.repos.pinecone_repo import PineconeRepo
+
+DOC_DEDUPE_ENABLE = os.getenv("DOC_DEDUPE_ENABLE", "true").lower() == "true"
+
+# Vectors fetched from the source namespace per request
+CLONE_FETCH_BATCH = 100
+
+# Conversation fields copied from the source conversation (derived
+# from the document content only)
+CLONED_FIELDS = (
+    "sourceType",
+    "summary",
+    "questions",
+    "router",
+    "suggestedAnswers",
+)
+
+# meta keys copied; the URL always comes from the current request
+CLONED_META_FIELDS = (
+    "pages",
+    "totalWords",
+    "ocrPages",
+    "timedOutPages",
+)
+
+
+# -------------------------
+# Fingerprints
+# -------------------------
+def pdf_fingerprint(content: Union[bytes, mmap.mmap], prompt: Optional[str]) -> str:
+    h = hashlib.sha256(b"pdf\0")
+    h.update((prompt or "").encode())
+    h.update(b"\0")
+    h.update(content)
+    return h.hexdigest()
+
+
+def web_fingerprint(pages: List[Dict], prompt: Optional[str]) -> str:
+    h = hashlib.sha256(b"web\0")
+    h.update((prompt or "").encode())
+    for page in pages:
+        h.update(b"\0" + page["url"].encode())
+        h.update(b"\0" + page["text"].encode())
+    return h.hexdigest()
+
+
+# -------------------------
+# Registry
+# -------------------------
+def find_source(store: FirestoreRepo, fingerprint: str) -> Optional[Dict]:
+    """
+    The ready conversation registered for this fingerprint, or None.
+    """
+    if not DOC_DEDUPE_ENABLE or not store.enabled():
+        return None
+
+    entry = store.get_fingerprint(fingerprint)
+    if not entry or entry.get("embeddingModel") != clients.EMBEDDING_MODEL:
+        return None
+
+    source = store.get(entry["convId"])
+    if not source or source.get("fingerprint") != fingerprint:
+        # Conversation deleted or re-ingested from another source
+        store.delete_fingerprint(fingerprint)
+        return None
+
+    if source.get("status") != "ready":
+        return None
+
+    return source
+
+
+def cloned_fields(source: Dict, url: str) -> Dict:
+    """
+    Conversation fields a clone takes from its source, with meta
+    rebuilt around the URL of the current request.
+    """
+    meta = source.get("meta") or {}
+
+    return {
+        **{k: source[k] for k in CLONED_FIELDS if k in source},
+        "meta": {
+            **{k: meta[k] for k in CLONED_META_FIELDS if k in meta},
+            "url": url,
+        },
+    }
+
+
+def register(
+    store: FirestoreRepo,
+    fingerprint: str,
+    *,
+    userId: str,
+    convId: str,
+    sourceType: str
+):
+    if not DOC_DEDUPE_ENABLE:
+        return
+
+    store.save_fingerprint(fingerprint, {
+        "userId": userId,
+        "convId": convId,
+        "sourceType": sourceType,
+        "embeddingModel": clients.EMBEDDING_MODEL,
+        "createdAt": int(time.time()),
+    })
+
+
+# -------------------------
+# Clone
+# -------------------------
+def clone_conversation(source: Dict, *, userId: str, convId: str) -> int:
+    """
+    Copies chunk text + vectors of `source` into userId:convId.
+    Raises when the source is incomplete; returns the chunk count.
+    """
+    src_namespace = f"{source['userId']}:{source['convId']}"
+
+    pinecone = PineconeRepo()
+    chunks = get_chunk_store()
+    copied = 0
+
+    with ChunkWriter(chunks, convId) as chunk_writer, \
+            pinecone.writer(f"{userId}:{convId}") as vector_writer:
+
+        def copy(batch: List[Dict]):
+            nonlocal copied
+
+            vectors = pinecone.fetch([r["chunkId"] for r in batch], src_namespace)
+            if len(vectors) != len(batch):
+                raise ValueError("source conversation has missing vectors")
+
+            chunk_writer.add([
+                {**r, "metadata": {**r["metadata"], "userId": userId, "convId": convId}}
+                for r in batch
+            ])
+
+            # Chunk text must be readable before its vector is queryable
+            chunk_writer.flush()
+            vector_writer.add(vectors[r["chunkId"]] for r in batch)
+            copied += len(batch)
+
+        batch = []
+        for record in chunks.iter_chunks(source["convId"]):
+            batch.append(record)
+            if len(batch) >= CLONE_FETCH_BATCH:
+                copy(batch)
+                batch = []
+
+        if batch:
+            copy(batch)
+
+    if not copied:
+        raise ValueError("source conversation has no chunks")
+
+    return copied
+
+
+def discard(*, userId: str, convId: str):
+    """
+    Removes a partial clone (best-effort) before a full ingest.
+    """
+    try:
+        get_chunk_store().delete(convId)
+        PineconeRepo().delete_namespace(f"{userId}:{convId}")
+    except Exception:
+        pass
@@ -0,0 +1,109 @@
+"""
+Token-aware embedding batcher.
+
+Packs chunks from any number of pages into embedding requests bounded
+by input count and tiktoken token count, keeps up to EMBED_CONCURRENCY
+requests in flight and hands each result back with its payloads.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List
+
+from app.repos import clients
+from app.services.tokens import count_tokens
+
+# OpenAI: 2048 inputs / 300k tokens per request. LangChain re-splits
+# above its own chunk_size (1000 inputs), so stay below both; smaller
+# token budgets give more requests to run in parallel.
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", 1000))
+EMBED_MAX_TOKENS = int(os.getenv("EMBED_MAX_TOKENS", 100_000))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+
+
+class EmbeddingBatcher:
+    """
+    add(texts, items) queues chunks; `on_batch(items, vectors)` is called
+    for every finished request, in the caller's thread (from add() when
+    the in-flight window is full, and from flush()).
+    """
+
+    def __init__(
+        self,
+        emb,
+        on_batch: Callable[[List[Any], List[List[float]]], None],
+        *,
+        model: str = clients.EMBEDDING_MODEL,
+        max_inputs: int = EMBED_MAX_INPUTS,
+        max_tokens: int = EMBED_MAX_TOKENS,
+        concurrency: int = EMBED_CONCURRENCY
+    ):
+        self._emb = emb
+        self._on_batch = on_batch
+        self._model = model
+        self._max_inputs = max_inputs
+        self._max_tokens = max_tokens
+        self._concurrency = max(1, concurrency)
+
+        self._texts: List[str] = []
+        self._items: List[Any] = []
+        self._tokens = 0
+        self._inflight: Dict[Any, List[Any]] = {}
+        self._pool = ThreadPoolExecutor(
+            max_workers=self._concurrency,
+            thread_name_prefix="embed"
+        )
+
+        self.requests = 0
+
+    def add(self, texts: List[str], items: List[Any]):
+        for text, item, tokens in zip(texts, items, count_tokens(texts, self._model)):
+            if self._texts and (
+                len(self._texts) >= self._max_inputs
+                or self._tokens + tokens > self._max_tokens
+            ):
+                self._dispatch()
+
+            self._texts.append(text)
+            self._items.append(item)
+            self._tokens += tokens
+
+    def _dispatch(self):
+        texts, items = self._texts, self._items
+        self._texts, self._items, self._tokens = [], [], 0
+
+        while len(self._inflight) >= self._concurrency:
+            done, _ = wait(self._inflight, return_when=FIRST_COMPLETED)
+            self._deliver(done)
+
+        future = self._pool.submit(self._emb.embed_documents, texts)
+        self._inflight[future] = items
+        self.requests += 1
+
+    def _deliver(self, done):
+        for future in done:
+            items = self._inflight.pop(future)
+            self._on_batch(items, future.result())
+
+    def flush(self):
+        if self._texts:
+            self._dispatch()
+
+        while self._inflight:
+            done, _ = wait(self._inflight, return_when=FIRST_COMPLETED)
+            self._deliver(done)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        return False
@@ -0,0 +1,215 @@
+"""
+Content-hash embedding cache, shared across conversations.
+
+Key: (model, dimensions, sha256(text)) → the same chunk uploaded or
+crawled into another conversation is never embedded twice.
+
+Two tiers:
+- local  → process LRU (float16 arrays)
+- shared → Redis (one key per vector, TTL) or a local SQLite file,
+           stored as raw EMBED_CACHE_DTYPE bytes
+
+cached_embeddings() is a drop-in for clients.embeddings()
+(embed_documents / embed_query and their async variants).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.repos import clients
+from app.repos.blob_store import shared_blob_store
+
+# redis | disk | memory (LRU only) | off
+EMBED_CACHE_BACKEND = os.getenv(
+    "EMBED_CACHE_BACKEND",
+    "redis" if os.getenv("REDIS_URL") else "memory"
+)
+EMBED_CACHE_DTYPE = np.dtype(os.getenv("EMBED_CACHE_DTYPE", "float16"))
+EMBED_CACHE_LOCAL_SIZE = int(os.getenv("EMBED_CACHE_LOCAL_SIZE", 10_000))
+EMBED_CACHE_TTL_SECONDS = int(os.getenv("EMBED_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embeddings.sqlite3")
+
+
+def cache_key(model: str, dimensions: Optional[int], text: str) -> str:
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f"{model}:{dimensions or 'native'}:{digest}"
+
+
+def _to_blob(vector: List[float]) -> bytes:
+    return np.asarray(vector, dtype=EMBED_CACHE_DTYPE).tobytes()
+
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=EMBED_CACHE_DTYPE)
+
+
+# -------------------------
+# Local LRU
+# -------------------------
+_local: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _local_get(key: str) -> Optional[np.ndarray]:
+    with _local_lock:
+        vec = _local.get(key)
+        if vec is not None:
+            _local.move_to_end(key)
+        return vec
+
+
+def _local_put(key: str, vec: np.ndarray):
+    with _local_lock:
+        _local[key] = vec
+        _local.move_to_end(key)
+        while len(_local) > EMBED_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+# -------------------------
+# Shared tiers
+# -------------------------
+def _shared_tier():
+    return shared_blob_store(
+        EMBED_CACHE_BACKEND,
+        namespace="emb",
+        ttl=EMBED_CACHE_TTL_SECONDS,
+        path=EMBED_CACHE_PATH,
+        table="embeddings",
+        column="vector",
+    )
+
+
+# -------------------------
+# Wrapper
+# -------------------------
+class CachedEmbeddings:
+    """
+    Same interface as OpenAIEmbeddings; only cache misses (deduplicated)
+    reach the provider. Shared-tier errors degrade to cache misses.
+    """
+
+    def __init__(self, model: str = clients.EMBEDDING_MODEL):
+        self.model = model
+
+    @property
+    def inner(self):
+        return clients.embeddings(self.model)
+
+    def _keys(self, texts: List[str]) -> List[str]:
+        dimensions = getattr(self.inner, "dimensions", None)
+        return [cache_key(self.model, dimensions, t) for t in texts]
+
+    @staticmethod
+    def _local_lookup(keys: List[str]) -> List[Optional[np.ndarray]]:
+        return [_local_get(k) for k in keys]
+
+    @staticmethod
+    def _fill(keys, found, blobs):
+        for i, blob in zip([i for i, v in enumerate(found) if v is None], blobs):
+            if blob:
+                found[i] = _from_blob(blob)
+                _local_put(keys[i], found[i])
+
+    @staticmethod
+    def _misses(texts, keys, found) -> Dict[str, str]:
+        # key → text, identical texts embedded once
+        return {keys[i]: texts[i] for i, v in enumerate(found) if v is None}
+
+    @staticmethod
+    def _remember(misses: Dict[str, str], fresh: List[List[float]]) -> Dict[str, bytes]:
+        blobs = {}
+        for key, vector in zip(misses, fresh):
+            blobs[key] = _to_blob(vector)
+            _local_put(key, _from_blob(blobs[key]))
+        return blobs
+
+    @staticmethod
+    def _result(keys, found, misses, fresh) -> List[List[float]]:
+        fresh_by_key = dict(zip(misses, fresh))
+        return [
+            list(fresh_by_key[k]) if v is None else v.astype(np.float32).tolist()
+            for k, v in zip(keys, found)
+        ]
+
+    # -------------------------
+    # Sync
+    # -------------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if EMBED_CACHE_BACKEND == "off" or not texts:
+            return self.inner.embed_documents(texts)
+
+        keys = self._keys(texts)
+        found = self._local_lookup(keys)
+        tier = _shared_tier()
+
+        if tier and any(v is None for v in found):
+            try:
+                missing = [k for k, v in zip(keys, found) if v is None]
+                self._fill(keys, found, tier.get_many(missing))
+            except Exception:
+                pass
+
+        misses = self._misses(texts, keys, found)
+        fresh = self.inner.embed_documents(list(misses.values())) if misses else []
+
+        if misses:
+            blobs = self._remember(misses, fresh)
+            if tier:
+                try:
+                    tier.put_many(blobs)
+                except Exception:
+                    pass
+
+        return self._result(keys, found, misses, fresh)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    # -------------------------
+    # Async (API event loop)
+    # -------------------------
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if EMBED_CACHE_BACKEND == "off" or not texts:
+            return await self.inner.aembed_documents(texts)
+
+        keys = self._keys(texts)
+        found = self._local_lookup(keys)
+        tier = _shared_tier()
+
+        if tier and any(v is None for v in found):
+            try:
+                missing = [k for k, v in zip(keys, found) if v is None]
+                self._fill(keys, found, await tier.aget_many(missing))
+            except Exception:
+                pass
+
+        misses = self._misses(texts, keys, found)
+        fresh = await self.inner.aembed_documents(list(misses.values())) if misses else []
+
+        if misses:
+            blobs = self._remember(misses, fresh)
+            if tier:
+                try:
+                    await tier.aput_many(blobs)
+                except Exception:
+                    pass
+
+        return self._result(keys, found, misses, fresh)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+_wrappers: Dict[str, CachedEmbeddings] = {}
+
+
+def cached_embeddings(model: str = clients.EMBEDDING_MODEL) -> CachedEmbeddings:
+    wrapper = _wrappers.get(model)
+    if wrapper is None:
+        wrapper = _wrappers.setdefault(model, CachedEmbeddings(model))
+    return wrapper
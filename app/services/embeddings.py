@@ -1,149 +1,113 @@
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.services.embedding_cache import cached_embeddings
 from app.repos.pinecone_repo import PineconeRepo
-from app.repos.firestore_repo import FirestoreRepo
-from typing import List, Optional, Dict
-import uuid
+from app.repos.chunk_store import get_chunk_store, chunk_record, ChunkWriter
+from app.services.embed_batcher import EmbeddingBatcher
+from typing import Callable, Iterable, List, Optional, Dict, Tuple
 
-# -------------------------
-# Embedding model
-# -------------------------
-emb = OpenAIEmbeddings(model="text-embedding-3-small")
+# (chunkIds, chunk texts, chunk store records, Pinecone metadata)
+ChunkGroup = Tuple[List[str], List[str], List[Dict], List[Dict]]
 
 
-def build_embeddings(
+def chunk_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1600,
+        chunk_overlap=200,
+        separators=["\n\n", "\n", " ", ""],
+    )
+
+
+def chunk_group(
     *,
     userId: str,
     convId: str,
-    texts: List[str],
     sourceType: str,
-    pages: Optional[List[int]] = None,         # PDF only
-    url: Optional[str] = None,                  # WEB (single page)
-    chunkId: Optional[str] = None,              # Optional prefix
-    metadata: Optional[List[Dict]] = None,      # 🔥 NEW (WEB micro-batch)
-):
+    cids: List[str],
+    chunks: List[str],
+    page: Optional[int] = None,
+    url: Optional[str] = None,
+) -> ChunkGroup:
     """
-    Build and upsert embeddings for BOTH:
-    - PDF
-    - Website (micro-batched)
-
-    Storage model:
-    - Pinecone: vectors + lightweight metadata ONLY
-    - Firestore: chunk text + full metadata (NO vectors)
+    Chunk store records (text + full metadata) and Pinecone metadata
+    (lightweight) for chunks of one page / document.
     """
+    records = [
+        chunk_record(cid, chunk, {
+            "userId": userId,
+            "convId": convId,
+            "chunkId": cid,
+            "sourceType": sourceType,
+            "page": page,
+            "url": url,
+        })
+        for cid, chunk in zip(cids, chunks)
+    ]
 
-    if not texts:
-        return
+    metas = []
+    for cid in cids:
+        meta = {
+            "chunkId": cid,
+            "sourceType": sourceType,
+        }
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1600,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", " ", ""],
-    )
+        if page is not None:
+            meta["page"] = page
+
+        if url:
+            meta["url"] = url
+
+        metas.append(meta)
+
+    return cids, chunks, records, metas
 
+
+def embed_stream(
+    *,
+    userId: str,
+    convId: str,
+    groups: Iterable[ChunkGroup],
+    on_embedded: Optional[Callable[[int], None]] = None,
+    on_vectors: Optional[Callable[[List[str], List[List[float]]], None]] = None,
+) -> int:
+    """
+    Embeds chunk groups as they are produced (groups may be a generator).
+
+    Chunks are packed into token-bounded embedding requests (several in
+    flight); chunk text commits and Pinecone upserts run in the
+    background meanwhile. Returns the number of chunks embedded.
+    """
     pinecone = PineconeRepo()
-    firestore = FirestoreRepo()
+    emb = cached_embeddings()
 
     namespace = f"{userId}:{convId}"
-    vectors = []
-
-    # ==================================================
-    # 🔥 WEB MICRO-BATCH MODE
-    # ==================================================
-    if sourceType == "web" and metadata:
-        for idx, text in enumerate(texts):
-            page_meta = metadata[idx]
-
-            chunks = splitter.split_text(text)
-            if not chunks:
-                continue
-
-            embeddings = emb.embed_documents(chunks)
-
-            for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-                cid = f"{page_meta['chunkId']}_{i}"
-
-                # -------- Firestore (TEXT ONLY)
-                if firestore.enabled():
-                    firestore.save_chunk(
-                        conversation_id=convId,
-                        chunk_id=cid,
-                        text=chunk,
-                        metadata={
-                            "userId": userId,
-                            "convId": convId,
-                            "chunkId": cid,
-                            "sourceType": "web",
-                            "url": page_meta["url"],
-                        }
-                    )
-
-                vectors.append({
-                    "id": cid,
-                    "values": vector,
-                    "metadata": {
-                        "chunkId": cid,
-                        "sourceType": "web",
-                        "url": page_meta["url"],
-                    },
-                })
-
-    # ==================================================
-    # PDF / SINGLE PAGE MODE (UNCHANGED)
-    # ==================================================
-    else:
-        full_text = "\n".join(texts)
-        chunks = splitter.split_text(full_text)
-
-        if not chunks:
-            return
-
-        embeddings = emb.embed_documents(chunks)
-
-        for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-            cid = (
-                f"{chunkId}_{i}" if chunkId
-                else f"chunk_{uuid.uuid4().hex}"
+    embedded = 0
+
+    with ChunkWriter(get_chunk_store(), convId) as chunk_writer, \
+            pinecone.writer(namespace) as vector_writer:
+
+        def on_batch(items: List[tuple], embeddings: List[List[float]]):
+            nonlocal embedded
+
+            # Chunk text must be readable before its vector is queryable
+            chunk_writer.flush()
+
+            vector_writer.add(
+                {"id": cid, "values": vector, "metadata": meta}
+                for (cid, meta), vector in zip(items, embeddings)
             )
 
-            if firestore.enabled():
-                firestore.save_chunk(
-                    conversation_id=convId,
-                    chunk_id=cid,
-                    text=chunk,
-                    metadata={
-                        "userId": userId,
-                        "convId": convId,
-                        "chunkId": cid,
-                        "sourceType": sourceType,
-                        "page": (
-                            pages[i]
-                            if sourceType == "pdf" and pages and i < len(pages)
-                            else None
-                        ),
-                        "url": url if sourceType == "web" else None,
-                    }
-                )
-
-            meta = {
-                "chunkId": cid,
-                "sourceType": sourceType,
-            }
-
-            if sourceType == "pdf" and pages and i < len(pages):
-                meta["page"] = pages[i]
-
-            if sourceType == "web" and url:
-                meta["url"] = url
-
-            vectors.append({
-                "id": cid,
-                "values": vector,
-                "metadata": meta,
-            })
-
-    # -------------------------
-    # Upsert once per batch
-    # -------------------------
-    if vectors:
-        pinecone.upsert(vectors=vectors, namespace=namespace)
+            if on_vectors:
+                on_vectors([cid for cid, _ in items], embeddings)
+
+            embedded += len(items)
+            if on_embedded:
+                on_embedded(embedded)
+
+        with EmbeddingBatcher(emb, on_batch) as batcher:
+            for cids, chunks, records, metas in groups:
+                # Full batches commit on their own; the rest at on_batch
+                chunk_writer.add(records)
+                batcher.add(chunks, list(zip(cids, metas)))
+
+    # Leaving the blocks flushes every writer (errors fail the job)
+    return embedded
@@ -0,0 +1,253 @@
+"""
+Streaming ingestion pipeline.
+
+    pages ──► embedding stage   (chunking → embedding → chunk store / Pinecone)
+          └─► summary stage     (summarization MAP step)
+
+SUMMARY_PRESELECT: the summary stage only measures the text; after
+embedding, the MAP step runs over representative chunks picked by
+clustering their vectors (summary_preselect), within a fixed budget.
+
+Pages are produced lazily (PDF extraction / crawl result) and fanned
+out to both stages through bounded queues, so extraction (CPU), the
+embedding requests (network) and the map LLM calls overlap. A stage
+that falls behind blocks the producer (backpressure): memory is
+bounded by the queue sizes, not by the document size.
+"""
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.repos.chunk_store import get_chunk_store
+from app.repos.clients import CHAT_MODEL
+from app.services.embeddings import chunk_splitter, chunk_group, embed_stream
+from app.services.summarizer import map_stream, map_chunks, SUMMARY_MAP_CHUNK_TOKENS
+from app.services.summary_preselect import SUMMARY_PRESELECT, map_groups
+from app.services.tokens import count_tokens
+
+INGEST_QUEUE_PAGES = int(os.getenv("INGEST_QUEUE_PAGES", 16))
+
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class Stage:
+    """
+    Runs `consume(items)` in its own thread, fed through a bounded queue.
+    put() re-raises the stage's error instead of blocking forever.
+    """
+
+    def __init__(self, name: str, consume: Callable[[Iterator], Any], maxsize: int):
+        self._consume = consume
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._aborted = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _items(self) -> Iterator:
+        while True:
+            item = self._queue.get()
+            if self._aborted:
+                # Unwind the consumer without flushing partial work
+                raise PipelineAborted()
+            if item is _DONE:
+                return
+            yield item
+
+    def _run(self):
+        try:
+            self.result = self._consume(self._items())
+        except BaseException as e:
+            self.error = e
+
+    def put(self, item):
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """
+        Signals end of input, waits for the stage, returns its result.
+        """
+        if self.error is None:
+            self.put(_DONE)
+        self._thread.join()
+
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def abort(self):
+        self._aborted = True
+        try:
+            self._queue.put_nowait(_DONE)
+        except queue.Full:
+            pass
+        self._thread.join()
+
+
+def _ref(page: Dict) -> Any:
+    """
+    What a section summary cites: page number (PDF) or URL (web).
+    """
+    return page["page"] if page.get("page") is not None else page.get("url")
+
+
+def run_pipeline(
+    *,
+    userId: str,
+    convId: str,
+    sourceType: str,
+    pages: Iterable[Dict],
+    summary_preamble: Optional[str] = None,
+    on_page: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """
+    pages: {"text", "chunkId", "page"?: int, "url"?: str}
+           (chunk ids become f"{chunkId}_{i}")
+
+    Returns the MAP result (+ "chunks" embedded) for finish_summary().
+    """
+
+    # Preselected chunks are read back from the chunk store; without one
+    # the summary stage maps the pages as they arrive instead
+    preselect = SUMMARY_PRESELECT and get_chunk_store().enabled()
+
+    # Preselect mode: chunk order, token counts, refs and vectors (float16)
+    positions: Dict[str, int] = {}
+    tokens: List[int] = []
+    refs: List[Any] = []
+    cids_in_order: List[str] = []
+    vectors: Dict[int, np.ndarray] = {}
+
+    def keep_vectors(cids: List[str], embeddings: List[List[float]]):
+        for cid, vector in zip(cids, embeddings):
+            vectors[positions[cid]] = np.asarray(vector, dtype=np.float16)
+
+    def embed(items: Iterator[Dict]) -> int:
+        splitter = chunk_splitter()
+
+        def groups():
+            for page in items:
+                chunks = splitter.split_text(page["text"])
+                if not chunks:
+                    continue
+
+                cids = [f"{page['chunkId']}_{i}" for i in range(len(chunks))]
+
+                if preselect:
+                    for cid, n in zip(cids, count_tokens(chunks, CHAT_MODEL)):
+                        positions[cid] = len(cids_in_order)
+                        cids_in_order.append(cid)
+                        tokens.append(n)
+                        refs.append(_ref(page))
+
+                yield chunk_group(
+                    userId=userId,
+                    convId=convId,
+                    sourceType=sourceType,
+                    cids=cids,
+                    chunks=chunks,
+                    page=page.get("page"),
+                    url=page.get("url"),
+                )
+
+        return embed_stream(
+            userId=userId,
+            convId=convId,
+            groups=groups(),
+            on_vectors=keep_vectors if preselect else None,
+        )
+
+    def summarize(texts: Iterator[str]) -> Dict:
+        return map_stream(texts, map_enabled=not preselect)
+
+    embed_stage = Stage("ingest-embed", embed, INGEST_QUEUE_PAGES)
+    summary_stage = Stage("ingest-summary", summarize, INGEST_QUEUE_PAGES)
+
+    try:
+        if summary_preamble:
+            summary_stage.put(summary_preamble)
+
+        for done, page in enumerate(pages, start=1):
+            embed_stage.put(page)
+            summary_stage.put((page["text"], _ref(page)))
+
+            if on_page:
+                on_page(done)
+
+        chunks = embed_stage.close()
+        result = summary_stage.close()
+
+    except BaseException:
+        embed_stage.abort()
+        summary_stage.abort()
+        raise
+
+    if result["deferred"]:
+        result["sections"] = _map_preselected(convId, cids_in_order, tokens, refs, vectors)
+        result["deferred"] = False
+
+    return {**result, "chunks": chunks}
+
+
+def _map_preselected(
+    convId: str,
+    cids: List[str],
+    tokens: List[int],
+    refs: List[Any],
+    vectors: Dict[int, np.ndarray]
+) -> List[Dict]:
+    """
+    MAP over representative chunks (k-means over the chunk vectors),
+    texts read back from the chunk store. Raises if a selected chunk
+    cannot be read back (the summary would silently miss content).
+    """
+    # Chunks without a vector (never embedded) cannot be clustered
+    keep = [i for i in range(len(cids)) if i in vectors]
+
+    groups = map_groups(
+        np.vstack([vectors[i] for i in keep]) if keep else np.empty((0, 0)),
+        [tokens[i] for i in keep],
+        chunk_tokens=SUMMARY_MAP_CHUNK_TOKENS,
+    )
+
+    store = get_chunk_store()
+    selected = [cids[keep[i]] for group in groups for i in group]
+    texts = store.get_many(convId, selected)
+
+    missing = sum(1 for text in texts if text is None)
+    if missing:
+        raise RuntimeError(
+            f"{missing} of {len(selected)} preselected chunks missing from "
+            f"the {store.name} chunk store"
+        )
+
+    map_inputs, map_refs, at = [], [], 0
+    for group in groups:
+        parts = [t for t in texts[at:at + len(group)] if t]
+        at += len(group)
+        if parts:
+            map_inputs.append("\n\n".join(parts))
+            map_refs.append(list(dict.fromkeys(
+                refs[keep[i]] for i in group if refs[keep[i]] is not None
+            )))
+
+    if not map_inputs:
+        raise RuntimeError("no preselected chunks to summarize")
+
+    return map_chunks(map_inputs, map_refs)
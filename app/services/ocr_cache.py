@@ -0,0 +1,68 @@
+"""
+OCR result cache, shared across conversations.
+
+Key: sha256 of what is drawn on the page (content stream + the raw
+image streams it paints) + DPI + language → re-ingesting the same scan
+(any file it is embedded in) never re-runs tesseract.
+
+Stored zlib-compressed in Redis (one key per page, TTL) or a local
+SQLite file. Cache errors degrade to misses.
+"""
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from app.repos.blob_store import shared_blob_store
+
+# redis | disk | off
+OCR_CACHE_BACKEND = os.getenv(
+    "OCR_CACHE_BACKEND",
+    "redis" if os.getenv("REDIS_URL") else "disk"
+)
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", 90 * 24 * 3600))
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr.sqlite3")
+
+
+def _shared_tier():
+    return shared_blob_store(
+        OCR_CACHE_BACKEND,
+        namespace="ocr",
+        ttl=OCR_CACHE_TTL_SECONDS,
+        path=OCR_CACHE_PATH,
+        table="ocr",
+        column="text",
+    )
+
+
+def get_many(keys: List[str]) -> List[Optional[str]]:
+    """
+    Cached texts aligned with keys (None → miss).
+    """
+    if not keys:
+        return []
+
+    try:
+        tier = _shared_tier()
+        if tier is None:
+            return [None] * len(keys)
+
+        return [
+            zlib.decompress(blob).decode() if blob is not None else None
+            for blob in tier.get_many(keys)
+        ]
+    except Exception:
+        return [None] * len(keys)
+
+
+def put_many(items: Dict[str, str]):
+    if not items:
+        return
+
+    try:
+        tier = _shared_tier()
+        if tier is None:
+            return
+
+        tier.put_many({k: zlib.compress(v.encode()) for k, v in items.items()})
+    except Exception:
+        pass
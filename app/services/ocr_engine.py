@@ -0,0 +1,340 @@
+"""
+Batched OCR for scanned PDFs.
+
+    pages needing OCR ──► contiguous ranges ──► pdftoppm (one call per
+    range, thread_count, grayscale, images written to disk)
+                     ──► tesseract on each image (bounded pool)
+
+Rasterizing the next range overlaps with tesseract on the current one.
+Images never become PIL objects: tesseract reads them from disk and
+each file is deleted as soon as its page is done.
+
+probe_page() decides beforehand (from the page's content stream) whether
+OCR can help at all, at which DPI, and the page's content hash for the
+OCR cache.
+"""
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Iterator, List, Tuple
+from pdf2image import convert_from_path
+from pypdf.generic import ContentStream
+import pytesseract
+import subprocess
+import tempfile
+import hashlib
+import math
+import os
+
+from app.services import ocr_cache
+
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 80))
+OCR_DPI = int(os.getenv("OCR_DPI", 220))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+# Adaptive DPI: OCR_DPI for a Letter/A4-sized page, scaled to the page's
+# long side, never above the native resolution of the scanned image
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", 150))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", 400))
+REFERENCE_LONG_SIDE_INCHES = 11
+
+# Share of the page painted by images for a page to count as scanned
+OCR_MIN_IMAGE_COVERAGE = float(os.getenv("OCR_MIN_IMAGE_COVERAGE", 0.3))
+
+# Content streams larger than this are not parsed (→ OCR as before)
+OCR_PROBE_MAX_BYTES = 2_000_000
+OCR_PROBE_MAX_DEPTH = 3
+
+TEXT_SHOW_OPERATORS = (b"Tj", b"TJ", b"'", b'"')
+
+# Path construction operators; a page drawn with at least this many of
+# them and no text or image is taken for outlined (vector) text → OCR
+PATH_OPERATORS = (b"m", b"l", b"c", b"v", b"y", b"re")
+OCR_MIN_PATH_OPERATORS = int(os.getenv("OCR_MIN_PATH_OPERATORS", 200))
+
+# Pages per pdftoppm call (bounds disk use: ~4 MB per grayscale page)
+OCR_RASTER_BATCH = int(os.getenv("OCR_RASTER_BATCH", 16))
+OCR_RASTER_THREADS = int(os.getenv("OCR_RASTER_THREADS", 2))
+
+# Concurrent tesseract processes
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+
+# -------------------------
+# Probe (is this page a scan?)
+# -------------------------
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + b * c2, a * b2 + b * d2,
+        c * a2 + d * c2, c * b2 + d * d2,
+        e * a2 + f * c2 + e2, e * b2 + f * d2 + f2,
+    )
+
+
+def _shown_chars(operands) -> int:
+    total = 0
+    for operand in operands:
+        if isinstance(operand, (str, bytes)):
+            total += len(operand)
+        elif isinstance(operand, list):
+            total += _shown_chars(operand)
+    return total
+
+
+def _paint_image(ctm, width_pixels: float, data: bytes, stats: Dict, digest):
+    # An image fills the unit square mapped by the CTM
+    digest.update(data)
+    stats["images"] += 1
+
+    area = abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+    stats["covered"] += area
+
+    width_points = math.hypot(ctm[0], ctm[1])
+    if width_points > 0 and area >= stats["pageArea"] * OCR_MIN_IMAGE_COVERAGE:
+        native = width_pixels / (width_points / 72)
+        stats["nativeDpi"] = max(stats["nativeDpi"], native)
+
+
+def _walk(pdf, stream, resources, ctm, stats: Dict, digest, depth: int):
+    """
+    Images painted (XObject or inline: page share, native DPI), glyphs
+    shown, path operators, and the content hash of one content stream
+    (+ Form XObjects it paints).
+    """
+    xobjects = {}
+    if resources is not None and "/XObject" in resources:
+        xobjects = resources["/XObject"].get_object()
+
+    stack = []
+    for operands, operator in stream.operations:
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q":
+            ctm = stack.pop() if stack else ctm
+        elif operator == b"cm":
+            ctm = _multiply(tuple(float(x) for x in operands), ctm)
+        elif operator in TEXT_SHOW_OPERATORS:
+            stats["shown"] += _shown_chars(operands)
+        elif operator in PATH_OPERATORS:
+            stats["paths"] += 1
+        elif operator == b"INLINE IMAGE":
+            # BI … ID … EI, parsed by pypdf into {"settings", "data"}
+            settings = operands["settings"]
+            width = settings.get("/W", settings.get("/Width", 0))
+            _paint_image(ctm, float(width), operands["data"], stats, digest)
+        elif operator == b"Do" and operands and operands[0] in xobjects:
+            xobj = xobjects[operands[0]].get_object()
+            subtype = xobj.get("/Subtype")
+
+            if subtype == "/Image":
+                _paint_image(ctm, float(xobj.get("/Width", 0)), xobj.get_data(), stats, digest)
+
+            elif subtype == "/Form" and depth < OCR_PROBE_MAX_DEPTH:
+                matrix = tuple(float(x) for x in xobj.get("/Matrix", (1, 0, 0, 1, 0, 0)))
+                digest.update(xobj.get_data())
+                _walk(
+                    pdf,
+                    ContentStream(xobj, pdf),
+                    xobj.get("/Resources"),
+                    _multiply(matrix, ctm),
+                    stats,
+                    digest,
+                    depth + 1,
+                )
+
+
+def adaptive_dpi(width_points: float, height_points: float, native_dpi: float = 0) -> int:
+    long_side = max(width_points, height_points) / 72 or REFERENCE_LONG_SIDE_INCHES
+    dpi = OCR_DPI * REFERENCE_LONG_SIDE_INCHES / long_side
+
+    if native_dpi:
+        # Rendering above the scan's own resolution adds no detail
+        dpi = min(dpi, native_dpi)
+
+    return int(min(max(dpi, OCR_MIN_DPI), OCR_MAX_DPI))
+
+
+def probe_page(page) -> Dict:
+    """
+    {"ocr", "dpi", "key"} for a pypdf page with too little text.
+
+    OCR can help when images cover ≥ OCR_MIN_IMAGE_COVERAGE of the page
+    (a scan), when text is drawn but does not extract (fonts without
+    a Unicode mapping), or when the page draws no text and no image but
+    many paths (text converted to outlines). Blank pages, dividers and
+    short title pages are skipped. Unparseable pages → OCR without
+    caching.
+    """
+    fallback = {"ocr": True, "dpi": OCR_DPI, "key": None}
+
+    try:
+        box = page.mediabox
+        width, height = float(box.width), float(box.height)
+
+        contents = page.get_contents()
+        if contents is None:
+            return {"ocr": False, "dpi": OCR_DPI, "key": None}
+
+        data = contents.get_data()
+        if len(data) > OCR_PROBE_MAX_BYTES:
+            return fallback
+
+        stats = {
+            "shown": 0,
+            "images": 0,
+            "paths": 0,
+            "covered": 0.0,
+            "nativeDpi": 0.0,
+            "pageArea": width * height,
+        }
+        digest = hashlib.sha256(data)
+        _walk(page.pdf, contents, page.get("/Resources"), (1, 0, 0, 1, 0, 0), stats, digest, 0)
+
+    except Exception:
+        return fallback
+
+    scanned = stats["covered"] >= stats["pageArea"] * OCR_MIN_IMAGE_COVERAGE
+    unmapped_text = stats["shown"] >= OCR_MIN_TEXT_CHARS
+    outlined_text = (
+        not stats["shown"]
+        and not stats["images"]
+        and stats["paths"] >= OCR_MIN_PATH_OPERATORS
+    )
+
+    dpi = adaptive_dpi(width, height, stats["nativeDpi"])
+    digest.update(f"\0{dpi}\0{OCR_LANG}".encode())
+
+    return {"ocr": scanned or unmapped_text or outlined_text, "dpi": dpi, "key": digest.hexdigest()}
+
+
+# -------------------------
+# Rasterize + tesseract
+# -------------------------
+def contiguous_ranges(pages: List[Tuple[int, int]], max_len: int) -> List[Tuple[int, int, int]]:
+    """
+    (page, dpi) → (first, last, dpi) runs of consecutive pages sharing
+    a DPI, at most max_len pages each.
+    """
+    ranges = []
+
+    for page, dpi in sorted(pages):
+        if ranges:
+            first, last, run_dpi = ranges[-1]
+            if page == last + 1 and dpi == run_dpi and page - first < max_len:
+                ranges[-1] = (first, page, dpi)
+                continue
+        ranges.append((page, page, dpi))
+
+    return ranges
+
+
+def _rasterize(pdf_path: str, first: int, last: int, dpi: int, folder: str) -> List[str]:
+    """
+    Image paths of pages first..last (in order), one poppler invocation
+    per thread.
+    """
+    return convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=first,
+        last_page=last,
+        grayscale=True,
+        thread_count=min(OCR_RASTER_THREADS, last - first + 1),
+        output_folder=folder,
+        output_file=f"p{first}",
+        paths_only=True,
+    )
+
+
+def _tesseract_env() -> Dict[str, str]:
+    # tesseract's own OpenMP threads would oversubscribe the pool; the
+    # limit is set for the tesseract process only, not for this one
+    return {**os.environ, "OMP_THREAD_LIMIT": os.environ.get("OMP_THREAD_LIMIT", "1")}
+
+
+def _tesseract(image_path: str) -> str:
+    """
+    tesseract run directly (what pytesseract.image_to_string does for a
+    file path), so the process gets its own environment.
+    """
+    try:
+        done = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, image_path, "stdout", "-l", OCR_LANG],
+            env=_tesseract_env(),
+            capture_output=True,
+            check=True,
+        )
+        return done.stdout.decode("utf-8", errors="replace").strip()
+    except Exception:
+        return ""
+    finally:
+        try:
+            os.remove(image_path)
+        except Exception:
+            pass
+
+
+def _run(pdf_path: str, pages: List[Tuple[int, int]]) -> Iterator[Tuple[int, str]]:
+    if not pages:
+        return
+
+    ranges = contiguous_ranges(pages, OCR_RASTER_BATCH)
+
+    with tempfile.TemporaryDirectory(prefix="ocr-") as folder, \
+            ThreadPoolExecutor(max_workers=1) as raster, \
+            ThreadPoolExecutor(max_workers=OCR_WORKERS) as workers:
+
+        def start(first: int, last: int, dpi: int) -> Future:
+            return raster.submit(_rasterize, pdf_path, first, last, dpi, folder)
+
+        rasterized = start(*ranges[0])
+
+        for n, (first, last, _) in enumerate(ranges):
+            try:
+                paths = rasterized.result()
+            except Exception:
+                paths = []
+
+            # Next range rasterizes while tesseract runs on this one
+            if n + 1 < len(ranges):
+                rasterized = start(*ranges[n + 1])
+
+            texts: Dict[int, Future] = {
+                page: workers.submit(_tesseract, path)
+                for page, path in zip(range(first, last + 1), paths)
+            }
+
+            for page in range(first, last + 1):
+                future = texts.get(page)
+                yield page, future.result() if future else ""
+
+
+def ocr_pages(pdf_path: str, pages: List[Dict]) -> Iterator[Tuple[int, str]]:
+    """
+    pages: [{"page" (1-based), "dpi", "key"?}] → (page, text) for each,
+    in page order. Cached pages (by content key) skip rasterization and
+    tesseract. A page whose range cannot be rasterized, or that
+    tesseract fails on, comes back with "" (and is not cached).
+    """
+    pages = sorted(pages, key=lambda p: p["page"])
+    keys = {p["page"]: p.get("key") for p in pages}
+
+    cached = dict(zip(
+        [p["page"] for p in pages if keys[p["page"]]],
+        ocr_cache.get_many([keys[p["page"]] for p in pages if keys[p["page"]]])
+    ))
+
+    run = _run(pdf_path, [
+        (p["page"], p["dpi"]) for p in pages if cached.get(p["page"]) is None
+    ])
+
+    for p in pages:
+        text = cached.get(p["page"])
+        if text is not None:
+            yield p["page"], text
+            continue
+
+        page, text = next(run)
+        if text and keys[page]:
+            ocr_cache.put_many({keys[page]: text})
+        yield page, text
@@ -1,19 +1,302 @@
 # app/repos/pdf_extractor.py
 from pypdf import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import threading
+import signal
+import mmap
+import time
 import os
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from app.services.source_fetcher import SpooledDownload
+from app.services.ocr_engine import (
+    ocr_pages,
+    probe_page,
+    OCR_DPI,
+    OCR_MIN_TEXT_CHARS,
+    OCR_RASTER_BATCH,
+)
 
 
 OCR_ENABLE = os.getenv("OCR_ENABLE", "true").lower() == "true"
-OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 80))
-OCR_DPI = int(os.getenv("OCR_DPI", 220))
-OCR_LANG = os.getenv("OCR_LANG", "eng")
 
+# Pages whose text is extracted before their OCR batch is started
+# (pages needing OCR inside one window share pdftoppm calls)
+OCR_WINDOW_PAGES = int(os.getenv("OCR_WINDOW_PAGES", 2 * OCR_RASTER_BATCH))
+
+# Parallel text extraction (pypdf is pure Python → one core per process)
+# 1 → serial, in the calling process
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", 1))
+PDF_EXTRACT_MIN_PAGES = int(os.getenv("PDF_EXTRACT_MIN_PAGES", 32))
+PDF_EXTRACT_RANGE_PAGES = int(os.getenv("PDF_EXTRACT_RANGE_PAGES", 8))
+PDF_EXTRACT_PAGE_TIMEOUT = float(os.getenv("PDF_EXTRACT_PAGE_TIMEOUT", 20))
+
+
+# (text, seconds, timedOut, OCR probe or None when the text is enough)
+PageText = Tuple[str, float, bool, Optional[Dict]]
+
+
+def _read_page(page) -> Tuple[str, Optional[Dict]]:
+    try:
+        text = (page.extract_text() or "").strip()
+    except Exception:
+        text = ""
+
+    probe = None
+    if OCR_ENABLE and len(text) < OCR_MIN_TEXT_CHARS:
+        probe = probe_page(page)
+
+    return text, probe
+
+
+# -------------------------
+# Text extraction workers
+# -------------------------
+class PageTimeout(BaseException):
+    # Not an Exception: the broad handlers in _read_page, probe_page and
+    # pypdf itself must not swallow it
+    pass
+
+
+_worker_reader = None
+
+
+def _init_worker(path: str):
+    """
+    Pool initializer: each process opens the PDF itself, memory-mapped
+    (pages are parsed straight from the OS page cache, nothing pickled).
+    """
+    global _worker_reader
+
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    _worker_reader = PdfReader(data)
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+
+def _timed_page(page) -> PageText:
+    """
+    A page running past PDF_EXTRACT_PAGE_TIMEOUT is given up (no text).
+    SIGALRM must be handled by _on_alarm.
+    """
+    start = time.perf_counter()
+    timed_out = False
+
+    signal.setitimer(signal.ITIMER_REAL, PDF_EXTRACT_PAGE_TIMEOUT)
+    try:
+        text, probe = _read_page(page)
+    except PageTimeout:
+        text, probe, timed_out = "", None, True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return text, time.perf_counter() - start, timed_out, probe
+
+
+def _extract_range(first: int, last: int) -> List[PageText]:
+    """
+    PageText for pages [first, last) (0-based).
+    """
+    return [_timed_page(_worker_reader.pages[i]) for i in range(first, last)]
+
+
+def _can_time_pages() -> bool:
+    # Signal handlers can only be installed from the main thread
+    return (
+        hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+
+
+class PdfPages:
+    """
+    Page-by-page extraction (OCR fallback if text is too small).
+
+        with PdfPages(download_or_bytes) as pdf:
+            pdf.page_count
+            for page in pdf:      # {"page", "text", "ocr", "seconds", "timedOut"}
+                ...
+
+    Pages are produced lazily, so callers can process page N while
+    page N+1 is being extracted. With PDF_EXTRACT_PROCESSES > 1, text
+    of large PDFs is extracted ahead by a process pool (page order is
+    kept; "seconds" is the extraction time of the page, without OCR).
+    Pages are handed out in windows of OCR_WINDOW_PAGES so the scanned
+    ones can be OCR'd as a batch.
+
+    pypdf reads the PDF in place (memory / memory-mapped download); a
+    file is only written when poppler or the worker processes need a
+    path, and a SpooledDownload that is already on disk is reused.
+    Only the current window of page texts is held in memory.
+    """
+
+    def __init__(self, source: Union[bytes, SpooledDownload]):
+        # Bytes are wrapped (not copied); a caller's download is not ours to close
+        self._owned = not isinstance(source, SpooledDownload)
+        self._source = SpooledDownload.wrap(source) if self._owned else source
+
+        try:
+            self._reader = PdfReader(self._source.stream())
+            self.page_count = len(self._reader.pages)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def path(self) -> str:
+        return self._source.path
+
+    def _serial_texts(self, first: int) -> Iterator[PageText]:
+        """
+        Pages from `first` on, in this process. On the main thread each
+        page gets the PDF_EXTRACT_PAGE_TIMEOUT alarm too (the handler is
+        only installed while a page is read).
+        """
+        for page in self._reader.pages[first:]:
+            if not _can_time_pages():
+                start = time.perf_counter()
+                text, probe = _read_page(page)
+                yield text, time.perf_counter() - start, False, probe
+                continue
+
+            previous = signal.signal(signal.SIGALRM, _on_alarm)
+            try:
+                result = _timed_page(page)
+            finally:
+                signal.signal(signal.SIGALRM, previous)
+
+            yield result
+
+    def _parallel_texts(self, processes: int) -> Iterator[PageText]:
+        """
+        Page ranges across a process pool, results in page order. At
+        most 2 ranges per process are in flight (bounded memory when
+        the consumer is slower). If the pool cannot start (e.g. inside
+        a daemonic Celery prefork child) or breaks, the remaining pages
+        are extracted serially; the pages of the range that broke it
+        (e.g. a worker crashing on one of them) are reported as timed
+        out rather than parsed again in this process.
+        """
+        step = PDF_EXTRACT_RANGE_PAGES
+        ranges = deque(
+            (first, min(first + step, self.page_count))
+            for first in range(0, self.page_count, step)
+        )
+        done = 0
+        broken = None
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(processes, len(ranges)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.path,),
+            ) as pool:
+                in_flight = deque()
+
+                try:
+                    while ranges or in_flight:
+                        while ranges and len(in_flight) < 2 * processes:
+                            pages = ranges.popleft()
+                            in_flight.append((pages, pool.submit(_extract_range, *pages)))
+
+                        broken, future = in_flight.popleft()
+                        results = future.result()
+                        broken = None
+
+                        for result in results:
+                            done += 1
+                            yield result
+                finally:
+                    for _, future in in_flight:
+                        future.cancel()
+
+        except (GeneratorExit, KeyboardInterrupt):
+            raise
+        except Exception:
+            if broken is not None:
+                for _ in range(*broken):
+                    yield "", 0.0, True, None
+                done = broken[1]
+
+            yield from self._serial_texts(done)
+
+    def _texts(self) -> Iterator[PageText]:
+        if PDF_EXTRACT_PROCESSES > 1 and self.page_count >= PDF_EXTRACT_MIN_PAGES:
+            return self._parallel_texts(PDF_EXTRACT_PROCESSES)
+        return self._serial_texts(0)
+
+    def _with_ocr(self, window: List[Tuple[int, PageText]]) -> Iterator[Dict]:
+        """
+        OCR for every page of the window the probe says OCR can help,
+        in one batch (see ocr_engine); pages come out in order as soon
+        as their OCR is done.
+        """
+        requests = []
+        for page_num, (raw, _, timed_out, probe) in window:
+            if timed_out and OCR_ENABLE:
+                # Never probed → OCR as before, uncached
+                probe = {"ocr": True, "dpi": OCR_DPI, "key": None}
+            if probe and probe["ocr"]:
+                requests.append({"page": page_num, "dpi": probe["dpi"], "key": probe["key"]})
+
+        needs_ocr = [r["page"] for r in requests]
+        # .path may write the PDF to disk → only when something needs OCR
+        ocr_texts = ocr_pages(self.path, requests) if requests else iter(())
+
+        for page_num, (raw, seconds, timed_out, _) in window:
+            ocr = False
+
+            if needs_ocr and page_num == needs_ocr[0]:
+                needs_ocr.pop(0)
+                _, ocr_text = next(ocr_texts)
 
-def extract_pages(pdf_bytes: bytes) -> Tuple[List[str], int, int, List[int]]:
+                if len(ocr_text) > len(raw):
+                    raw = ocr_text
+                    ocr = True
+
+            yield {
+                "page": page_num,
+                "text": raw,
+                "ocr": ocr,
+                "seconds": round(seconds, 3),
+                "timedOut": timed_out,
+            }
+
+    def __iter__(self) -> Iterator[Dict]:
+        window = []
+
+        for i, text in enumerate(self._texts()):
+            window.append((i + 1, text))
+
+            if len(window) >= OCR_WINDOW_PAGES:
+                yield from self._with_ocr(window)
+                window = []
+
+        yield from self._with_ocr(window)
+
+    def close(self):
+        if self._owned:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def extract_pages(
+    source: Union[bytes, SpooledDownload]
+) -> Tuple[List[str], int, int, List[int]]:
     """
     Extract text from PDF pages.
     OCR fallback if text is too small.
@@ -28,55 +311,13 @@ def extract_pages(pdf_bytes: bytes) -> Tuple[List[str], int, int, List[int]]:
     texts: List[str] = []
     ocr_pages: List[int] = []
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
-        f.write(pdf_bytes)
-        pdf_path = f.name
-
-    try:
-        reader = PdfReader(pdf_path)
-        pages = len(reader.pages)
-
-        for i, page in enumerate(reader.pages):
-            page_num = i + 1
-
-            try:
-                raw = (page.extract_text() or "").strip()
-            except Exception:
-                raw = ""
-
-            needs_ocr = (
-                OCR_ENABLE
-                and len(raw) < OCR_MIN_TEXT_CHARS
-            )
-
-            if needs_ocr:
-                try:
-                    images = convert_from_path(
-                        pdf_path,
-                        dpi=OCR_DPI,
-                        first_page=page_num,
-                        last_page=page_num,
-                    )
-                    ocr_text = pytesseract.image_to_string(
-                        images[0],
-                        lang=OCR_LANG
-                    ).strip()
-
-                    if len(ocr_text) > len(raw):
-                        raw = ocr_text
-                        ocr_pages.append(page_num)
-                except Exception:
-                    pass
-
-            texts.append(raw)
+    with PdfPages(source) as pdf:
+        for page in pdf:
+            texts.append(page["text"])
+            if page["ocr"]:
+                ocr_pages.append(page["page"])
 
         full_text = "\n\n".join(t for t in texts if t.strip())
         total_words = len(full_text.split())
 
-        return texts, pages, total_words, ocr_pages
-
-    finally:
-        try:
-            os.remove(pdf_path)
-        except Exception:
-            pass
+        return texts, pdf.page_count, total_words, ocr_pages
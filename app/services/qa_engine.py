@@ -1,10 +1,18 @@
 # app/repos/qa_engine.py
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.repos import clients
 from app.repos.pinecone_repo import PineconeRepo
-from app.repos.firestore_repo import FirestoreRepo
+from app.repos.firestore_repo import FirestoreRepo, AsyncFirestoreRepo
+from app.repos.chunk_store import get_chunk_store
+from app.services.embedding_cache import cached_embeddings
+from app.services.qa_router import use_router, route_question, skips_summary
+from app.services.section_index import SECTION_INDEX_ENABLE, top_sections
 from dotenv import load_dotenv
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional, Set, AsyncIterator, Awaitable, Callable
 
 load_dotenv()
 
@@ -18,39 +26,23 @@ def estimate_tokens(text: str) -> int:
     return int(len(text) / 4)
 
 
-# ----------------------------------------
-# LLM + EMBEDDINGS
-# ----------------------------------------
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.2
-)
-
-emb = OpenAIEmbeddings(
-    model="text-embedding-3-small"
-)
-
 NO_ANSWER = "Not enough information in the summary to answer that."
 NO_DOC_ANSWER = "Not enough information in the document to answer that."
+NO_SECTION_ANSWER = "Not enough information in the section summaries to answer that."
 
+RAG_TOP_K = 6
 
-# ----------------------------------------
-# MAIN QA FUNCTION
-# ----------------------------------------
-def answer_question(
-    *,
-    summary: str,
-    question: str,
-    userId: str,
-    convId: str
-) -> Tuple[str, str, List[Dict]]:
+# Speculative RAG: start retrieval (embed → Pinecone → chunks) together
+# with the summary call instead of after it. Lower p95 for questions that
+# fall through to RAG, one wasted embedding + query for those that don't.
+QA_SPECULATIVE_RAG = os.getenv("QA_SPECULATIVE_RAG", "false").lower() == "true"
 
-    firestore = FirestoreRepo()
 
-    # ----------------------------------
-    # STEP 1: SUMMARY-ONLY ANSWER
-    # ----------------------------------
-    summary_prompt = f"""
+# ----------------------------------------
+# PROMPTS + CONTEXT (shared by sync / async)
+# ----------------------------------------
+def _summary_prompt(summary: str, question: str) -> str:
+    return f"""
 You must answer ONLY using the summary below.
 
 If the summary does not contain the answer,
@@ -64,84 +56,119 @@ QUESTION:
 {question}
 """
 
-    summary_response = llm.invoke(summary_prompt)
-    summary_ans = summary_response.content.strip()
 
-    if summary_ans != NO_ANSWER:
-        input_tokens = estimate_tokens(summary_prompt)
-        output_tokens = estimate_tokens(summary_ans)
+def _rag_prompt(summary: str, context: str, question: str) -> str:
+    return f"""
+Answer using ONLY the provided context.
+Use the summary only for high-level framing.
 
-        print("Incrementing tokens (SUMMARY):", input_tokens, output_tokens)
+If the answer is not supported, say exactly:
+"{NO_DOC_ANSWER}"
 
-        firestore.update(convId, {
-            "lastQuestion": question,
-            "lastAnswer": summary_ans
-        })
+Include citations like (p. X) or (source: URL).
 
-        firestore.increment_tokens(
-            convId,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens
-        )
+SUMMARY:
+{summary}
 
-        return summary_ans, "summary", []
+CONTEXT:
+{context}
 
-    # ----------------------------------
-    # STEP 2: RAG FALLBACK
-    # ----------------------------------
-    q_vec = emb.embed_query(question)
-    namespace = f"{userId}:{convId}"
+QUESTION:
+{question}
+"""
 
-    pinecone = PineconeRepo()
 
-    res = pinecone.query(
-        vector=q_vec,
-        namespace=namespace,
-        top_k=6
-    )
+def _section_prompt(context: str, question: str) -> str:
+    return f"""
+You must answer ONLY using the section summaries below.
 
-    # ----------------------------------
-    # NO DOCUMENT MATCH
-    # ----------------------------------
-    if not res.matches:
-        output_text = NO_DOC_ANSWER
+If the section summaries do not contain the answer,
+respond EXACTLY with this sentence and nothing else:
+"{NO_SECTION_ANSWER}"
 
-        input_tokens = estimate_tokens(question)
-        output_tokens = estimate_tokens(output_text)
+Include citations like (p. X) or (source: URL).
 
-        print("Incrementing tokens (NO_DOC):", input_tokens, output_tokens)
+SECTION SUMMARIES:
+{context}
 
-        firestore.update(convId, {
-            "lastQuestion": question,
-            "lastAnswer": output_text
-        })
+QUESTION:
+{question}
+"""
 
-        firestore.increment_tokens(
-            convId,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens
-        )
 
-        return NO_DOC_ANSWER, "rag", []
+def _section_context(
+    sections: List[Dict],
+    sourceType: Optional[str]
+) -> Tuple[List[str], List[Dict], Set[str]]:
+    """
+    Section summaries (section_index.top_sections) → prompt blocks,
+    API sources and citation refs, like _build_context.
+    """
+    context_blocks = []
+    sources = []
+    cited_refs = set()
+
+    for section in sections:
+        refs = section.get("refs") or []
+        score = round(section["score"], 4)
 
+        if sourceType == "pdf":
+            if not refs:
+                ref = "p. ?"
+            elif len(refs) == 1:
+                ref = f"p. {refs[0]}"
+            else:
+                ref = f"pp. {refs[0]}-{refs[-1]}"
+
+            context_blocks.append(f"({ref})\n{section['text']}")
+            cited_refs.add(ref)
+
+            sources.append({
+                "type": "pdf",
+                "page": refs[0] if refs else None,
+                "pages": refs,
+                "sectionId": section["id"],
+                "score": score
+            })
+
+        else:
+            urls = refs or ["web"]
+            context_blocks.append(f"(source: {', '.join(urls)})\n{section['text']}")
+            cited_refs.update(urls)
+
+            sources.append({
+                "type": "web",
+                "url": refs[0] if refs else None,
+                "urls": refs,
+                "sectionId": section["id"],
+                "score": score
+            })
+
+    return context_blocks, sources, cited_refs
+
+
+def _match_chunk_ids(matches) -> List[Optional[str]]:
+    return [(m.metadata or {}).get("chunkId") for m in matches]
+
+
+def _build_context(
+    matches,
+    texts: List[Optional[str]]
+) -> Tuple[List[str], List[Dict], Set[str]]:
+    """
+    Turns Pinecone matches + their chunk texts (same order) into
+    prompt blocks, API sources and citation refs.
+    """
     context_blocks = []
     sources = []
     cited_refs = set()
 
-    for m in res.matches:
+    for m, text in zip(matches, texts):
         md = m.metadata or {}
         chunk_id = md.get("chunkId")
         source_type = md.get("sourceType")
 
-        if not chunk_id:
-            continue
-
-        text = firestore.get_chunk(
-            conversation_id=convId,
-            chunk_id=chunk_id
-        )
-
-        if not text:
+        if not chunk_id or not text:
             continue
 
         if source_type == "pdf":
@@ -170,53 +197,754 @@ QUESTION:
                 "score": round(m.score, 4)
             })
 
-    if not context_blocks:
-        return NO_DOC_ANSWER, "rag", []
+    return context_blocks, sources, cited_refs
 
-    context = "\n\n---\n\n".join(context_blocks)
 
-    rag_prompt = f"""
-Answer using ONLY the provided context.
-Use the summary only for high-level framing.
+def _with_citations(answer: str, cited_refs: Set[str]) -> str:
+    if cited_refs:
+        answer += "\n\nSources: " + ", ".join(sorted(cited_refs))
+    return answer
 
-If the answer is not supported, say exactly:
-"{NO_DOC_ANSWER}"
 
-Include citations like (p. X) or (source: URL).
+def _record(
+    firestore: FirestoreRepo,
+    convId: str,
+    question: str,
+    answer: str,
+    input_tokens: int,
+    output_tokens: int,
+    label: str,
+    system: bool
+):
+    """
+    system=True (precomputed answers): tokens go to the system counters,
+    lastQuestion / lastAnswer are left alone.
+    """
+    print(f"Incrementing tokens ({label}):", input_tokens, output_tokens)
+
+    if system:
+        firestore.increment_system_tokens(
+            convId,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
+        )
+        return
 
-SUMMARY:
-{summary}
+    firestore.update(convId, {
+        "lastQuestion": question,
+        "lastAnswer": answer
+    })
 
-CONTEXT:
-{context}
+    firestore.increment_tokens(
+        convId,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens
+    )
 
-QUESTION:
-{question}
-"""
 
-    rag_response = llm.invoke(rag_prompt)
-    rag_answer = rag_response.content.strip()
+# ----------------------------------------
+# MAIN QA FUNCTION
+# ----------------------------------------
+def answer_question(
+    *,
+    summary: str,
+    question: str,
+    userId: str,
+    convId: str,
+    system: bool = False
+) -> Tuple[str, str, List[Dict]]:
 
-    if cited_refs:
-        rag_answer += "\n\nSources: " + ", ".join(sorted(cited_refs))
+    firestore = FirestoreRepo()
+    llm = clients.chat_llm()
 
     # ----------------------------------
-    # TOKEN CALCULATION (RAG)
+    # STEP 1: SUMMARY-ONLY ANSWER
     # ----------------------------------
-    input_tokens = estimate_tokens(rag_prompt)
-    output_tokens = estimate_tokens(rag_answer)
+    summary_prompt = _summary_prompt(summary, question)
 
-    print("Incrementing tokens (RAG):", input_tokens, output_tokens)
+    summary_response = llm.invoke(summary_prompt)
+    summary_ans = summary_response.content.strip()
 
-    firestore.update(convId, {
+    if summary_ans != NO_ANSWER:
+        _record(
+            firestore, convId, question, summary_ans,
+            estimate_tokens(summary_prompt),
+            estimate_tokens(summary_ans),
+            "SUMMARY",
+            system
+        )
+        return summary_ans, "summary", []
+
+    q_vec = cached_embeddings().embed_query(question)
+
+    # ----------------------------------
+    # STEP 2: SECTION SUMMARIES
+    # ----------------------------------
+    if SECTION_INDEX_ENABLE:
+        index = firestore.get_sections(convId)
+        sections = top_sections(q_vec, index)
+
+        if sections:
+            context_blocks, sources, cited_refs = _section_context(
+                sections, index.get("sourceType")
+            )
+            section_prompt = _section_prompt(
+                "\n\n---\n\n".join(context_blocks),
+                question
+            )
+
+            section_ans = llm.invoke(section_prompt).content.strip()
+
+            if section_ans != NO_SECTION_ANSWER:
+                section_answer = _with_citations(section_ans, cited_refs)
+
+                _record(
+                    firestore, convId, question, section_answer,
+                    estimate_tokens(section_prompt),
+                    estimate_tokens(section_answer),
+                    "SECTION",
+                    system
+                )
+                return section_answer, "section", sources
+
+    # ----------------------------------
+    # STEP 3: RAG FALLBACK
+    # ----------------------------------
+    namespace = f"{userId}:{convId}"
+
+    pinecone = PineconeRepo()
+
+    res = pinecone.query(
+        vector=q_vec,
+        namespace=namespace,
+        top_k=RAG_TOP_K
+    )
+
+    # ----------------------------------
+    # NO DOCUMENT MATCH
+    # ----------------------------------
+    if not res.matches:
+        _record(
+            firestore, convId, question, NO_DOC_ANSWER,
+            estimate_tokens(question),
+            estimate_tokens(NO_DOC_ANSWER),
+            "NO_DOC",
+            system
+        )
+        return NO_DOC_ANSWER, "rag", []
+
+    texts = get_chunk_store().get_many(convId, _match_chunk_ids(res.matches))
+
+    context_blocks, sources, cited_refs = _build_context(res.matches, texts)
+
+    if not context_blocks:
+        return NO_DOC_ANSWER, "rag", []
+
+    context = "\n\n---\n\n".join(context_blocks)
+
+    rag_prompt = _rag_prompt(summary, context, question)
+
+    rag_response = llm.invoke(rag_prompt)
+    rag_answer = _with_citations(rag_response.content.strip(), cited_refs)
+
+    _record(
+        firestore, convId, question, rag_answer,
+        estimate_tokens(rag_prompt),
+        estimate_tokens(rag_answer),
+        "RAG",
+        system
+    )
+    return rag_answer, "rag", sources
+
+
+# ----------------------------------------
+# PRECOMPUTED ANSWERS (post-ingest)
+# ----------------------------------------
+def precompute_answers(
+    *,
+    summary: str,
+    questions: List[str],
+    userId: str,
+    convId: str
+) -> List[Dict]:
+    """
+    Answers the suggested questions in parallel.
+    The user never asked them: token usage goes to the system counters
+    and lastQuestion / lastAnswer are left alone.
+    Questions that fail are skipped.
+    """
+
+    def answer_one(question: str) -> Optional[Dict]:
+        try:
+            answer, mode, sources = answer_question(
+                summary=summary,
+                question=question,
+                userId=userId,
+                convId=convId,
+                system=True
+            )
+        except Exception:
+            return None
+
+        return {
+            "question": question,
+            "answer": answer,
+            "answerMode": mode,
+            "sources": sources,
+        }
+
+    if not questions:
+        return []
+
+    with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+        answers = list(pool.map(answer_one, questions))
+
+    return [a for a in answers if a]
+
+
+# ----------------------------------------
+# ASYNC QA FUNCTION (event loop, no threadpool)
+# ----------------------------------------
+async def _arecord(
+    firestore: AsyncFirestoreRepo,
+    convId: str,
+    question: str,
+    answer: str,
+    input_tokens: int,
+    output_tokens: int,
+    label: str
+):
+    print(f"Incrementing tokens ({label}):", input_tokens, output_tokens)
+
+    await firestore.update(convId, {
         "lastQuestion": question,
-        "lastAnswer": rag_answer
+        "lastAnswer": answer
     })
 
-    firestore.increment_tokens(
+    await firestore.increment_tokens(
         convId,
         input_tokens=input_tokens,
         output_tokens=output_tokens
     )
 
-    return rag_answer, "rag", sources
+
+# Usage records still running after their request was cancelled
+_background: Set[asyncio.Task] = set()
+
+
+async def _arecord_shielded(*args):
+    """
+    _arecord that completes even when the awaiting request is cancelled
+    (client gone mid-stream).
+    """
+    task = asyncio.ensure_future(_arecord(*args))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    await asyncio.shield(task)
+
+
+async def _aretrieve(
+    question: str,
+    userId: str,
+    convId: str,
+    q_vec: Optional[List[float]] = None
+) -> Optional[Tuple[List[str], List[Dict], Set[str]]]:
+    """
+    RAG retrieval: question embedding → Pinecone → chunk texts.
+    Returns None when Pinecone has no match at all.
+    """
+    if q_vec is None:
+        q_vec = await cached_embeddings().aembed_query(question)
+
+    res = await PineconeRepo().aquery(
+        vector=q_vec,
+        namespace=f"{userId}:{convId}",
+        top_k=RAG_TOP_K
+    )
+
+    if not res.matches:
+        return None
+
+    texts = await get_chunk_store().aget_many(convId, _match_chunk_ids(res.matches))
+
+    return _build_context(res.matches, texts)
+
+
+class _Speculation:
+    """
+    QA_SPECULATIVE_RAG: question embedding and RAG retrieval started
+    together with the summary call. The embedding is shared with the
+    section step, so the question is embedded once.
+    """
+
+    def __init__(self, question: str, userId: str, convId: str, q_vec: Optional[List[float]]):
+        self.embedding = asyncio.ensure_future(_aembed(question, q_vec))
+        self.retrieval = asyncio.ensure_future(self._retrieve(question, userId, convId))
+
+        # Both may be dropped → never leave their errors unobserved
+        for task in (self.embedding, self.retrieval):
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _retrieve(self, question: str, userId: str, convId: str):
+        q_vec = await asyncio.shield(self.embedding)
+        return await _aretrieve(question, userId, convId, q_vec)
+
+    async def question_vector(self) -> List[float]:
+        return await asyncio.shield(self.embedding)
+
+    def cancel(self):
+        self.retrieval.cancel()
+        self.embedding.cancel()
+
+
+async def _aembed(question: str, q_vec: Optional[List[float]] = None) -> List[float]:
+    if q_vec is None:
+        q_vec = await cached_embeddings().aembed_query(question)
+    return q_vec
+
+
+def _speculative_retrieval(
+    question: str,
+    userId: str,
+    convId: str,
+    q_vec: Optional[List[float]] = None
+) -> Optional[_Speculation]:
+    """
+    Starts RAG retrieval in the background when QA_SPECULATIVE_RAG is on.
+    """
+    if not QA_SPECULATIVE_RAG:
+        return None
+    return _Speculation(question, userId, convId, q_vec)
+
+
+async def _retrieval_result(
+    speculative: Optional[_Speculation],
+    question: str,
+    userId: str,
+    convId: str,
+    q_vec: Optional[List[float]] = None
+):
+    if speculative is not None:
+        return await speculative.retrieval
+    return await _aretrieve(question, userId, convId, q_vec)
+
+
+async def _asections(
+    firestore: AsyncFirestoreRepo,
+    question: str,
+    convId: str,
+    q_vec: Optional[List[float]] = None
+) -> Tuple[Optional[Tuple[str, List[Dict], Set[str]]], Optional[List[float]]]:
+    """
+    Section-summary step: (prompt, sources, refs) for the best
+    matching sections, or None when no section is close enough.
+    The question embedding is returned for RAG retrieval.
+    """
+    if not SECTION_INDEX_ENABLE:
+        return None, q_vec
+
+    index = await firestore.get_sections(convId)
+    if not index or not index.get("count"):
+        return None, q_vec
+
+    if q_vec is None:
+        q_vec = await cached_embeddings().aembed_query(question)
+
+    sections = top_sections(q_vec, index)
+    if not sections:
+        return None, q_vec
+
+    context_blocks, sources, cited_refs = _section_context(
+        sections, index.get("sourceType")
+    )
+    section_prompt = _section_prompt("\n\n---\n\n".join(context_blocks), question)
+
+    return (section_prompt, sources, cited_refs), q_vec
+
+
+async def _astream_gated(
+    llm,
+    prompt: str,
+    sentinel: str,
+    meta: Dict,
+    on_commit: Callable[[], None],
+    result: Dict
+) -> AsyncIterator[Dict]:
+    """
+    Streams an answer that may turn out to be `sentinel` (NO_ANSWER,
+    NO_SECTION_ANSWER): tokens are only held back while the text is
+    still a prefix of it. Nothing is yielded for the sentinel itself.
+    The stripped answer is left in result["answer"]; once committed, it
+    holds the text sent so far (the stream may be closed mid-answer).
+    """
+    answer = ""
+    streaming = False
+
+    async for chunk in llm.astream(prompt):
+        if not chunk.content:
+            continue
+
+        answer += chunk.content
+
+        if streaming:
+            result["answer"] = answer.strip()
+            yield {"event": "token", "data": {"text": chunk.content}}
+        elif not sentinel.startswith(answer.lstrip()):
+            # Can no longer be the sentinel → commit to this mode
+            streaming = True
+            on_commit()
+            result["answer"] = answer.strip()
+
+            yield {"event": "meta", "data": meta}
+            yield {"event": "token", "data": {"text": answer.lstrip()}}
+
+    answer = answer.strip()
+    result["answer"] = answer
+
+    if answer != sentinel and not streaming:
+        # Short answer that was still a prefix of the sentinel
+        on_commit()
+        yield {"event": "meta", "data": meta}
+        yield {"event": "token", "data": {"text": answer}}
+
+
+async def _aroute(
+    question: str,
+    router_index: Optional[Dict],
+    q_vec: Optional[List[float]] = None
+) -> Tuple[str, Optional[List[float]]]:
+    """
+    Embedding router (see qa_router). The question embedding is
+    returned so RAG retrieval can reuse it.
+    """
+    if not use_router(router_index):
+        return "summary", q_vec
+
+    if q_vec is None:
+        q_vec = await cached_embeddings().aembed_query(question)
+    return route_question(q_vec, router_index), q_vec
+
+
+async def answer_question_async(
+    *,
+    summary: str,
+    question: str,
+    userId: str,
+    convId: str,
+    router_index: Optional[Dict] = None,
+    q_vec: Optional[List[float]] = None
+) -> Tuple[str, str, List[Dict]]:
+    """
+    Same behavior as answer_question, built on ainvoke / aembed_query,
+    the Firestore AsyncClient and the asyncio Pinecone index.
+
+    With a router index (stored at ingest) questions that clearly need
+    the document go straight to RAG, without the gating summary call.
+    `q_vec` is an already computed question embedding (answer cache).
+    """
+
+    firestore = AsyncFirestoreRepo()
+    llm = clients.chat_llm()
+
+    route, q_vec = await _aroute(question, router_index, q_vec)
+    speculative = None
+
+    try:
+        # ----------------------------------
+        # STEP 1: SUMMARY-ONLY ANSWER
+        # ----------------------------------
+        if not skips_summary(route):
+            summary_prompt = _summary_prompt(summary, question)
+            speculative = _speculative_retrieval(
+                question, userId, convId, q_vec
+            )
+
+            summary_response = await llm.ainvoke(summary_prompt)
+            summary_ans = summary_response.content.strip()
+
+            if summary_ans != NO_ANSWER:
+                if speculative is not None:
+                    speculative.cancel()
+
+                await _arecord(
+                    firestore, convId, question, summary_ans,
+                    estimate_tokens(summary_prompt),
+                    estimate_tokens(summary_ans),
+                    "SUMMARY"
+                )
+                return summary_ans, "summary", []
+
+        if speculative is not None:
+            # Same embedding as the speculative retrieval
+            q_vec = await speculative.question_vector()
+
+        # ----------------------------------
+        # STEP 2: SECTION SUMMARIES
+        # ----------------------------------
+        section, q_vec = await _asections(firestore, question, convId, q_vec)
+
+        if section is not None:
+            section_prompt, sources, cited_refs = section
+
+            section_response = await llm.ainvoke(section_prompt)
+            section_ans = section_response.content.strip()
+
+            if section_ans != NO_SECTION_ANSWER:
+                if speculative is not None:
+                    speculative.cancel()
+
+                section_answer = _with_citations(section_ans, cited_refs)
+
+                await _arecord(
+                    firestore, convId, question, section_answer,
+                    estimate_tokens(section_prompt),
+                    estimate_tokens(section_answer),
+                    "SECTION"
+                )
+                return section_answer, "section", sources
+
+        # ----------------------------------
+        # STEP 3: RAG FALLBACK
+        # ----------------------------------
+        retrieved = await _retrieval_result(
+            speculative, question, userId, convId, q_vec
+        )
+
+        if retrieved is None:
+            await _arecord(
+                firestore, convId, question, NO_DOC_ANSWER,
+                estimate_tokens(question),
+                estimate_tokens(NO_DOC_ANSWER),
+                "NO_DOC"
+            )
+            return NO_DOC_ANSWER, "rag", []
+
+        context_blocks, sources, cited_refs = retrieved
+
+        if not context_blocks:
+            return NO_DOC_ANSWER, "rag", []
+
+        rag_prompt = _rag_prompt(
+            summary,
+            "\n\n---\n\n".join(context_blocks),
+            question
+        )
+
+        rag_response = await llm.ainvoke(rag_prompt)
+        rag_answer = _with_citations(rag_response.content.strip(), cited_refs)
+
+        await _arecord(
+            firestore, convId, question, rag_answer,
+            estimate_tokens(rag_prompt),
+            estimate_tokens(rag_answer),
+            "RAG"
+        )
+
+        return rag_answer, "rag", sources
+    finally:
+        # Failed, dropped or already awaited → never left running
+        if speculative is not None:
+            speculative.cancel()
+
+
+# ----------------------------------------
+# STREAMING QA (SSE)
+# ----------------------------------------
+async def stream_answer(
+    *,
+    summary: str,
+    question: str,
+    userId: str,
+    convId: str,
+    router_index: Optional[Dict] = None,
+    q_vec: Optional[List[float]] = None
+) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of answer_question_async.
+
+    Yields events:
+    - {"event": "meta",  "data": {"answerMode", "sources"}}   (once, first)
+    - {"event": "token", "data": {"text"}}                    (many)
+    - {"event": "done",  "data": {"answer"}}                  (once, last)
+
+    Summary and section answers are streamed as they are generated:
+    tokens are only held back while they could still turn out to be
+    NO_ANSWER / NO_SECTION_ANSWER. With QA_SPECULATIVE_RAG, retrieval
+    is dropped as soon as either answer is committed.
+    Token usage is recorded when the answer is complete, or when the
+    stream is closed (client gone) after part of it was sent.
+    """
+
+    firestore = AsyncFirestoreRepo()
+    llm = clients.chat_llm()
+
+    # Answer being generated: recorded on completion, or in `finally`
+    # when the client disconnects after output was already sent
+    usage = {"prompt": None, "answer": "", "label": None}
+
+    async def record(answer: str):
+        prompt, label = usage["prompt"], usage["label"]
+        usage["prompt"] = None
+
+        await _arecord_shielded(
+            firestore, convId, question, answer,
+            estimate_tokens(prompt),
+            estimate_tokens(answer),
+            label
+        )
+
+    events = _stream_answer(
+        llm, usage, record,
+        summary=summary,
+        question=question,
+        userId=userId,
+        convId=convId,
+        router_index=router_index,
+        q_vec=q_vec
+    )
+
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+        if usage["prompt"] is not None and usage["answer"]:
+            await record(usage["answer"])
+
+
+async def _stream_answer(
+    llm,
+    usage: Dict,
+    record: Callable[[str], Awaitable[None]],
+    *,
+    summary: str,
+    question: str,
+    userId: str,
+    convId: str,
+    router_index: Optional[Dict],
+    q_vec: Optional[List[float]]
+) -> AsyncIterator[Dict]:
+    firestore = AsyncFirestoreRepo()
+
+    route, q_vec = await _aroute(question, router_index, q_vec)
+    speculative = None
+
+    try:
+        # ----------------------------------
+        # STEP 1: SUMMARY-ONLY ANSWER
+        # ----------------------------------
+        def drop_speculative():
+            if speculative is not None:
+                speculative.cancel()
+
+        if not skips_summary(route):
+            summary_prompt = _summary_prompt(summary, question)
+            speculative = _speculative_retrieval(
+                question, userId, convId, q_vec
+            )
+
+            usage.update(prompt=summary_prompt, answer="", label="SUMMARY")
+            async for event in _astream_gated(
+                llm, summary_prompt, NO_ANSWER,
+                {"answerMode": "summary", "sources": []},
+                drop_speculative, usage
+            ):
+                yield event
+
+            answer = usage["answer"]
+
+            if answer != NO_ANSWER:
+                await record(answer)
+                yield {"event": "done", "data": {"answer": answer}}
+                return
+
+            usage["prompt"] = None
+
+        if speculative is not None:
+            # Same embedding as the speculative retrieval
+            q_vec = await speculative.question_vector()
+
+        # ----------------------------------
+        # STEP 2: SECTION SUMMARIES
+        # ----------------------------------
+        section, q_vec = await _asections(firestore, question, convId, q_vec)
+
+        if section is not None:
+            section_prompt, sources, cited_refs = section
+
+            usage.update(prompt=section_prompt, answer="", label="SECTION")
+            async for event in _astream_gated(
+                llm, section_prompt, NO_SECTION_ANSWER,
+                {"answerMode": "section", "sources": sources},
+                drop_speculative, usage
+            ):
+                yield event
+
+            answer = usage["answer"]
+
+            if answer != NO_SECTION_ANSWER:
+                section_answer = _with_citations(answer, cited_refs)
+
+                # Citation footer goes out as the final token
+                if section_answer != answer:
+                    yield {"event": "token", "data": {"text": section_answer[len(answer):]}}
+
+                await record(section_answer)
+                yield {"event": "done", "data": {"answer": section_answer}}
+                return
+
+            usage["prompt"] = None
+
+        # ----------------------------------
+        # STEP 3: RAG FALLBACK
+        # ----------------------------------
+        retrieved = await _retrieval_result(
+            speculative, question, userId, convId, q_vec
+        )
+
+        if retrieved is None or not retrieved[0]:
+            yield {"event": "meta", "data": {"answerMode": "rag", "sources": []}}
+            yield {"event": "token", "data": {"text": NO_DOC_ANSWER}}
+
+            if retrieved is None:
+                usage.update(prompt=question, label="NO_DOC")
+                await record(NO_DOC_ANSWER)
+            yield {"event": "done", "data": {"answer": NO_DOC_ANSWER}}
+            return
+
+        context_blocks, sources, cited_refs = retrieved
+
+        yield {"event": "meta", "data": {"answerMode": "rag", "sources": sources}}
+
+        rag_prompt = _rag_prompt(
+            summary,
+            "\n\n---\n\n".join(context_blocks),
+            question
+        )
+
+        usage.update(prompt=rag_prompt, answer="", label="RAG")
+
+        answer = ""
+        async for chunk in llm.astream(rag_prompt):
+            if not chunk.content:
+                continue
+
+            text = chunk.content if answer else chunk.content.lstrip()
+            answer += text
+            if text:
+                usage["answer"] = answer.strip()
+                yield {"event": "token", "data": {"text": text}}
+
+        answer = answer.strip()
+        rag_answer = _with_citations(answer, cited_refs)
+
+        # Citation footer goes out as the final token
+        if rag_answer != answer:
+            yield {"event": "token", "data": {"text": rag_answer[len(answer):]}}
+
+        await record(rag_answer)
+        yield {"event": "done", "data": {"answer": rag_answer}}
+    finally:
+        # Failed, dropped or already awaited → never left running
+        if speculative is not None:
+            speculative.cancel()
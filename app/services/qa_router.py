@@ -0,0 +1,109 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.repos import clients
+from app.services.embedding_cache import cached_embeddings
+
+# -------------------------
+# Router config
+# -------------------------
+QA_ROUTER_ENABLE = os.getenv("QA_ROUTER_ENABLE", "true").lower() == "true"
+
+# max cosine(question, summary sentence / suggested question)
+# >= SUMMARY → answer from summary
+# <  RAG     → straight to RAG (no gating LLM call)
+# in between → ambiguous
+QA_ROUTER_SUMMARY_THRESHOLD = float(os.getenv("QA_ROUTER_SUMMARY_THRESHOLD", 0.55))
+QA_ROUTER_RAG_THRESHOLD = float(os.getenv("QA_ROUTER_RAG_THRESHOLD", 0.40))
+
+# Ambiguous band: true → gated summary call (LLM tie-break), false → RAG
+QA_ROUTER_TIEBREAK = os.getenv("QA_ROUTER_TIEBREAK", "true").lower() == "true"
+
+ROUTER_MAX_SENTENCES = 60
+ROUTER_MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text: str) -> List[str]:
+    parts = re.split(r"(?<=[.!?])\s+|\n+", text or "")
+    return [
+        p.strip(" -•*\t")
+        for p in parts
+        if len(p.strip(" -•*\t")) >= ROUTER_MIN_SENTENCE_CHARS
+    ]
+
+
+# -------------------------
+# Ingest: build + store
+# -------------------------
+def build_router_index(summary: str, questions: List[str]) -> Optional[Dict]:
+    """
+    Embeds the summary sentences + suggested questions once at ingest.
+    Stored on the conversation document (float16, row-normalized).
+    """
+    texts = split_sentences(summary)[:ROUTER_MAX_SENTENCES]
+    texts += [q for q in questions or [] if q]
+
+    if not texts:
+        return None
+
+    vectors = np.asarray(
+        cached_embeddings().embed_documents(texts),
+        dtype=np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    return {
+        "model": clients.EMBEDDING_MODEL,
+        "dim": int(vectors.shape[1]),
+        "count": int(vectors.shape[0]),
+        "vectors": vectors.astype(np.float16).tobytes(),
+    }
+
+
+# -------------------------
+# Ask: route
+# -------------------------
+def router_score(q_vec: List[float], router_index: Dict) -> float:
+    matrix = np.frombuffer(
+        router_index["vectors"],
+        dtype=np.float16
+    ).reshape(router_index["count"], router_index["dim"])
+
+    q = np.asarray(q_vec, dtype=np.float32)
+    q /= np.linalg.norm(q) + 1e-12
+
+    return float((matrix.astype(np.float32) @ q).max())
+
+
+def use_router(router_index: Optional[Dict]) -> bool:
+    return bool(
+        QA_ROUTER_ENABLE
+        and router_index
+        and router_index.get("model") == clients.EMBEDDING_MODEL
+    )
+
+
+def route_question(q_vec: List[float], router_index: Dict) -> str:
+    """
+    Returns "summary" | "rag" | "ambiguous".
+
+    "summary" keeps the gated summary call (RAG fallback on NO_ANSWER),
+    i.e. the behavior for conversations without a router index.
+    """
+    score = router_score(q_vec, router_index)
+
+    if score >= QA_ROUTER_SUMMARY_THRESHOLD:
+        return "summary"
+    if score < QA_ROUTER_RAG_THRESHOLD:
+        return "rag"
+    return "ambiguous"
+
+
+def skips_summary(route: str) -> bool:
+    """
+    True when the gating summary call can be skipped entirely.
+    """
+    return route == "rag" or (route == "ambiguous" and not QA_ROUTER_TIEBREAK)
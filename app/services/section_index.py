@@ -0,0 +1,153 @@
+"""
+Section-summary tier between the summary and raw-chunk RAG.
+
+The summary MAP step already writes a few bullets per ~2.5k-token
+section; they are kept (with the pages / URLs they cover) and embedded
+at ingest, stored in sections/{convId} in the router-index format
+(float16, row-normalized). /ask answers from the best matching section
+summaries before falling back to six raw chunks.
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.repos import clients
+from app.services.embedding_cache import cached_embeddings
+
+SECTION_INDEX_ENABLE = os.getenv("SECTION_INDEX_ENABLE", "true").lower() == "true"
+
+# Sections embedded per conversation; neighbours are merged beyond that
+SECTION_INDEX_MAX = int(os.getenv("SECTION_INDEX_MAX", 150))
+
+# Encoded index size (Firestore document ≤ 1 MiB, headroom for the
+# document name and field names): neighbours are merged until it fits
+SECTION_INDEX_MAX_BYTES = 1024 * 1024 - 16 * 1024
+
+SECTION_TOP_K = int(os.getenv("SECTION_TOP_K", 3))
+SECTION_MIN_SCORE = float(os.getenv("SECTION_MIN_SCORE", 0.30))
+
+
+# -------------------------
+# Ingest: build
+# -------------------------
+def _merge(group: List[Dict]) -> Dict:
+    return {
+        "text": "\n".join(s["text"] for s in group),
+        "refs": list(dict.fromkeys(r for s in group for r in s["refs"])),
+    }
+
+
+def _merged(sections: List[Dict], limit: int) -> List[Dict]:
+    if len(sections) <= limit:
+        return sections
+
+    size = -(-len(sections) // limit)
+    return [_merge(sections[i:i + size]) for i in range(0, len(sections), size)]
+
+
+def _encoded_size(sections: List[Dict], dim: int) -> int:
+    """
+    Firestore size of the index document (strings: UTF-8 + 1, values
+    and field names included; a little over the exact figure).
+    """
+    size = 256 + len(sections) * dim * 2
+    for s in sections:
+        size += 32 + len(s["text"].encode()) + 1
+        size += sum(len(str(r).encode()) + 9 for r in s["refs"])
+    return size
+
+
+def _fit(sections: List[Dict], vectors: np.ndarray, limit: int):
+    """
+    Merges neighbour pairs until the encoded index fits `limit` bytes.
+    A merged section's vector is the normalized sum of its parts (no
+    re-embedding). Returns (sections, vectors).
+    """
+    dim = vectors.shape[1]
+
+    while len(sections) > 1 and _encoded_size(sections, dim) > limit:
+        pairs = range(0, len(sections), 2)
+        sections = [_merge(sections[i:i + 2]) for i in pairs]
+        vectors = np.vstack([vectors[i:i + 2].sum(axis=0) for i in pairs])
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    if _encoded_size(sections, dim) > limit:
+        # The bullets alone outgrow the document
+        raise ValueError("section index exceeds the Firestore document limit")
+
+    return sections, vectors
+
+
+def build_section_index(sections: List[Dict], sourceType: str) -> Dict:
+    """
+    sections: [{"text", "refs"}] from the MAP step (document order).
+    An empty index (count 0) still replaces a stale one on re-ingest.
+    Raises ValueError when even one merged section cannot fit the
+    document limit.
+    """
+    sections = _merged([s for s in sections if s["text"]], SECTION_INDEX_MAX)
+
+    index = {
+        "model": clients.EMBEDDING_MODEL,
+        "sourceType": sourceType,
+        "count": len(sections),
+        "dim": 0,
+        "vectors": b"",
+        "sections": sections,
+    }
+
+    if not sections:
+        return index
+
+    vectors = np.asarray(
+        cached_embeddings().embed_documents([s["text"] for s in sections]),
+        dtype=np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    sections, vectors = _fit(sections, vectors, SECTION_INDEX_MAX_BYTES)
+
+    index["count"] = len(sections)
+    index["sections"] = sections
+    index["dim"] = int(vectors.shape[1])
+    index["vectors"] = vectors.astype(np.float16).tobytes()
+    return index
+
+
+# -------------------------
+# Ask: lookup
+# -------------------------
+def use_sections(index: Optional[Dict]) -> bool:
+    return bool(
+        SECTION_INDEX_ENABLE
+        and index
+        and index.get("count")
+        and index.get("model") == clients.EMBEDDING_MODEL
+    )
+
+
+def top_sections(q_vec: List[float], index: Optional[Dict]) -> List[Dict]:
+    """
+    Up to SECTION_TOP_K sections scoring ≥ SECTION_MIN_SCORE, best
+    first: {"id", "text", "refs", "score"}.
+    """
+    if not use_sections(index):
+        return []
+
+    matrix = np.frombuffer(
+        index["vectors"],
+        dtype=np.float16
+    ).reshape(index["count"], index["dim"])
+
+    q = np.asarray(q_vec, dtype=np.float32)
+    q /= np.linalg.norm(q) + 1e-12
+
+    scores = matrix.astype(np.float32) @ q
+    best = np.argsort(-scores)[:SECTION_TOP_K]
+
+    return [
+        {**index["sections"][i], "id": int(i), "score": float(scores[i])}
+        for i in best
+        if scores[i] >= SECTION_MIN_SCORE
+    ]
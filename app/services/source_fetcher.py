@@ -1,8 +1,18 @@
 import requests
-from typing import Tuple
+import tempfile
+import mmap
+import io
+import os
+from typing import BinaryIO, Tuple, Union
 
 from app.exceptions.restricted_site import RestrictedWebsiteError
 
+# Streamed downloads: bodies up to this size stay in memory, larger ones
+# go to a temp file (read back memory-mapped)
+FETCH_SPOOL_MAX_MEMORY = int(os.getenv("FETCH_SPOOL_MAX_MEMORY", 8 * 1024 * 1024))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", 500 * 1024 * 1024))
+FETCH_CHUNK_BYTES = 1024 * 1024
+
 
 HEADERS = {
     "User-Agent": (
@@ -13,6 +23,36 @@ HEADERS = {
 }
 
 
+def _get(source: str, stream: bool = False) -> requests.Response:
+    if not isinstance(source, str) or not source.strip():
+        raise ValueError("source must be a non-empty string URL")
+
+    resp = requests.get(
+        source.strip(),
+        timeout=10,               # ⬅️ FAST FAIL
+        allow_redirects=True,
+        headers=HEADERS,
+        stream=stream,
+    )
+
+    status = resp.status_code
+
+    # 🚫 Explicitly blocked or restricted sites
+    if status in (403, 404, 429):
+        resp.close()
+        raise RestrictedWebsiteError(
+            source,
+            reason=f"Website blocked automated access (HTTP {status})"
+        )
+
+    # ❌ Any other non-200
+    if status != 200:
+        resp.close()
+        raise ValueError(f"Failed to fetch URL (HTTP {status})")
+
+    return resp
+
+
 def fetch_source(source: str) -> Tuple[bytes, str]:
     """
     Fetch raw content from a URL.
@@ -26,29 +66,8 @@ def fetch_source(source: str) -> Tuple[bytes, str]:
     - ValueError
     """
 
-    if not isinstance(source, str) or not source.strip():
-        raise ValueError("source must be a non-empty string URL")
-
     try:
-        resp = requests.get(
-            source.strip(),
-            timeout=10,               # ⬅️ FAST FAIL
-            allow_redirects=True,
-            headers=HEADERS,
-        )
-
-        status = resp.status_code
-
-        # 🚫 Explicitly blocked or restricted sites
-        if status in (403, 404, 429):
-            raise RestrictedWebsiteError(
-                source,
-                reason=f"Website blocked automated access (HTTP {status})"
-            )
-
-        # ❌ Any other non-200
-        if status != 200:
-            raise ValueError(f"Failed to fetch URL (HTTP {status})")
+        resp = _get(source)
 
         content_type = resp.headers.get("Content-Type", "").lower()
         return resp.content, content_type
@@ -61,3 +80,182 @@ def fetch_source(source: str) -> Tuple[bytes, str]:
 
     except requests.exceptions.RequestException as e:
         raise ValueError(f"Network error while fetching URL: {str(e)}")
+
+
+# -------------------------
+# Streamed download (large PDFs)
+# -------------------------
+class SpooledDownload:
+    """
+    A response body written as it arrives: in memory up to
+    FETCH_SPOOL_MAX_MEMORY, then in a temp file that is memory-mapped
+    once complete. One copy of the bytes exists, whatever the size.
+
+        with fetch_download(url) as download:
+            download.content_type
+            download.data       # bytes-like (bytes / mmap), no copy
+            download.stream()   # file object over data (pypdf)
+            download.path       # file on disk (poppler, worker processes)
+
+    An in-memory body only gets a file when .path is asked for.
+    """
+
+    def __init__(self, content_type: str = ""):
+        self.content_type = content_type
+        self.size = 0
+        self._chunks = []
+        self._bytes = b""
+        self._file = None
+        self._path = None
+        self._map = None
+
+    @classmethod
+    def wrap(cls, data: bytes, content_type: str = "") -> "SpooledDownload":
+        download = cls(content_type)
+        download._bytes = data
+        download.size = len(data)
+        return download
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+
+        if self._file is None and self.size > FETCH_SPOOL_MAX_MEMORY:
+            self._file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+            self._path = self._file.name
+            for spooled in self._chunks:
+                self._file.write(spooled)
+            self._chunks = []
+
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def finish(self):
+        if self._file is None:
+            self._bytes = b"".join(self._chunks)
+            self._chunks = []
+            return
+
+        self._file.close()
+        with open(self._path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def data(self) -> Union[bytes, mmap.mmap]:
+        return self._map if self._map is not None else self._bytes
+
+    def stream(self) -> BinaryIO:
+        if self._map is not None:
+            return _MapReader(self._map)
+        return io.BytesIO(self._bytes)   # shares the bytes (no copy)
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
+                f.write(self._bytes)
+                self._path = f.name
+        return self._path
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # still exported (e.g. a live memoryview); freed with it
+            self._map = None
+
+        if self._file is not None:
+            self._file.close()
+
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except Exception:
+                pass
+            self._path = None
+
+        self._bytes = b""
+        self._chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class _MapReader(io.RawIOBase):
+    """
+    Independent read position over a shared mmap.
+    """
+
+    def __init__(self, data: mmap.mmap):
+        self._data = data
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self._data) if size is None or size < 0 else self._pos + size
+        chunk = self._data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def fetch_download(source: str) -> SpooledDownload:
+    """
+    Like fetch_source, but the body is streamed into a SpooledDownload
+    instead of being held as one bytes object (resp.content).
+
+    Raises:
+    - RestrictedWebsiteError
+    - ValueError (also when the body exceeds FETCH_MAX_BYTES)
+    """
+    download = None
+
+    try:
+        with _get(source, stream=True) as resp:
+            download = SpooledDownload(resp.headers.get("Content-Type", "").lower())
+
+            for chunk in resp.iter_content(chunk_size=FETCH_CHUNK_BYTES):
+                download.write(chunk)
+                if download.size > FETCH_MAX_BYTES:
+                    raise ValueError(
+                        f"Source is larger than {FETCH_MAX_BYTES // (1024 * 1024)} MB"
+                    )
+
+        download.finish()
+        return download
+
+    except BaseException as e:
+        if download is not None:
+            download.close()
+
+        if isinstance(e, requests.exceptions.Timeout):
+            raise ValueError("Request timed out while fetching URL")
+        if isinstance(e, requests.exceptions.RequestException):
+            raise ValueError(f"Network error while fetching URL: {str(e)}")
+        raise
@@ -1,4 +1,4 @@
-from app.services.source_fetcher import fetch_source
+from app.services.source_fetcher import fetch_download
 from app.services.pdf_extractor import extract_pages
 from app.services.html_extractor import extract_web_text
 from app.services.js_renderer import render_js_page
@@ -34,28 +34,30 @@ def resolve_source(source_url: str):
     # -------------------------
     # FETCH SOURCE (FAST FAIL)
     # -------------------------
-    data, content_type = fetch_source(source_url)
+    with fetch_download(source_url) as download:
+        content_type = download.content_type
+
+        # -------------------------
+        # PDF (FAST PATH)
+        # -------------------------
+        if (
+            (content_type and "application/pdf" in content_type)
+            or download.data[:4] == b"%PDF"
+        ):
+            texts, page_count, total_words, ocr_pages = extract_pages(download)
 
-    # -------------------------
-    # PDF (FAST PATH)
-    # -------------------------
-    if (
-        (content_type and "application/pdf" in content_type)
-        or data.startswith(b"%PDF")
-    ):
-        texts, page_count, total_words, ocr_pages = extract_pages(data)
-
-        return {
-            "text": "\n\n".join(texts),
-            "sourceType": "pdf",
-            "pages": list(range(1, page_count + 1)),
-            "total_words": total_words,
-        }
+            return {
+                "text": "\n\n".join(texts),
+                "sourceType": "pdf",
+                "pages": list(range(1, page_count + 1)),
+                "total_words": total_words,
+            }
+
+        html = bytes(download.data).decode("utf-8", errors="ignore")
 
     # -------------------------
     # STATIC HTML (FAST)
     # -------------------------
-    html = data.decode("utf-8", errors="ignore")
 
     try:
         text = extract_web_text(html)
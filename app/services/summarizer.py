@@ -1,17 +1,18 @@
-from langchain_openai import ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter
+from typing import Any, Dict, Iterable, Optional, List, Tuple, Union
+import math
 import os
-from dotenv import load_dotenv
-from typing import Optional, List
 
-load_dotenv()
+from app.repos import clients
+from app.services.tokens import count_tokens
 
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.2,
-    api_key=os.environ["OPENAI_API_KEY"]
-)
+NOT_ENOUGH_CONTENT = "Not enough content to generate a summary."
+
+# MAP step: parallel LLM calls + per-chunk retries
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 8))
+SUMMARY_MAP_RETRIES = int(os.getenv("SUMMARY_MAP_RETRIES", 3))
 
 # -------------------------
 # Helpers
@@ -26,55 +27,45 @@ def compute_target_words(total_words: int) -> int:
     return 900
 
 
-def choose_chunk_size(total_words: int) -> int:
-    if total_words <= 8_000:
-        return 5_000
-    if total_words <= 30_000:
-        return 8_000
-    return 12_000
-
-
 # -------------------------
-# Main summarizer
+# Budgets (tiktoken)
 # -------------------------
-def summarize(
-    text: str,
-    *,
-    total_words: int,
-    sourceType: str,
-    prompt: Optional[str] = None
-) -> str:
-    """
-    Auto-tuned summarizer.
+# The strategy is decided on measured text, never up front:
+# stuff        → map_stream: the whole text fits SUMMARY_STUFF_MAX_TOKENS
+# map → reduce → map_stream maps SUMMARY_MAP_CHUNK_TOKENS chunks;
+#                reduce_summary makes one call, or a tree of calls when the
+#                bullets outgrow SUMMARY_REDUCE_MAX_TOKENS
+SUMMARY_STUFF_MAX_TOKENS = int(os.getenv("SUMMARY_STUFF_MAX_TOKENS", 12_000))
+SUMMARY_MAP_CHUNK_TOKENS = int(os.getenv("SUMMARY_MAP_CHUNK_TOKENS", 2_500))
+SUMMARY_REDUCE_MAX_TOKENS = int(os.getenv("SUMMARY_REDUCE_MAX_TOKENS", 12_000))
 
-    Behavior:
-    - If prompt is provided → summarize ONLY that topic/section
-    - If no prompt → summarize full content
+# Text measured by map_stream for its chars/token ratio before sizing chunks
+SUMMARY_RATIO_SAMPLE_CHARS = 4_000
 
-    Works for:
-    - PDF
-    - Website
-    """
 
-    if not text or len(text.strip()) < 200:
-        return "Not enough content to generate a summary."
+def _tokens(text: str) -> int:
+    return count_tokens([text], clients.CHAT_MODEL)[0]
 
-    target_words = compute_target_words(total_words)
-    chunk_size = choose_chunk_size(total_words)
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", " ", ""],
-    )
+def plan_summary(sample: str) -> Dict:
+    """
+    {"charsPerToken", "chunkChars"} measured on a sample of the text:
+    the char sizes map_stream buffers and splits by.
+    """
+    chars_per_token = len(sample) / max(_tokens(sample), 1)
+
+    return {
+        "charsPerToken": chars_per_token,
+        "chunkChars": int(SUMMARY_MAP_CHUNK_TOKENS * chars_per_token),
+    }
 
-    chunks = splitter.split_text(text)
 
-    # -------------------------
-    # MAP step (prompt-aware)
-    # -------------------------
+# -------------------------
+# Prompts
+# -------------------------
+def _map_prompt(prompt: Optional[str]) -> ChatPromptTemplate:
     if prompt:
-        map_prompt = ChatPromptTemplate.from_messages([
+        return ChatPromptTemplate.from_messages([
             (
                 "system",
                 "You are a precise document analyzer. "
@@ -88,52 +79,393 @@ def summarize(
                 "Return ONLY relevant bullet points."
             )
         ])
-    else:
-        map_prompt = ChatPromptTemplate.from_messages([
-            (
-                "system",
-                "You are a precise document summarizer. "
-                "Return ONLY 5–7 concise bullet points capturing key facts."
-            ),
-            ("user", "TEXT:\n{chunk}")
-        ])
 
-    bullets = []
-    for c in chunks:
-        bullets.append(
-            llm.invoke(
-                map_prompt.format_messages(
-                    chunk=c,
-                    prompt=prompt
-                )
-            ).content.strip()
-        )
-
-    # -------------------------
-    # REDUCE step
-    # -------------------------
-    reduce_prompt = ChatPromptTemplate.from_messages([
+    return ChatPromptTemplate.from_messages([
         (
             "system",
-            "Combine partial summaries into a single coherent summary."
+            "You are a precise document summarizer. "
+            "Return ONLY 5–7 concise bullet points capturing key facts."
         ),
+        ("user", "TEXT:\n{chunk}")
+    ])
+
+
+@retry(
+    stop=stop_after_attempt(SUMMARY_MAP_RETRIES),
+    wait=wait_exponential_jitter(initial=1, max=20),
+    reraise=True
+)
+def _invoke_map(llm, messages) -> str:
+    return llm.invoke(messages).content.strip()
+
+
+def _map_chunks(chunks: List[str], prompt: Optional[str]) -> List[Optional[str]]:
+    """
+    MAP calls in parallel (SUMMARY_MAP_CONCURRENCY), results in chunk
+    order. A failed chunk is retried on its own with backoff; if it
+    keeps failing its entry is None instead of failing the ingest.
+    """
+    if not chunks:
+        return []
+
+    llm = clients.chat_llm()
+    map_prompt = _map_prompt(prompt)
+
+    inputs = [
+        map_prompt.format_messages(chunk=c, prompt=prompt)
+        for c in chunks
+    ]
+
+    results = llm.batch(
+        inputs,
+        config={"max_concurrency": SUMMARY_MAP_CONCURRENCY},
+        return_exceptions=True
+    )
+
+    bullets: List[Optional[str]] = []
+    for messages, result in zip(inputs, results):
+        if not isinstance(result, Exception):
+            bullets.append(result.content.strip())
+            continue
+
+        try:
+            bullets.append(_invoke_map(llm, messages))
+        except Exception:
+            bullets.append(None)
+
+    return bullets
+
+
+def _mapped(bullets: List[Optional[str]]) -> List[str]:
+    """
+    Drops failed chunks; fails only when EVERY chunk failed.
+    """
+    ok = [b for b in bullets if b is not None]
+    if bullets and not ok:
+        raise RuntimeError("Summary map step failed for every chunk")
+    return ok
+
+
+def _splitter(chunk_size: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=200,
+        separators=["\n\n", "\n", " ", ""],
+    )
+
+
+# -------------------------
+# STUFF (single call)
+# -------------------------
+def stuff_summary(text: str, total_words: int, prompt: Optional[str] = None) -> str:
+    if prompt:
+        system = (
+            "You are a precise document analyzer. "
+            "Summarize ONLY information related to the given topic. "
+            "Ignore all unrelated content completely."
+        )
+        user = "TOPIC:\n{prompt}\n\n"
+    else:
+        system = "You are a precise document summarizer."
+        user = ""
+
+    stuff_prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
         (
             "user",
-            "Create a clear summary of about {target_words} words.\n\n"
-            "BULLETS:\n{bullets}"
+            user + "Create a clear summary of about {target_words} words.\n\n"
+            "TEXT:\n{text}"
         )
     ])
 
+    return clients.chat_llm().invoke(
+        stuff_prompt.format_messages(
+            prompt=prompt,
+            target_words=str(compute_target_words(total_words)),
+            text=text
+        )
+    ).content.strip()
+
+
+# -------------------------
+# REDUCE step
+# -------------------------
+_REDUCE_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "Combine partial summaries into a single coherent summary."
+    ),
+    (
+        "user",
+        "Create a clear summary of about {target_words} words.\n\n"
+        "BULLETS:\n{bullets}"
+    )
+])
+
+
+def _pack(parts: List[str], budget: int) -> List[List[str]]:
+    """
+    Greedy groups of consecutive parts, each group ≤ budget tokens.
+    """
+    groups, group, size = [], [], 0
+
+    for part, tokens in zip(parts, count_tokens(parts, clients.CHAT_MODEL)):
+        if group and size + tokens > budget:
+            groups.append(group)
+            group, size = [], 0
+        group.append(part)
+        size += tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _split_oversized(parts: List[str], budget: int) -> List[str]:
+    """
+    Parts above budget tokens are split into pieces of about budget tokens.
+    """
+    out = []
+
+    for part, tokens in zip(parts, count_tokens(parts, clients.CHAT_MODEL)):
+        if tokens <= budget:
+            out.append(part)
+            continue
+
+        chunk_chars = max(int(budget * len(part) / tokens), 1_000)
+        out += _splitter(chunk_chars).split_text(part)
+
+    return out
+
+
+def reduce_summary(bullets: List[str], total_words: int) -> str:
+    """
+    One REDUCE call when the bullets fit SUMMARY_REDUCE_MAX_TOKENS,
+    otherwise a tree: groups are reduced in parallel, level by level.
+    Every call, the final one included, stays within the budget.
+    """
+    llm = clients.chat_llm()
+    target_words = str(compute_target_words(total_words))
+
+    level = bullets
+    while _tokens("\n\n".join(level)) > SUMMARY_REDUCE_MAX_TOKENS:
+        # Parts of at most half the budget → a group merges two or more
+        level = _split_oversized(level, SUMMARY_REDUCE_MAX_TOKENS // 2)
+        groups = _pack(level, SUMMARY_REDUCE_MAX_TOKENS)
+
+        level = [
+            r.content.strip()
+            for r in llm.batch(
+                [
+                    _REDUCE_PROMPT.format_messages(
+                        target_words=target_words,
+                        bullets="\n\n".join(group)
+                    )
+                    for group in groups
+                ],
+                config={"max_concurrency": SUMMARY_MAP_CONCURRENCY}
+            )
+        ]
+
     final = llm.invoke(
-        reduce_prompt.format_messages(
-            target_words=str(target_words),
-            bullets="\n\n".join(bullets)
+        _REDUCE_PROMPT.format_messages(
+            target_words=target_words,
+            bullets="\n\n".join(level)
         )
     ).content.strip()
 
     return final
 
 
+# -------------------------
+# Streaming MAP step (ingest pipeline)
+# -------------------------
+def map_chunks(
+    chunks: List[str],
+    refs: Optional[List[List]] = None,
+    prompt: Optional[str] = None
+) -> List[Dict]:
+    """
+    Parallel MAP over ready-made chunks → sections {"text", "refs"}
+    (failed chunks dropped). refs: pages / URLs covered by each chunk.
+    """
+    return _sections(_map_chunks(chunks, prompt), refs or [[] for _ in chunks])
+
+
+def _sections(bullets: List[Optional[str]], refs: List[List]) -> List[Dict]:
+    _mapped(bullets)  # fails only when every chunk failed
+    return [
+        {"text": text, "refs": r}
+        for text, r in zip(bullets, refs)
+        if text is not None
+    ]
+
+
+def _refs_between(marks: List[Tuple[int, Any]], start: int, end: int) -> List:
+    """
+    Refs of the pages overlapping buffer[start:end].
+    marks: (offset in buffer, ref) of every page start, ascending.
+    """
+    refs = []
+    for i, (offset, ref) in enumerate(marks):
+        next_offset = marks[i + 1][0] if i + 1 < len(marks) else math.inf
+        if offset < end and next_offset > start and ref is not None and ref not in refs:
+            refs.append(ref)
+    return refs
+
+
+def _split_with_refs(splitter, buffer: str, marks: List[Tuple[int, Any]]):
+    """
+    (pieces, start offsets, refs per piece) of buffer.
+    """
+    pieces = splitter.split_text(buffer)
+    starts, at = [], 0
+
+    for piece in pieces:
+        start = buffer.find(piece, at)
+        start = start if start >= 0 else at
+        starts.append(start)
+        at = start + 1
+
+    refs = [
+        _refs_between(marks, start, start + len(piece))
+        for piece, start in zip(pieces, starts)
+    ]
+    return pieces, starts, refs
+
+
+def map_stream(
+    texts: Iterable[Union[str, Tuple[str, Any]]],
+    *,
+    prompt: Optional[str] = None,
+    map_enabled: bool = True
+) -> Dict:
+    """
+    MAP step over texts as they arrive (pages): only the current
+    partial map-chunk and the bullets are kept in memory.
+    Items are texts or (text, ref) — the page number / URL each
+    section's bullets are attributed to.
+
+    Mapping starts once the text outgrows the STUFF budget; a short
+    document is returned whole ("stuff") for a single call instead.
+    Chunk and STUFF sizes in chars use the chars/token ratio measured
+    on the first SUMMARY_RATIO_SAMPLE_CHARS of text (plan_summary).
+    map_enabled=False only measures the text ("deferred": the caller
+    picks the chunks to map, see summary_preselect).
+
+    Returns {"sections", "stuff", "deferred", "totalWords", "chars"}
+    → finish_summary().
+    """
+    chunk_chars = stuff_chars = 0
+    splitter = None
+
+    def size_from(sample: str):
+        nonlocal chunk_chars, stuff_chars, splitter
+        plan = plan_summary(sample)
+        chunk_chars = plan["chunkChars"]
+        stuff_chars = int(SUMMARY_STUFF_MAX_TOKENS * plan["charsPerToken"])
+        splitter = _splitter(chunk_chars)
+
+    bullets: List[Optional[str]] = []
+    bullet_refs: List[List] = []
+    pending: List[str] = []
+    pending_refs: List[List] = []
+    buffer = ""
+    marks: List[Tuple[int, Any]] = []
+    mapping = False
+    total_words = 0
+    chars = 0
+
+    for item in texts:
+        text, ref = item if isinstance(item, tuple) else (item, None)
+        if not text:
+            continue
+
+        total_words += len(text.split())
+        chars += len(text.strip())
+        marks.append((len(buffer) + 2 if buffer else 0, ref))
+        buffer = f"{buffer}\n\n{text}" if buffer else text
+
+        if splitter is None:
+            if len(buffer) < SUMMARY_RATIO_SAMPLE_CHARS:
+                continue
+            size_from(buffer)
+
+        if len(buffer) < (2 * chunk_chars if mapping else stuff_chars):
+            continue
+
+        mapping = True
+        if not map_enabled:
+            buffer, marks = "", []
+            continue
+
+        # Full chunks wait for a parallel batch; the tail continues
+        # with the next pages
+        pieces, starts, refs = _split_with_refs(splitter, buffer, marks)
+        pending += pieces[:-1]
+        pending_refs += refs[:-1]
+
+        tail = starts[-1]
+        buffer = pieces[-1]
+        marks = [(0, refs[-1][0] if refs[-1] else None)] + [
+            (offset - tail, r) for offset, r in marks if offset > tail
+        ]
+
+        if len(pending) >= SUMMARY_MAP_CONCURRENCY:
+            bullets += _map_chunks(pending, prompt)
+            bullet_refs += pending_refs
+            pending, pending_refs = [], []
+
+    result = {
+        "sections": [],
+        "stuff": None,
+        "deferred": False,
+        "totalWords": total_words,
+        "chars": chars,
+    }
+
+    if chars < 200:
+        return result
+
+    if not mapping and _tokens(buffer) <= SUMMARY_STUFF_MAX_TOKENS:
+        result["stuff"] = buffer
+        return result
+
+    if not map_enabled:
+        result["deferred"] = True
+        return result
+
+    if splitter is None:
+        size_from(buffer)
+
+    if buffer.strip():
+        pieces, _, refs = _split_with_refs(splitter, buffer, marks)
+        pending += pieces
+        pending_refs += refs
+    if pending:
+        bullets += _map_chunks(pending, prompt)
+        bullet_refs += pending_refs
+
+    result["sections"] = _sections(bullets, bullet_refs)
+    return result
+
+
+def finish_summary(mapped: Dict, prompt: Optional[str] = None) -> str:
+    """
+    Final call(s) after map_stream(): STUFF or (tree) REDUCE.
+    """
+    if mapped["chars"] < 200:
+        return NOT_ENOUGH_CONTENT
+
+    if mapped["stuff"] is not None:
+        return stuff_summary(mapped["stuff"], mapped["totalWords"], prompt)
+
+    return reduce_summary(
+        [section["text"] for section in mapped["sections"]],
+        mapped["totalWords"]
+    )
+
+
 # -------------------------
 # Generate top questions
 # -------------------------
@@ -160,7 +492,7 @@ def generate_questions(text: str) -> List[str]:
         )
     ])
 
-    response = llm.invoke(
+    response = clients.chat_llm().invoke(
         prompt.format_messages(text=text[:12_000])  # memory-safe cap
     ).content.strip()
 
@@ -0,0 +1,115 @@
+"""
+Extractive preselection for the summary MAP step.
+
+Chunk vectors from the embedding stage are clustered (k-means, NumPy)
+into at most SUMMARY_MAP_BUDGET clusters; only the chunks closest to
+each centroid are mapped. MAP calls stay fixed regardless of document
+size while every topic cluster is still covered.
+"""
+import math
+import os
+from typing import List
+
+import numpy as np
+
+SUMMARY_PRESELECT = os.getenv("SUMMARY_PRESELECT", "false").lower() == "true"
+SUMMARY_MAP_BUDGET = int(os.getenv("SUMMARY_MAP_BUDGET", 24))
+
+KMEANS_MAX_ITER = 25
+
+
+def kmeans(X: np.ndarray, k: int, *, seed: int = 0):
+    """
+    Lloyd's k-means with k-means++ init.
+    Returns (centroids, labels, squared distances n×k).
+    """
+    rng = np.random.default_rng(seed)
+    n = X.shape[0]
+    x_sq = (X * X).sum(axis=1)
+
+    # k-means++ seeding
+    centroids = np.empty((k, X.shape[1]), dtype=np.float32)
+    centroids[0] = X[rng.integers(n)]
+    closest = ((X - centroids[0]) ** 2).sum(axis=1)
+
+    for j in range(1, k):
+        total = closest.sum()
+        idx = rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)
+        centroids[j] = X[idx]
+        closest = np.minimum(closest, ((X - centroids[j]) ** 2).sum(axis=1))
+
+    for _ in range(KMEANS_MAX_ITER):
+        dist = x_sq[:, None] - 2.0 * (X @ centroids.T) + (centroids * centroids).sum(axis=1)[None, :]
+        labels = dist.argmin(axis=1)
+
+        onehot = np.zeros((k, n), dtype=np.float32)
+        onehot[labels, np.arange(n)] = 1.0
+        counts = onehot.sum(axis=1)
+
+        updated = centroids.copy()
+        filled = counts > 0
+        updated[filled] = (onehot[filled] @ X) / counts[filled, None]
+
+        if np.allclose(updated, centroids, atol=1e-5):
+            break
+        centroids = updated
+
+    dist = x_sq[:, None] - 2.0 * (X @ centroids.T) + (centroids * centroids).sum(axis=1)[None, :]
+    return centroids, dist.argmin(axis=1), dist
+
+
+def _sequential_groups(tokens: List[int], chunk_tokens: int) -> List[List[int]]:
+    groups, group, size = [], [], 0
+
+    for i, t in enumerate(tokens):
+        if group and size + t > chunk_tokens:
+            groups.append(group)
+            group, size = [], 0
+        group.append(i)
+        size += t
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def map_groups(
+    vectors: np.ndarray,
+    tokens: List[int],
+    *,
+    chunk_tokens: int,
+    budget: int = SUMMARY_MAP_BUDGET
+) -> List[List[int]]:
+    """
+    Chunk indexes (document order) to send to each MAP call.
+
+    Fits the budget → every chunk, consecutive groups of chunk_tokens.
+    Otherwise → one group per cluster: the chunks nearest its centroid,
+    up to chunk_tokens.
+    """
+    if not tokens:
+        return []
+
+    if math.ceil(sum(tokens) / chunk_tokens) <= budget:
+        return _sequential_groups(tokens, chunk_tokens)
+
+    X = np.asarray(vectors, dtype=np.float32)
+    k = min(budget, X.shape[0])
+    _, labels, dist = kmeans(X, k)
+
+    groups = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+
+        picked, size = [], 0
+        for i in members[np.argsort(dist[members, c])]:
+            if picked and size + tokens[i] > chunk_tokens:
+                break
+            picked.append(int(i))
+            size += tokens[i]
+
+        groups.append(sorted(picked))
+
+    return sorted(groups, key=lambda g: g[0])
@@ -0,0 +1,27 @@
+"""
+tiktoken counts (embedding request packing, summarization planning).
+"""
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # BPE file not cached and no network → estimate
+        return None
+
+
+def count_tokens(texts: List[str], model: str) -> List[int]:
+    enc = _encoding(model)
+    if enc is None:
+        # ~4 chars / token for English; 3 keeps budgets on the safe side
+        return [len(t) // 3 + 1 for t in texts]
+    return [len(t) for t in enc.encode_ordinary_batch(texts)]
@@ -1,6 +1,9 @@
 from celery import Celery
+from celery.signals import worker_process_init
 import os
 
+from app.repos.clients import reset_clients
+
 REDIS_URL = os.environ.get("REDIS_URL")
 
 if not REDIS_URL:
@@ -24,6 +27,15 @@ celery.conf.update(
     task_track_started=True,
 )
 
+# -------------------------
+# Fresh client pools per prefork child
+# (never share parent sockets across fork)
+# -------------------------
+@worker_process_init.connect
+def _reset_clients(**_):
+    reset_clients()
+
+
 # -------------------------
 # FORCE task registration
 # (REQUIRED on Render)
@@ -1,14 +1,26 @@
 from app.workers.celery import celery
 
-from app.services.source_fetcher import fetch_source
-from app.services.pdf_extractor import extract_pages
+from app.services.source_fetcher import fetch_download
+from app.services.pdf_extractor import PdfPages
 from app.crawlers.smart_crawler import smart_crawl
 
-from app.services.summarizer import summarize, generate_questions
-from app.services.embeddings import build_embeddings
+from app.services.summarizer import finish_summary, generate_questions
+from app.services.ingest_pipeline import run_pipeline
+from app.services.qa_router import build_router_index
+from app.services.section_index import SECTION_INDEX_ENABLE, build_section_index
+from app.services.qa_engine import precompute_answers
+from app.services import answer_cache
+from app.services import doc_registry
 
-from app.repos.redis_jobs import get_job_repo
+from app.repos.redis_jobs import get_job_repo, USE_CELERY
 from app.repos.firestore_repo import FirestoreRepo
+import threading
+import os
+
+# Post-ingest: answer the 3 suggested questions up front
+PRECOMPUTE_SUGGESTED_ANSWERS = (
+    os.getenv("PRECOMPUTE_SUGGESTED_ANSWERS", "false").lower() == "true"
+)
 
 
 # --------------------------------------------------
@@ -20,6 +32,155 @@ def detect_pdf(url: str, content_type: str) -> bool:
     return url.lower().split("?")[0].endswith(".pdf")
 
 
+# --------------------------------------------------
+# Helper: QA router index (best-effort)
+# --------------------------------------------------
+def _router_index(summary: str, questions: list):
+    """
+    Embeddings of summary sentences + suggested questions used by
+    /ask to skip the gating summary call. Never fails the ingest.
+    """
+    try:
+        return build_router_index(summary, questions)
+    except Exception:
+        return None
+
+
+# --------------------------------------------------
+# Helper: section-summary index (best-effort)
+# --------------------------------------------------
+def _save_section_index(store: FirestoreRepo, convId: str, mapped: dict, sourceType: str):
+    """
+    Keeps the MAP-step bullets as a retrieval tier for /ask.
+    Always written, so a re-ingest never leaves stale sections behind;
+    if the new index cannot be saved the old one is deleted instead.
+    """
+    if not SECTION_INDEX_ENABLE:
+        return
+
+    try:
+        store.save_sections(convId, build_section_index(mapped["sections"], sourceType))
+    except Exception:
+        try:
+            store.delete_sections(convId)
+        except Exception:
+            pass
+
+
+# --------------------------------------------------
+# Helper: precomputed suggestion answers (best-effort)
+# --------------------------------------------------
+def _precompute_suggested_answers(userId: str, convId: str, jobId: str):
+    """
+    /ask serves these answers without touching the QA pipeline.
+    Skipped when the conversation was re-ingested in the meantime.
+    """
+    store = FirestoreRepo()
+
+    def current() -> dict:
+        data = store.get(convId) or {}
+        return data if data.get("jobId") == jobId and data.get("status") == "ready" else {}
+
+    try:
+        data = current()
+        if not data.get("questions"):
+            return
+
+        answers = precompute_answers(
+            summary=data["summary"],
+            questions=data["questions"],
+            userId=userId,
+            convId=convId,
+        )
+        if answers and current():
+            store.update(convId, {"suggestedAnswers": answers})
+    except Exception:
+        pass
+
+
+def _dispatch_suggested_answers(userId: str, convId: str, jobId: str):
+    """
+    Own task, after the job is complete: never delays or fails it.
+    """
+    kwargs = {"userId": userId, "convId": convId, "jobId": jobId}
+
+    if USE_CELERY:
+        precompute_suggested_answers.delay(**kwargs)
+    else:
+        # Local dev: keep it off the ingest request
+        threading.Thread(
+            target=_precompute_suggested_answers,
+            kwargs=kwargs,
+            daemon=True
+        ).start()
+
+
+# --------------------------------------------------
+# Helper: pipeline progress
+# --------------------------------------------------
+def _progress_reporter(jobs, store, jobId: str, convId: str, total: int, *, start: int, end: int):
+    """
+    on_page callback: maps pages done to [start, end], writes on change only.
+    """
+    last = {"progress": start}
+
+    def report(done: int):
+        progress = start + int((end - start) * done / max(total, 1))
+        if progress != last["progress"]:
+            last["progress"] = progress
+            jobs.update(jobId, progress=progress)
+            store.update(convId, {"progress": progress})
+
+    return report
+
+
+# --------------------------------------------------
+# Helper: whole-document dedupe
+# --------------------------------------------------
+def _clone_existing(
+    store: FirestoreRepo,
+    jobs,
+    jobId: str,
+    userId: str,
+    convId: str,
+    url: str,
+    fingerprint: str,
+) -> bool:
+    """
+    Same source bytes + prompt already ingested → copy chunks, vectors
+    and summary from that conversation. False → run the full pipeline.
+    """
+    source = doc_registry.find_source(store, fingerprint)
+    if not source or source.get("convId") == convId:
+        return False
+
+    jobs.update(jobId, stage="clone", progress=50)
+    store.update(convId, {"stage": "clone", "progress": 50})
+
+    try:
+        doc_registry.clone_conversation(source, userId=userId, convId=convId)
+    except Exception:
+        doc_registry.discard(userId=userId, convId=convId)
+        return False
+
+    # Section summaries cite pages / URLs only → shared as is
+    try:
+        store.save_sections(convId, store.get_sections(source["convId"]) or {"count": 0})
+    except Exception:
+        pass
+
+    store.save(convId, {
+        "userId": userId,
+        "convId": convId,
+        "jobId": jobId,
+        **doc_registry.cloned_fields(source, url),
+        "fingerprint": fingerprint,
+        "clonedFrom": source["convId"],
+        "status": "ready",
+    })
+    return True
+
+
 # --------------------------------------------------
 # Core ingestion logic (RESTART + WARM-SHUTDOWN SAFE)
 # --------------------------------------------------
@@ -32,6 +193,7 @@ def _ingest_logic(
 ):
     jobs = get_job_repo()
     store = FirestoreRepo()
+    download = None
 
     try:
         # -------------------------
@@ -49,69 +211,99 @@ def _ingest_logic(
         if not source or not isinstance(source, str):
             raise ValueError("source must be a valid URL string")
 
+        # Re-ingest → cached answers of the old content are stale
+        answer_cache.invalidate(convId)
+
         url = source.strip()
         prompt = prompt.strip() if prompt else None
 
         # -------------------------
         # FETCH SOURCE
         # -------------------------
-        content, content_type = fetch_source(url)
-        is_pdf = detect_pdf(url, content_type)
+        # Streamed to memory / a temp file (memory-mapped), never one big bytes object
+        download = fetch_download(url)
+        is_pdf = detect_pdf(url, download.content_type)
 
         # ==================================================
         # PDF INGESTION
         # ==================================================
         if is_pdf:
+            fingerprint = doc_registry.pdf_fingerprint(download.data, prompt)
+            if _clone_existing(store, jobs, jobId, userId, convId, url, fingerprint):
+                jobs.complete(jobId)
+                return
+
             jobs.update(jobId, stage="extract", progress=25)
             store.update(convId, {"stage": "extract", "progress": 25})
 
-            texts, page_count, total_words, ocr_pages = extract_pages(content)
-
-            final_text = "\n\n".join(texts)
-            if prompt:
-                final_text = f"{prompt}\n\n{final_text}"
+            ocr_pages = []
+            timed_out_pages = []
+
+            # Extract → chunk → embed → upsert, and the summary MAP step,
+            # overlap page by page (bounded buffers, constant memory)
+            with PdfPages(download) as pdf:
+                page_count = pdf.page_count
+
+                def pdf_pages():
+                    for page in pdf:
+                        if page["ocr"]:
+                            ocr_pages.append(page["page"])
+                        if page["timedOut"]:
+                            timed_out_pages.append(page["page"])
+                        yield {
+                            "text": page["text"],
+                            "page": page["page"],
+                            "chunkId": f"pdf-{page['page']}",
+                        }
+
+                mapped = run_pipeline(
+                    userId=userId,
+                    convId=convId,
+                    sourceType="pdf",
+                    pages=pdf_pages(),
+                    summary_preamble=prompt,
+                    on_page=_progress_reporter(
+                        jobs, store, jobId, convId, page_count, start=25, end=80
+                    ),
+                )
 
-            jobs.update(jobId, stage="embed", progress=55)
-            store.update(convId, {"stage": "embed", "progress": 55})
-
-            build_embeddings(
-                userId=userId,
-                convId=convId,
-                texts=texts,
-                sourceType="pdf",
-                pages=list(range(1, page_count + 1)),
-            )
+            total_words = mapped["totalWords"]
 
             jobs.update(jobId, stage="summary", progress=80)
             store.update(convId, {"stage": "summary", "progress": 80})
 
-            summary = summarize(
-                text=final_text,
-                total_words=total_words,
-                sourceType="pdf",
-            )
+            summary = finish_summary(mapped)
+
+            _save_section_index(store, convId, mapped, "pdf")
 
             questions = generate_questions(summary)
+            router = _router_index(summary, questions)
 
             store.save(convId, {
                 "userId": userId,
                 "convId": convId,
+                "jobId": jobId,
                 "sourceType": "pdf",
                 "summary": summary,
                 "questions": questions,
+                "router": router,
                 "meta": {
                     "url": url,
                     "pages": page_count,
                     "totalWords": total_words,
                     "ocrPages": ocr_pages,
+                    "timedOutPages": timed_out_pages,
                 },
+                "fingerprint": fingerprint,
                 "status": "ready",
             })
 
         # ==================================================
-        # WEB INGESTION (MICRO-BATCHED + SAFE)
+        # WEB INGESTION (STREAMING + SAFE)
         # ==================================================
         else:
+            download.close()  # the crawler fetches pages itself
+
             jobs.update(jobId, stage="crawl", progress=25)
             store.update(convId, {"stage": "crawl", "progress": 25})
 
@@ -123,71 +315,74 @@ def _ingest_logic(
             MAX_PAGES_TO_EMBED = 50
             pages = pages[:MAX_PAGES_TO_EMBED]
 
+            fingerprint = doc_registry.web_fingerprint(pages, prompt)
+            if _clone_existing(store, jobs, jobId, userId, convId, url, fingerprint):
+                jobs.complete(jobId)
+                return
+
             jobs.update(jobId, stage="embed", progress=60)
             store.update(convId, {"stage": "embed", "progress": 60})
 
-            BATCH_SIZE = 5
-            combined_texts = []
-
-            for i in range(0, len(pages), BATCH_SIZE):
-                batch = pages[i:i + BATCH_SIZE]
-
-                texts = []
-                metas = []
-
-                for j, page in enumerate(batch):
-                    text = page["text"]
-                    if prompt:
-                        text = f"{prompt}\n\n{text}"
+            web_pages = []
+            for i, page in enumerate(pages):
+                text = page["text"]
+                if prompt:
+                    text = f"{prompt}\n\n{text}"
 
-                    texts.append(text)
-                    combined_texts.append(text)
+                web_pages.append({
+                    "text": text,
+                    "url": page["url"],
+                    "chunkId": f"web-{i}",
+                })
 
-                    metas.append({
-                        "url": page["url"],
-                        "chunkId": f"web-{i + j}",
-                    })
-
-                # 🔐 Safety guard
-                assert len(texts) == len(metas)
+            mapped = run_pipeline(
+                userId=userId,
+                convId=convId,
+                sourceType="web",
+                pages=web_pages,
+                on_page=_progress_reporter(
+                    jobs, store, jobId, convId, len(web_pages), start=60, end=90
+                ),
+            )
 
-                # 🔥 MICRO-BATCH EMBEDDINGS
-                build_embeddings(
-                    userId=userId,
-                    convId=convId,
-                    texts=texts,
-                    sourceType="web",
-                    metadata=metas,
-                )
+            jobs.update(jobId, stage="summary", progress=90)
+            store.update(convId, {"stage": "summary", "progress": 90})
 
-                # 🔄 Progress update (heartbeat-safe)
-                progress = 60 + int(((i + BATCH_SIZE) / len(pages)) * 30)
-                jobs.update(jobId, progress=progress)
-                store.update(convId, {"progress": progress})
+            summary = finish_summary(mapped)
 
-            full_text = "\n\n".join(combined_texts)
-
-            summary = summarize(
-                text=full_text,
-                total_words=len(full_text.split()),
-                sourceType="web",
-            )
+            _save_section_index(store, convId, mapped, "web")
 
             questions = generate_questions(summary)
+            router = _router_index(summary, questions)
 
             store.save(convId, {
                 "userId": userId,
                 "convId": convId,
+                "jobId": jobId,
                 "sourceType": "web",
                 "summary": summary,
                 "questions": questions,
+                "router": router,
                 "meta": {
                     "url": url,
                     "pages": len(pages),
                 },
+                "fingerprint": fingerprint,
                 "status": "ready",
             })
 
+        # Later ingests of the same source clone this conversation
+        try:
+            doc_registry.register(
+                store,
+                fingerprint,
+                userId=userId,
+                convId=convId,
+                sourceType="pdf" if is_pdf else "web",
+            )
+        except Exception:
+            pass
+
         # -------------------------
         # COMPLETE JOB
         # -------------------------
@@ -201,6 +396,16 @@ def _ingest_logic(
         })
         raise
 
+    finally:
+        if download is not None:
+            download.close()
+
+    # -------------------------
+    # POST-INGEST (optional)
+    # -------------------------
+    if PRECOMPUTE_SUGGESTED_ANSWERS:
+        _dispatch_suggested_answers(userId, convId, jobId)
+
 
 # --------------------------------------------------
 # Celery Task Wrapper
@@ -216,3 +421,8 @@ def ingest_document(self, *args, **kwargs):
             prompt=kwargs.get("prompt"),
         )
     return _ingest_logic(*args)
+
+
+@celery.task(name="precompute_suggested_answers", ignore_result=True)
+def precompute_suggested_answers(userId: str, convId: str, jobId: str):
+    _precompute_suggested_answers(userId, convId, jobId)
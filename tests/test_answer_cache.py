@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.services import answer_cache
+
+
+@pytest.fixture(autouse=True)
+def local_only(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLE", True)
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SEMANTIC", False)
+    monkeypatch.setattr(answer_cache, "_USE_REDIS", False)
+    answer_cache._local.clear()
+    answer_cache._semantic.clear()
+    answer_cache._inflight.clear()
+
+
+def _counting_compute(answer=("42", "rag", [])):
+    calls = []
+
+    async def compute(q_vec):
+        calls.append(q_vec)
+        await asyncio.sleep(0.05)
+        return answer
+
+    return compute, calls
+
+
+def test_concurrent_identical_questions_compute_once():
+    compute, calls = _counting_compute()
+
+    async def ask_many():
+        return await asyncio.gather(*[
+            answer_cache.get_or_compute("c", "v1", question, compute)
+            for question in ("What is it?", "what is it", "  WHAT IS IT?! ")
+        ])
+
+    results = asyncio.run(ask_many())
+
+    assert len(calls) == 1
+    assert [answer for answer, _ in results] == [("42", "rag", [])] * 3
+    assert sorted(cached for _, cached in results) == [False, True, True]
+
+
+def test_repeated_question_is_served_from_cache():
+    compute, calls = _counting_compute()
+
+    async def ask_twice():
+        first = await answer_cache.get_or_compute("c", "v1", "Q?", compute)
+        second = await answer_cache.get_or_compute("c", "v1", "q", compute)
+        return first, second
+
+    first, second = asyncio.run(ask_twice())
+
+    assert len(calls) == 1
+    assert (first[1], second[1]) == (False, True)
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def broken(q_vec):
+        await asyncio.sleep(0.05)
+        raise ValueError("llm down")
+
+    async def ask_many():
+        return await asyncio.gather(
+            answer_cache.get_or_compute("c", "v1", "Q", broken),
+            answer_cache.get_or_compute("c", "v1", "Q", broken),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(ask_many())
+
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert answer_cache._inflight == {}
+    assert asyncio.run(answer_cache.lookup("c", "v1", "Q")) == (None, None)
+
+
+def test_new_version_and_invalidate_drop_answers():
+    compute, calls = _counting_compute()
+
+    async def scenario():
+        await answer_cache.get_or_compute("c", "v1", "Q", compute)
+        await answer_cache.get_or_compute("c", "v2", "Q", compute)
+        answer_cache.invalidate("c")
+        await answer_cache.get_or_compute("c", "v2", "Q", compute)
+        return await answer_cache.get_or_compute("other", "v1", "Q", compute)
+
+    asyncio.run(scenario())
+
+    assert len(calls) == 4
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from app.repos.chunk_store import ChunkStore, ChunkWriter, chunk_record
+
+
+class _Store(ChunkStore):
+    name = "fake"
+
+    def __init__(self, gate: threading.Event = None, fail: bool = False):
+        self.batches = []
+        self.active = set()
+        self.overlaps = []
+        self._lock = threading.Lock()
+        self._gate = gate
+        self._fail = fail
+
+    def write_key(self, chunk_id):
+        # Two "documents": even and odd chunks
+        return str(int(chunk_id) % 2)
+
+    def put_many(self, conv_id, records):
+        keys = {self.write_key(r["chunkId"]) for r in records}
+        with self._lock:
+            self.overlaps += list(keys & self.active)
+            self.active |= keys
+
+        if self._gate is not None:
+            self._gate.wait(5)
+        time.sleep(0.01)
+
+        with self._lock:
+            self.active -= keys
+            self.batches.append([r["chunkId"] for r in records])
+
+        if self._fail:
+            raise RuntimeError("commit failed")
+
+    def get_many(self, conv_id, chunk_ids):
+        return [None] * len(chunk_ids)
+
+    def iter_chunks(self, conv_id):
+        return iter(())
+
+    def delete(self, conv_id):
+        pass
+
+
+def _records(ids):
+    return [chunk_record(str(i), f"text {i}") for i in ids]
+
+
+def test_every_record_is_committed_in_batches():
+    store = _Store()
+
+    with ChunkWriter(store, "c", batch_size=3, concurrency=2) as writer:
+        writer.add(_records(range(10)))
+
+    committed = sorted(int(cid) for batch in store.batches for cid in batch)
+    assert committed == list(range(10))
+    assert all(len(batch) <= 3 for batch in store.batches)
+
+
+def test_a_write_key_is_never_committed_concurrently():
+    store = _Store()
+
+    with ChunkWriter(store, "c", batch_size=1, concurrency=4) as writer:
+        writer.add(_records(range(40)))
+
+    assert store.overlaps == []
+    # Records of one write key stay in one lane, in order
+    evens = [int(b[0]) for b in store.batches if int(b[0]) % 2 == 0]
+    assert evens == sorted(evens)
+
+
+def test_add_blocks_once_the_queue_is_full():
+    gate = threading.Event()
+    store = _Store(gate=gate)
+    writer = ChunkWriter(store, "c", batch_size=1, concurrency=2)
+
+    # lanes * (1 + CHUNK_WRITE_QUEUE_PER_LANE) commits may be pending
+    writer.add(_records(range(4)))
+
+    blocked = threading.Thread(target=writer.add, args=(_records([4]),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    gate.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+
+    writer.close()
+    assert len(store.batches) == 5
+
+
+def test_flush_reraises_commit_errors():
+    writer = ChunkWriter(_Store(fail=True), "c", batch_size=10, concurrency=1)
+    writer.add(_records(range(3)))
+
+    with pytest.raises(RuntimeError, match="commit failed"):
+        writer.close()
@@ -0,0 +1,57 @@
+import threading
+
+from app.services import embed_batcher
+from app.services.embed_batcher import EmbeddingBatcher
+
+
+class _Embeddings:
+    def __init__(self):
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.requests.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+
+def _batcher(monkeypatch, **kwargs):
+    # One token per character keeps the arithmetic readable
+    monkeypatch.setattr(embed_batcher, "count_tokens", lambda texts, model: [len(t) for t in texts])
+
+    emb, delivered = _Embeddings(), []
+    batcher = EmbeddingBatcher(emb, lambda items, vectors: delivered.append((items, vectors)), **kwargs)
+    return batcher, emb, delivered
+
+
+def test_packs_chunks_across_pages_by_token_budget(monkeypatch):
+    batcher, emb, delivered = _batcher(monkeypatch, max_inputs=100, max_tokens=10)
+
+    with batcher:
+        batcher.add(["aaaa", "bbbb"], ["a", "b"])
+        batcher.add(["cc", "dddd"], ["c", "d"])
+        batcher.add(["eeeeeeeeeeee"], ["e"])
+
+    assert sorted(emb.requests) == [["aaaa", "bbbb", "cc"], ["dddd"], ["eeeeeeeeeeee"]]
+    assert batcher.requests == 3
+
+
+def test_packs_by_input_count(monkeypatch):
+    batcher, emb, _ = _batcher(monkeypatch, max_inputs=2, max_tokens=1_000)
+
+    with batcher:
+        batcher.add(["a", "b", "c", "d", "e"], list("abcde"))
+
+    assert sorted(emb.requests) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_vectors_come_back_with_their_items(monkeypatch):
+    batcher, _, delivered = _batcher(monkeypatch, max_inputs=2, max_tokens=1_000, concurrency=2)
+
+    with batcher:
+        batcher.add(["x", "yy", "zzz"], [1, 2, 3])
+
+    pairs = sorted(
+        (item, vector) for items, vectors in delivered for item, vector in zip(items, vectors)
+    )
+    assert pairs == [(1, [1.0]), (2, [2.0]), (3, [3.0])]
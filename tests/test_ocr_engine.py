@@ -0,0 +1,44 @@
+import pytest
+
+from app.services import ocr_engine
+from app.services.ocr_engine import adaptive_dpi, contiguous_ranges
+
+
+def test_consecutive_pages_with_one_dpi_share_a_range():
+    pages = [(5, 200), (1, 200), (2, 200), (3, 300), (4, 300), (7, 200)]
+
+    assert contiguous_ranges(pages, max_len=16) == [
+        (1, 2, 200),
+        (3, 4, 300),
+        (5, 5, 200),
+        (7, 7, 200),
+    ]
+
+
+def test_ranges_are_capped_at_max_len():
+    pages = [(p, 220) for p in range(1, 8)]
+
+    assert contiguous_ranges(pages, max_len=3) == [(1, 3, 220), (4, 6, 220), (7, 7, 220)]
+
+
+@pytest.fixture
+def dpi_bounds(monkeypatch):
+    monkeypatch.setattr(ocr_engine, "OCR_DPI", 220)
+    monkeypatch.setattr(ocr_engine, "OCR_MIN_DPI", 150)
+    monkeypatch.setattr(ocr_engine, "OCR_MAX_DPI", 400)
+
+
+def test_letter_page_gets_the_base_dpi(dpi_bounds):
+    assert adaptive_dpi(612, 792) == 220
+
+
+def test_dpi_scales_with_page_size_within_bounds(dpi_bounds):
+    assert adaptive_dpi(306, 396) == 400      # half-size page → capped
+    assert adaptive_dpi(1224, 1584) == 150    # double-size page → floor
+    assert adaptive_dpi(612, 1008) == 172     # US Legal (14 in)
+
+
+def test_dpi_never_exceeds_the_scan_resolution(dpi_bounds):
+    assert adaptive_dpi(612, 792, native_dpi=180) == 180
+    assert adaptive_dpi(612, 792, native_dpi=100) == 150
+    assert adaptive_dpi(612, 792, native_dpi=600) == 220
@@ -0,0 +1,131 @@
+import signal
+import time
+
+import pytest
+from pypdf import PageObject, PdfWriter
+
+from app.services import pdf_extractor
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(signal, "SIGALRM"), reason="page timeouts need SIGALRM"
+)
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    path = tmp_path / "blank.pdf"
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+    previous = signal.getsignal(signal.SIGALRM)
+    monkeypatch.setattr(pdf_extractor, "_worker_reader", None)
+    pdf_extractor._init_worker(str(path))
+
+    probes = []
+    monkeypatch.setattr(pdf_extractor, "OCR_ENABLE", True)
+    monkeypatch.setattr(pdf_extractor, "PDF_EXTRACT_PAGE_TIMEOUT", 0.05)
+    monkeypatch.setattr(pdf_extractor, "probe_page", lambda page: probes.append(page) or {})
+
+    yield probes
+
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous)
+
+
+def test_slow_page_times_out_without_probe(worker, monkeypatch):
+    def stuck(self, *args, **kwargs):
+        time.sleep(5)
+        return "too late"
+
+    monkeypatch.setattr(PageObject, "extract_text", stuck)
+
+    [(text, seconds, timed_out, probe)] = pdf_extractor._extract_range(0, 1)
+
+    assert (text, timed_out, probe) == ("", True, None)
+    assert seconds < 1
+    assert worker == []
+
+
+def test_extraction_error_still_probes(worker, monkeypatch):
+    def broken(self, *args, **kwargs):
+        raise ValueError("bad content stream")
+
+    monkeypatch.setattr(PageObject, "extract_text", broken)
+
+    [(text, _, timed_out, probe)] = pdf_extractor._extract_range(0, 1)
+
+    assert (text, timed_out, probe) == ("", False, {})
+    assert len(worker) == 1
+
+
+@pytest.fixture
+def pdf(tmp_path, monkeypatch):
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=612, height=792)
+    path = tmp_path / "four.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+
+    monkeypatch.setattr(pdf_extractor, "OCR_ENABLE", False)
+    monkeypatch.setattr(pdf_extractor, "PDF_EXTRACT_PAGE_TIMEOUT", 0.05)
+
+    with pdf_extractor.PdfPages(path.read_bytes()) as pages:
+        yield pages
+
+
+def test_serial_extraction_times_out_on_main_thread(pdf, monkeypatch):
+    previous = signal.getsignal(signal.SIGALRM)
+
+    def stuck(self, *args, **kwargs):
+        time.sleep(5)
+
+    monkeypatch.setattr(PageObject, "extract_text", stuck)
+
+    [(text, seconds, timed_out, _)] = list(pdf._serial_texts(3))
+
+    assert (text, timed_out) == ("", True)
+    assert seconds < 1
+    assert signal.getsignal(signal.SIGALRM) is previous
+
+
+class _Future:
+    def __init__(self, fn, args):
+        self._fn, self._args = fn, args
+
+    def result(self):
+        if self._args[0] == 2:
+            raise RuntimeError("worker died")
+        return self._fn(*self._args)
+
+    def cancel(self):
+        pass
+
+
+class _Pool:
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        return _Future(fn, args)
+
+
+def test_broken_pool_marks_failed_range_timed_out(pdf, monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "PDF_EXTRACT_RANGE_PAGES", 2)
+    monkeypatch.setattr(pdf_extractor, "ProcessPoolExecutor", _Pool)
+    monkeypatch.setattr(pdf_extractor, "_worker_reader", pdf._reader)
+    reread = []
+    monkeypatch.setattr(pdf, "_serial_texts", lambda first: reread.append(first) or iter(()))
+
+    results = list(pdf._parallel_texts(2))
+
+    assert [timed_out for _, _, timed_out, _ in results] == [False, False, True, True]
+    assert reread == [4]
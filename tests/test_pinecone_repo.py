@@ -0,0 +1,31 @@
+from app.repos.pinecone_repo import upsert_batches, _vector_bytes
+
+
+def _vector(i: int, dim: int = 8):
+    return {"id": f"v{i}", "values": [0.5] * dim, "metadata": {"page": i}}
+
+
+def test_batches_are_bounded_by_count():
+    batches = list(upsert_batches((_vector(i) for i in range(25)), max_vectors=10, max_bytes=10**9))
+
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert [v["id"] for b in batches for v in b] == [f"v{i}" for i in range(25)]
+
+
+def test_batches_are_bounded_by_request_size():
+    size = _vector_bytes(_vector(0))
+    batches = list(upsert_batches([_vector(i) for i in range(7)], max_vectors=100, max_bytes=3 * size))
+
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert all(sum(_vector_bytes(v) for v in b) <= 3 * size for b in batches)
+
+
+def test_oversized_vector_still_goes_alone():
+    big = {"id": "big", "values": [0.5] * 1_000, "metadata": {}}
+    batches = list(upsert_batches([_vector(0), big, _vector(1)], max_vectors=100, max_bytes=200))
+
+    assert [[v["id"] for v in b] for b in batches] == [["v0"], ["big"], ["v1"]]
+
+
+def test_no_vectors_no_batches():
+    assert list(upsert_batches([])) == []
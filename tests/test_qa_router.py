@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.services import qa_router
+
+
+def _index(*rows):
+    vectors = np.asarray(rows, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return {
+        "model": "m",
+        "dim": vectors.shape[1],
+        "count": vectors.shape[0],
+        "vectors": vectors.astype(np.float16).tobytes(),
+    }
+
+
+def _question(cosine: float):
+    # Unit vector at the given cosine to [1, 0]
+    return [cosine, float(np.sqrt(1 - cosine ** 2))]
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(qa_router, "QA_ROUTER_SUMMARY_THRESHOLD", 0.55)
+    monkeypatch.setattr(qa_router, "QA_ROUTER_RAG_THRESHOLD", 0.40)
+
+
+@pytest.mark.parametrize("cosine, route", [
+    (0.90, "summary"),
+    (0.56, "summary"),
+    (0.50, "ambiguous"),
+    (0.41, "ambiguous"),
+    (0.39, "rag"),
+    (0.0, "rag"),
+])
+def test_route_by_best_match(cosine, route):
+    index = _index([1.0, 0.0], [-1.0, 0.0])
+
+    assert qa_router.route_question(_question(cosine), index) == route
+
+
+def test_best_row_decides():
+    index = _index([0.0, -1.0], [1.0, 0.0])
+
+    assert qa_router.route_question(_question(0.9), index) == "summary"
+
+
+def test_tiebreak_setting_decides_ambiguous(monkeypatch):
+    monkeypatch.setattr(qa_router, "QA_ROUTER_TIEBREAK", True)
+    assert not qa_router.skips_summary("ambiguous")
+    assert qa_router.skips_summary("rag")
+
+    monkeypatch.setattr(qa_router, "QA_ROUTER_TIEBREAK", False)
+    assert qa_router.skips_summary("ambiguous")
+    assert not qa_router.skips_summary("summary")
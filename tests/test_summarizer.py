@@ -0,0 +1,77 @@
+import pytest
+
+from app.services import summarizer
+
+
+def _page(n: int) -> str:
+    return " ".join(f"p{n}w{i}" for i in range(120))
+
+
+@pytest.fixture
+def mapped_chunks(monkeypatch):
+    calls = []
+
+    def fake_map(chunks, prompt):
+        calls.append(list(chunks))
+        return [f"bullets of {len(c)} chars" for c in chunks]
+
+    monkeypatch.setattr(summarizer, "_tokens", lambda text: len(text) // 4)
+    monkeypatch.setattr(summarizer, "_map_chunks", fake_map)
+    monkeypatch.setattr(summarizer, "SUMMARY_STUFF_MAX_TOKENS", 1_000)
+    monkeypatch.setattr(summarizer, "SUMMARY_MAP_CHUNK_TOKENS", 300)
+    monkeypatch.setattr(summarizer, "SUMMARY_MAP_CONCURRENCY", 4)
+    return calls
+
+
+def test_short_text_has_not_enough_content(mapped_chunks):
+    mapped = summarizer.map_stream(["tiny page"])
+
+    assert summarizer.finish_summary(mapped) == summarizer.NOT_ENOUGH_CONTENT
+    assert mapped_chunks == []
+
+
+def test_text_within_stuff_budget_is_summarized_whole(mapped_chunks, monkeypatch):
+    stuffed = []
+    monkeypatch.setattr(
+        summarizer, "stuff_summary",
+        lambda text, words, prompt=None: stuffed.append((text, words)) or "summary"
+    )
+
+    mapped = summarizer.map_stream([_page(1), _page(2)])
+
+    assert mapped["stuff"] == f"{_page(1)}\n\n{_page(2)}"
+    assert summarizer.finish_summary(mapped) == "summary"
+    assert stuffed == [(mapped["stuff"], 240)]
+    assert mapped_chunks == []
+
+
+def test_long_text_is_mapped_in_bounded_chunks_with_page_refs(mapped_chunks, monkeypatch):
+    reduced = []
+    monkeypatch.setattr(
+        summarizer, "reduce_summary",
+        lambda bullets, words: reduced.append(bullets) or "summary"
+    )
+
+    mapped = summarizer.map_stream((_page(n), n) for n in range(1, 21))
+
+    chunks = [c for call in mapped_chunks for c in call]
+    assert len(mapped_chunks) > 1  # mapped while pages were still arriving
+    assert max(len(c) for c in chunks) <= 300 * 4 + 50
+    assert "p1w0" in chunks[0] and "p20w119" in chunks[-1]
+
+    sections = mapped["sections"]
+    assert len(sections) == len(chunks)
+    assert sections[0]["refs"][0] == 1
+    assert {ref for s in sections for ref in s["refs"]} == set(range(1, 21))
+
+    assert summarizer.finish_summary(mapped) == "summary"
+    assert reduced == [[s["text"] for s in sections]]
+
+
+def test_deferred_map_only_measures(mapped_chunks):
+    mapped = summarizer.map_stream((_page(n) for n in range(1, 21)), map_enabled=False)
+
+    assert mapped["deferred"] is True
+    assert mapped["sections"] == []
+    assert mapped["totalWords"] == 20 * 120
+    assert mapped_chunks == []
@@ -0,0 +1,32 @@
+import numpy as np
+
+from app.services.summary_preselect import map_groups
+
+
+def test_document_within_budget_is_grouped_in_order():
+    tokens = [400, 400, 400, 900, 100]
+
+    groups = map_groups(np.zeros((5, 2)), tokens, chunk_tokens=1_000, budget=10)
+
+    assert groups == [[0, 1], [2], [3, 4]]
+
+
+def test_over_budget_picks_chunks_nearest_each_cluster():
+    rng = np.random.default_rng(0)
+    centers = np.array([[10.0, 0.0], [0.0, 10.0], [-10.0, 0.0]])
+    # 30 chunks in three topics, interleaved through the document
+    vectors = np.vstack([centers[i % 3] + rng.normal(0, 0.1, 2) for i in range(30)])
+    tokens = [300] * 30
+
+    groups = map_groups(vectors, tokens, chunk_tokens=600, budget=3)
+
+    assert len(groups) == 3
+    assert all(len(g) <= 2 for g in groups)
+    # One group per topic, chunks in document order, groups ordered by first chunk
+    assert sorted({i % 3 for i in g}.pop() for g in groups) == [0, 1, 2]
+    assert all(len({i % 3 for i in g}) == 1 and g == sorted(g) for g in groups)
+    assert [g[0] for g in groups] == sorted(g[0] for g in groups)
+
+
+def test_no_chunks_no_groups():
+    assert map_groups(np.empty((0, 0)), [], chunk_tokens=1_000) == []